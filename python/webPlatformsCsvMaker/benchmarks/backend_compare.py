@@ -0,0 +1,250 @@
+# benchmarks/backend_compare.py
+#
+# Parity test and stage benchmark of the dataframe backends, see
+# twin_data_processing.backend_stages. On each generated dataset the workbooks
+# are loaded once (by pandas, for every backend), then each backend runs the
+# merge, the OEM lookup and the Tulero and Tyre24 processing on the same
+# frames. Every stage is timed and its result compared with the one of
+# pandas, the reference (values, dtypes and index), and the CSVs are compared
+# with those of pandas byte by byte, then cell by cell when they differ (see
+# golden_compare). Exits with 1 when a backend gives other results. The times
+# are appended to benchmarks/results/backends.csv.
+#
+# Usage (from the application folder):
+#   python -m benchmarks.backend_compare --sizes 10000 100000
+#   python -m benchmarks.backend_compare --cross-modes exact canonical components
+
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.common import (
+    DEFAULT_INPUTS,
+    RESULTS_FOLDER,
+    Timer,
+    ensure_dataset,
+    git_revision,
+)
+from benchmarks.golden_compare import OUTPUT_FILES, compare_folders
+from data_processing.csv_writer import write_csv
+from data_processing.data_cleaning import load_and_clean_excel_file
+from data_processing.ignored_brands import IGNORED_BRANDS
+from data_processing.pricing import cost_base
+from data_processing.twin_data_processing import backend_stages
+from utility.config import (
+    DATAFRAME_BACKENDS,
+    DEFAULT_MAX_COMPONENT_SIZE,
+    dataframe_backend_errors,
+)
+
+REFERENCE = "pandas"
+DEFAULT_SIZES = [10000, 100000]
+# process_company1 arguments of each way of building the cross codes
+CROSS_MODES = {
+    "exact": {},
+    "canonical": {"canonical_oe": True},
+    "components": {"max_component_size": DEFAULT_MAX_COMPONENT_SIZE},
+}
+STAGES = ["merge", "oem_lookup", "company1", "company2"]
+RESULT_FIELDS = [
+    "timestamp",
+    "revision",
+    "rows",
+    "backend",
+    "cross_mode",
+    "stage",
+    "seconds",
+    "output_rows",
+]
+
+
+def run_stages(stages, paths, articles_df, warehouse_df, cross_mode):
+    """Returns {stage: (seconds, result)} of the stages of a backend."""
+    merge_frames, load_lookup, company1_rows, company2_rows = stages
+    results = {}
+
+    with Timer() as timer:
+        merged_df = merge_frames(articles_df.copy(), warehouse_df.copy())
+    results["merge"] = (timer.seconds, merged_df)
+    base = cost_base(merged_df)
+
+    with Timer() as timer:
+        oem_lookup = load_lookup(paths["oem_folder"])
+    results["oem_lookup"] = (timer.seconds, oem_lookup)
+
+    with Timer() as timer:
+        company1_df = company1_rows(
+            merged_df.copy(),
+            paths["brands_file"],
+            paths["oem_folder"],
+            IGNORED_BRANDS,
+            DEFAULT_INPUTS["company1_markup"],
+            DEFAULT_INPUTS["company1_shipping"],
+            oem_lookup=oem_lookup,
+            base=base,
+            **CROSS_MODES[cross_mode],
+        )
+    results["company1"] = (timer.seconds, company1_df)
+
+    with Timer() as timer:
+        company2_df = company2_rows(
+            merged_df,
+            paths["tecdoc_file"],
+            DEFAULT_INPUTS["company2_markets"],
+            base=base,
+        )
+    results["company2"] = (timer.seconds, company2_df)
+    return results
+
+
+def result_difference(expected, actual):
+    """Returns how a stage result differs from the reference, None if equal."""
+    if isinstance(expected, dict):
+        if expected == actual:
+            return None
+        return f"{len(expected)} keys expected, {len(actual)} keys differ or miss"
+    try:
+        pd.testing.assert_frame_equal(expected, actual)
+    except AssertionError as error:
+        return " ".join(str(error).split())
+    return None
+
+
+def write_outputs(results, output_folder):
+    os.makedirs(output_folder)
+    for file_name, stage in zip(OUTPUT_FILES, ["company1", "company2"]):
+        write_csv(results[stage][1], os.path.join(output_folder, file_name))
+
+
+def compare_backends(paths, backends, cross_mode, work_folder):
+    """
+    Runs the stages of every backend, prints their times and returns
+    ([(backend, stage, seconds, output rows)], whether all match pandas).
+    """
+    with Timer() as timer:
+        articles_df = load_and_clean_excel_file(paths["articles_file"], "articles")
+        warehouse_df = load_and_clean_excel_file(
+            paths["warehouse_file"], "warehouse"
+        )
+    print(f"  workbooks loaded by pandas in {timer.seconds:.2f} s")
+
+    timings = []
+    identical = True
+    reference = None
+    for backend in backends:
+        results = run_stages(
+            backend_stages(backend), paths, articles_df, warehouse_df, cross_mode
+        )
+        timings += [
+            (backend, stage, seconds, len(result))
+            for stage, (seconds, result) in results.items()
+        ]
+        output_folder = os.path.join(work_folder, backend)
+        write_outputs(results, output_folder)
+        if reference is None:
+            reference = results
+            continue
+
+        print(f"    {'stage':<12}{REFERENCE:>11}{backend:>11}")
+        for stage in STAGES:
+            seconds, result = results[stage]
+            reference_seconds = reference[stage][0]
+            difference = result_difference(reference[stage][1], result)
+            identical &= difference is None
+            parity = "same" if difference is None else f"DIFFERENT: {difference[:300]}"
+            print(
+                f"    {stage:<12}{reference_seconds:9.3f} s{seconds:9.3f} s "
+                f"({reference_seconds / max(seconds, 1e-9):6.2f}x)  {parity}"
+            )
+        identical &= compare_folders(
+            os.path.join(work_folder, REFERENCE), output_folder
+        )
+    return timings, identical
+
+
+def append_results(path, rows, cross_mode, timings, revision):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_header = not os.path.exists(path)
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(path, "a", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        if write_header:
+            writer.writerow(RESULT_FIELDS)
+        for backend, stage, seconds, output_rows in timings:
+            writer.writerow(
+                [
+                    timestamp,
+                    revision,
+                    rows,
+                    backend,
+                    cross_mode,
+                    stage,
+                    f"{seconds:.4f}",
+                    output_rows,
+                ]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parity and stage times of the dataframe backends."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=[backend for backend in DATAFRAME_BACKENDS if backend != REFERENCE],
+        default=[backend for backend in DATAFRAME_BACKENDS if backend != REFERENCE],
+        help="backends compared with pandas",
+    )
+    parser.add_argument(
+        "--cross-modes",
+        nargs="+",
+        choices=list(CROSS_MODES),
+        default=["exact"],
+        help="cross codes of the Tulero rows: exact OE groups, canonical OE "
+        "numbers or OE components",
+    )
+    parser.add_argument(
+        "--results", default=os.path.join(RESULTS_FOLDER, "backends.csv")
+    )
+    args = parser.parse_args()
+
+    errors = [
+        error
+        for backend in args.backends
+        for error in dataframe_backend_errors(backend)
+    ]
+    if errors:
+        for error in errors:
+            print(f"error: {error}", file=sys.stderr)
+        return 2
+
+    revision = git_revision()
+    identical = True
+    for rows in args.sizes:
+        paths = ensure_dataset(rows, seed=args.seed)
+        for cross_mode in args.cross_modes:
+            print(f"\n{rows} rows, {cross_mode} cross codes ({revision})")
+            with tempfile.TemporaryDirectory() as work_folder:
+                timings, same = compare_backends(
+                    paths, [REFERENCE, *args.backends], cross_mode, work_folder
+                )
+            identical &= same
+            append_results(args.results, rows, cross_mode, timings, revision)
+
+    print(f"\nResults appended to {args.results}")
+    if not identical:
+        print("FAILED: a backend gives other results than pandas")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# benchmarks/common.py
+
+import os
+import subprocess
+import time
+
+from benchmarks.generate_dataset import generate_dataset
+from utility.config import company2_markets_from_config
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DATA_FOLDER = os.path.join(BENCHMARKS_FOLDER, "data")
+RESULTS_FOLDER = os.path.join(BENCHMARKS_FOLDER, "results")
+
+# Same pricing as the shipped config.json. The company2 keys by market are those
+# of the revisions before company2_markets, which golden_compare can run
+LEGACY_INPUTS = {
+    "company1_markup": 1.19,
+    "company1_shipping": 5.5,
+    "company2_markup_it": 1.19,
+    "company2_shipping_it": 5.5,
+    "company2_markup_de": 1.19,
+    "company2_shipping_de": 8.5,
+}
+
+
+def pricing_inputs(overrides=None):
+    """LEGACY_INPUTS with overrides, and the market table of their values."""
+    inputs = dict(LEGACY_INPUTS, **(overrides or {}))
+    inputs.setdefault("company2_markets", company2_markets_from_config(inputs))
+    return inputs
+
+
+DEFAULT_INPUTS = pricing_inputs()
+
+
+def ensure_dataset(rows, seed=42, regenerate=False, **options):
+    """Returns the paths of the dataset for `rows`, generating it only once."""
+    suffix = "".join(f"_{key}-{value}" for key, value in sorted(options.items()))
+    output_dir = os.path.join(DATA_FOLDER, f"{rows}_{seed}{suffix}")
+    paths = {
+        "articles_file": os.path.join(output_dir, "articles.xlsx"),
+        "warehouse_file": os.path.join(output_dir, "warehouse.xlsx"),
+        "oem_folder": os.path.join(output_dir, "oems"),
+        "brands_file": os.path.join(output_dir, "brands.csv"),
+        "tecdoc_file": os.path.join(output_dir, "tecdoc_brand_id.csv"),
+    }
+    if regenerate or not all(os.path.exists(path) for path in paths.values()):
+        paths = generate_dataset(output_dir, rows=rows, seed=seed, **options)
+    return paths
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARKS_FOLDER,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Timer:
+    """Context manager measuring the wall time of a block in seconds."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.seconds = None
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        return False
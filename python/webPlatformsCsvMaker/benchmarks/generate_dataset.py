@@ -0,0 +1,350 @@
+# benchmarks/generate_dataset.py
+#
+# Generates synthetic input files in the layout the pipeline expects:
+# the articles and warehouse workbooks (split over several sheets like the
+# exported reports), the oemsDC*.csv files, brands.csv and tecdoc_brand_id.csv.
+#
+# Usage (from the application folder):
+#   python -m benchmarks.generate_dataset --rows 100000 --output benchmarks/data/100k
+
+import argparse
+import csv
+import os
+
+import numpy as np
+from openpyxl import Workbook
+
+from data_processing.ignored_brands import IGNORED_BRANDS
+
+# Brands that get OE numbers and cross codes (none of them is ignored)
+AFTERMARKET_BRANDS = [
+    "MANN-FILTER",
+    "FILTRON",
+    "HENGST",
+    "PURFLUX",
+    "CLEAN FILTERS",
+    "BLUE PRINT",
+    "SWAG",
+    "METALCAUCHO",
+    "MOTORCRAFT",
+    "VICTOR REINZ",
+    "NGK",
+    "KYB",
+    "BERU",
+    "LEMFOERDER",
+    "MAPCO",
+    "TOPRAN",
+]
+# Truncated original-equipment brands, renamed by the Tyre24 processing
+ORIGINAL_BRANDS = ["MERC", "NISSA", "TOYOT", "SCANI", "VW", "MITSUBOSHI"]
+SPECIAL_BRANDS = ["RCS", "CC", "BEX", "RESO", "CONTI", "STAR"]
+
+# Brand renames applied through brands.csv (Tulero)
+BRAND_MATCHES = {
+    "MANN-FILTER": "MANN",
+    "CLEAN FILTERS": "CLEAN",
+    "LEMFOERDER": "LEMFORDER",
+    "MERC": "MERCEDES",
+    "VW": "VOLKSWAGEN",
+}
+
+# Names in the TecDoc brand list; matched by the first five letters
+TECDOC_BRANDS = [
+    "MANN-FILTER",
+    "FILTRON",
+    "HENGST FILTER",
+    "PURFLUX",
+    "CLEAN FILTERS",
+    "BLUE PRINT",
+    "SWAG",
+    "METALCAUCHO",
+    "MOTORCRAFT",
+    "VICTOR REINZ",
+    "NGK",
+    "KYB",
+    "BERU",
+    "LEMFÖRDER",
+    "MAPCO",
+    "TOPRAN",
+    "MERCEDES-BENZ",
+    "NISSAN",
+    "TOYOTA",
+    "SCANIA",
+    "VW",
+    "MITSUBISHI",
+    "BOSCH",
+    "UFI",
+]
+
+DESCRIPTIONS = [
+    "FILTRO OLIO",
+    "FILTRO ARIA",
+    "FILTRO GASOLIO",
+    "FILTRI ABITACOLO",
+    "PASTIGLIE FRENO",
+    "DISCO FRENO",
+    "CINGHIA DENTATA",
+    "POMPA ACQUA",
+    "CANDELA",
+    "AMMORTIZZATORE",
+    "TERMOSTATO",
+    "GUARNIZIONE, TESTATA",
+    'SUPPORTO MOTORE 1/2"',
+]
+
+DEFAULT_SHEET_ROWS = 50000
+
+
+def _format_decimal(values):
+    return [f"{value:.2f}".replace(".", ",") for value in values]
+
+
+def _format_thousands(values):
+    # Articles report: "." as thousands separator and "," as decimal mark
+    return [
+        f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        for value in values
+    ]
+
+
+def _product_codes(rng, rows):
+    numbers = rng.permutation(rows * 10)[:rows] + 100000
+    styles = rng.integers(0, 4, size=rows)
+    codes = []
+    for number, style in zip(numbers.tolist(), styles.tolist()):
+        if style == 0:
+            codes.append(str(number))
+        elif style == 1:
+            text = f"{number:08d}"
+            codes.append(f"{text[:2]}.{text[2:5]}.{text[5:]}")
+        elif style == 2:
+            codes.append(f"W{number}")
+        else:
+            codes.append(f"HU{number}X")
+    return codes
+
+
+def _oe_group_sizes(rng, known_rows, group_mean, group_max):
+    # Geometric distribution: most OE numbers are shared by a few products,
+    # a long tail is shared by many
+    sizes = []
+    total = 0
+    p = 1.0 / max(group_mean, 1.0)
+    while total < known_rows:
+        size = int(min(rng.geometric(p), group_max, known_rows - total))
+        sizes.append(size)
+        total += size
+    return sizes
+
+
+def _write_workbook(path, title, report_name, page_header, rows, sheet_rows):
+    workbook = Workbook(write_only=True)
+    for page_start in range(0, max(len(rows), 1), sheet_rows):
+        page = rows[page_start : page_start + sheet_rows]
+        sheet = workbook.create_sheet(f"Pagina {page_start // sheet_rows + 1}")
+        if page_start == 0:
+            # First sheet: title, five empty header cells and the report name
+            sheet.append([title, None, None, None, None, None, report_name])
+            for row in page:
+                sheet.append([None, *row, None])
+        else:
+            sheet.append(page_header)
+            for row in page:
+                sheet.append([None, *row])
+    workbook.save(path)
+
+
+def generate_dataset(
+    output_dir,
+    rows=10000,
+    seed=42,
+    oe_group_mean=3.0,
+    oe_group_max=50,
+    oes_per_product=3,
+    unknown_oe_ratio=0.3,
+    cross_reference_ratio=0.2,
+    oem_files=3,
+    sheet_rows=DEFAULT_SHEET_ROWS,
+):
+    """
+    Writes a synthetic dataset with `rows` catalog entries to output_dir.
+
+    - oe_group_mean / oe_group_max: size distribution of the groups of
+      products sharing the same OE numbers (geometric)
+    - unknown_oe_ratio: share of products without any row in the OEM files
+    - cross_reference_ratio: share of unknown-OE products whose code shows up
+      as an OE number of another product (found by the additional cross codes)
+
+    Returns a dict with the paths of the generated files.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    oem_folder = os.path.join(output_dir, "oems")
+    os.makedirs(oem_folder, exist_ok=True)
+
+    codes = _product_codes(rng, rows)
+    brand_pool = AFTERMARKET_BRANDS + ORIGINAL_BRANDS + SPECIAL_BRANDS + IGNORED_BRANDS
+    brand_weights = np.concatenate(
+        [
+            np.full(len(AFTERMARKET_BRANDS), 10.0),
+            np.full(len(ORIGINAL_BRANDS), 4.0),
+            np.full(len(SPECIAL_BRANDS), 1.0),
+            np.full(len(IGNORED_BRANDS), 0.5),
+        ]
+    )
+    brand_weights /= brand_weights.sum()
+    brands = rng.choice(brand_pool, size=rows, p=brand_weights).tolist()
+    descriptions = rng.choice(DESCRIPTIONS, size=rows).tolist()
+
+    # Articles: stock and last purchase price, some out of stock or unpriced
+    stock = rng.integers(0, 40, size=rows).astype(float)
+    stock[rng.random(rows) < 0.01] = 1500.0
+    prices = np.round(rng.lognormal(mean=2.5, sigma=1.0, size=rows), 2)
+    price_text = _format_decimal(prices)
+    for index in np.flatnonzero(rng.random(rows) < 0.02).tolist():
+        price_text[index] = ""
+    articles_rows = list(
+        zip(codes, brands, descriptions, _format_thousands(stock), price_text)
+    )
+
+    # Separator rows, dropped by the loader
+    separators = rng.choice(rows, size=max(rows // 500, 1), replace=False)
+    for index in sorted(separators.tolist(), reverse=True):
+        articles_rows.insert(index, ("", ".", "", "", ""))
+
+    # Warehouse: locations, most are small items (A, B, C)
+    location_kind = rng.random(rows)
+    location_number = rng.integers(0, 100, size=rows)
+    locations = []
+    for kind, number in zip(location_kind.tolist(), location_number.tolist()):
+        if kind < 0.05:
+            locations.append(f"C.00.{number:02d}")
+        elif kind < 0.10:
+            locations.append(f"D.{number:02d}")
+        elif kind < 0.12:
+            locations.append("")
+        else:
+            locations.append(f"{'ABC'[number % 3]}.{number:02d}.{number % 7}")
+    warehouse_stock = _format_decimal(stock)
+    warehouse_rows = list(zip(codes, brands, descriptions, locations, warehouse_stock))
+    # Products missing from the articles report and vice versa
+    warehouse_rows = [
+        row for row, keep in zip(warehouse_rows, rng.random(rows) >= 0.02) if keep
+    ]
+
+    articles_file = os.path.join(output_dir, "articles.xlsx")
+    _write_workbook(
+        articles_file,
+        "STAMPA LISTINI",
+        "mgs210_Stampa Listini",
+        [None, "Codice", "Marca", "Descrizione", "Giacenza", "Prz. ult. acq."],
+        articles_rows,
+        sheet_rows,
+    )
+    warehouse_file = os.path.join(output_dir, "warehouse.xlsx")
+    _write_workbook(
+        warehouse_file,
+        "STAMPA ANAGRAFICA ARTICOLI",
+        "mgs010_Stampa Anagrafica Articoli",
+        [None, "Codice", "Marca", "Descrizione", "Ubicazione", "Giacenza"],
+        warehouse_rows,
+        sheet_rows,
+    )
+
+    # OEM files: products in the same group share the same OE numbers
+    unknown = rng.random(rows) < unknown_oe_ratio
+    known_indices = np.flatnonzero(~unknown)
+    unknown_indices = np.flatnonzero(unknown)
+    referenced_mask = rng.random(len(unknown_indices)) < cross_reference_ratio
+    referenced = unknown_indices[referenced_mask].tolist()
+
+    oem_rows = []
+    position = 0
+    oe_counter = 0
+    for size in _oe_group_sizes(rng, len(known_indices), oe_group_mean, oe_group_max):
+        members = known_indices[position : position + size].tolist()
+        position += size
+        group_oes = []
+        for _ in range(int(rng.integers(1, oes_per_product + 1))):
+            oe_counter += 1
+            if referenced and rng.random() < 0.3:
+                group_oes.append(codes[referenced.pop()])
+            elif oe_counter % 9 == 0:
+                # Spaces are removed by the OEM loader
+                group_oes.append(f"{oe_counter:03d} {oe_counter:06d}")
+            else:
+                group_oes.append(f"{oe_counter:09d}")
+        for member in members:
+            for oe_number in group_oes:
+                oem_rows.append((codes[member], brands[member], oe_number))
+    order = rng.permutation(len(oem_rows)).tolist()
+    oem_rows = [oem_rows[index] for index in order]
+
+    oem_paths = []
+    chunk = max(len(oem_rows) // max(oem_files, 1) + 1, 1)
+    for file_index in range(max(oem_files, 1)):
+        path = os.path.join(oem_folder, f"oemsDC{file_index + 1}.csv")
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["article_altc", "article_alt_brands", "oem_number"])
+            writer.writerows(oem_rows[file_index * chunk : (file_index + 1) * chunk])
+        oem_paths.append(path)
+
+    brands_file = os.path.join(output_dir, "brands.csv")
+    with open(brands_file, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Brand", "Match"])
+        writer.writerows(BRAND_MATCHES.items())
+
+    tecdoc_file = os.path.join(output_dir, "tecdoc_brand_id.csv")
+    with open(tecdoc_file, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["ID", "Name"])
+        for index, name in enumerate(TECDOC_BRANDS):
+            writer.writerow([10 + index * 7, name])
+
+    return {
+        "articles_file": articles_file,
+        "warehouse_file": warehouse_file,
+        "oem_folder": oem_folder,
+        "brands_file": brands_file,
+        "tecdoc_file": tecdoc_file,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic benchmark dataset."
+    )
+    parser.add_argument("--rows", type=int, default=10000, help="catalog size")
+    parser.add_argument(
+        "--output", required=True, help="folder for the generated files"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--oe-group-mean", type=float, default=3.0)
+    parser.add_argument("--oe-group-max", type=int, default=50)
+    parser.add_argument("--oes-per-product", type=int, default=3)
+    parser.add_argument("--unknown-oe-ratio", type=float, default=0.3)
+    parser.add_argument("--cross-reference-ratio", type=float, default=0.2)
+    parser.add_argument("--oem-files", type=int, default=3)
+    parser.add_argument("--sheet-rows", type=int, default=DEFAULT_SHEET_ROWS)
+    args = parser.parse_args()
+
+    paths = generate_dataset(
+        args.output,
+        rows=args.rows,
+        seed=args.seed,
+        oe_group_mean=args.oe_group_mean,
+        oe_group_max=args.oe_group_max,
+        oes_per_product=args.oes_per_product,
+        unknown_oe_ratio=args.unknown_oe_ratio,
+        cross_reference_ratio=args.cross_reference_ratio,
+        oem_files=args.oem_files,
+        sheet_rows=args.sheet_rows,
+    )
+    for name, path in paths.items():
+        print(f"{name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
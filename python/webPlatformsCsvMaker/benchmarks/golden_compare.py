@@ -0,0 +1,340 @@
+# benchmarks/golden_compare.py
+#
+# Golden-output equivalence harness. Runs a reference implementation (a git
+# revision, HEAD by default) and a candidate implementation (the working
+# tree by default) on generated datasets and compares company1_output.csv and
+# company2_output.csv byte by byte, then cell by cell when they differ.
+#
+# Usage (from the application folder):
+#   python -m benchmarks.golden_compare run --sizes 10000 100000
+#   python -m benchmarks.golden_compare run --reference 1a2b3c4 --candidate .
+#   python -m benchmarks.golden_compare compare expected_folder actual_folder
+
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import BENCHMARKS_FOLDER, ensure_dataset, pricing_inputs
+
+APP_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+OUTPUT_FILES = ["company1_output.csv", "company2_output.csv"]
+# Rows are matched on these columns (and their occurrence number)
+KEY_COLUMNS = {
+    "company1_output.csv": ["CODICE PRODOTTO", "BRAND"],
+    "company2_output.csv": ["TecDoc-ID", "TecDoc Brand"],
+}
+# " | " separated lists, differences only in the order are counted apart
+LIST_COLUMNS = ["CODICE OE", "CODICI CROSS"]
+PRICE_COLUMNS = ["PREZZO", "Price_Italia", "Price_Germany"]
+
+# Runs twin_data_processing.main of the implementation in the current folder.
+# Written to a file because the "spawn" start method needs an importable main.
+DRIVER = """
+import json
+import os
+import sys
+
+sys.path.insert(0, os.getcwd())
+
+if __name__ == "__main__":
+    from data_processing.ignored_brands import IGNORED_BRANDS
+    from data_processing.twin_data_processing import main
+
+    arguments = json.loads(sys.argv[1])
+    main(
+        arguments["articles_file"],
+        arguments["warehouse_file"],
+        arguments["tecdoc_file"],
+        os.path.join(arguments["output_folder"], "company1_output.csv"),
+        os.path.join(arguments["output_folder"], "company2_output.csv"),
+        arguments["brands_file"],
+        arguments["oem_folder"],
+        IGNORED_BRANDS,
+        arguments["inputs"],
+    )
+"""
+
+
+def export_revision(revision, destination):
+    """Extracts the application folder at a git revision into destination."""
+
+    def git(*arguments, **kwargs):
+        return subprocess.run(["git", *arguments], check=True, **kwargs)
+
+    def git_output(*arguments):
+        return git(*arguments, cwd=APP_FOLDER, capture_output=True, text=True).stdout
+
+    top_level = git_output("rev-parse", "--show-toplevel").strip()
+    prefix = git_output("rev-parse", "--show-prefix").strip()
+    archive_path = os.path.join(destination, "source.tar")
+    with open(archive_path, "wb") as archive:
+        git(
+            "archive",
+            "--format=tar",
+            revision,
+            prefix or ".",
+            cwd=top_level,
+            stdout=archive,
+        )
+    with tarfile.open(archive_path) as archive:
+        archive.extractall(destination)
+    os.remove(archive_path)
+    return os.path.join(destination, prefix)
+
+
+def resolve_implementation(implementation, work_folder):
+    """Returns the source folder of a path or a git revision."""
+    if os.path.isdir(implementation):
+        return os.path.abspath(implementation)
+    destination = os.path.join(
+        work_folder, "rev_" + implementation.replace("/", "_")
+    )
+    os.makedirs(destination, exist_ok=True)
+    return export_revision(implementation, destination)
+
+
+def run_implementation(source_folder, paths, output_folder, inputs, driver_path):
+    os.makedirs(output_folder, exist_ok=True)
+    arguments = dict(paths, output_folder=output_folder, inputs=inputs)
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, driver_path, json.dumps(arguments)],
+        cwd=source_folder,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def _read_cells(path):
+    # Compare the text of the cells exactly as written
+    return pd.read_csv(path, dtype=str, keep_default_na=False, na_filter=False)
+
+
+def _sorted_tokens(values):
+    return np.array([" | ".join(sorted(value.split(" | "))) for value in values])
+
+
+def _align(expected, actual, key_columns):
+    """Pairs the rows of both frames on the key columns and occurrence number."""
+    key_columns = [
+        c for c in key_columns if c in expected.columns and c in actual.columns
+    ]
+    if not key_columns:
+        rows = min(len(expected), len(actual))
+        return expected.iloc[:rows], actual.iloc[:rows], [], [], False
+
+    def with_occurrence(df):
+        df = df.copy()
+        df["_occurrence"] = df.groupby(key_columns, sort=False).cumcount()
+        df["_position"] = np.arange(len(df))
+        return df
+
+    on = key_columns + ["_occurrence"]
+    merged = with_occurrence(expected).merge(
+        with_occurrence(actual),
+        on=on,
+        how="outer",
+        suffixes=("", "_actual"),
+        indicator=True,
+    )
+    both = merged[merged["_merge"] == "both"]
+    missing = merged.loc[merged["_merge"] == "left_only", key_columns]
+    extra = merged.loc[merged["_merge"] == "right_only", key_columns]
+    reordered = not np.array_equal(
+        both.sort_values("_position")["_position_actual"].to_numpy(),
+        np.sort(both["_position_actual"].to_numpy()),
+    )
+
+    both = both.sort_values("_position")
+    expected_aligned = both[list(expected.columns)]
+    actual_aligned = both[
+        [c if c in key_columns else f"{c}_actual" for c in actual.columns]
+    ]
+    actual_aligned.columns = list(actual.columns)
+    missing_keys = list(map(tuple, missing.to_numpy()))
+    extra_keys = list(map(tuple, extra.to_numpy()))
+    return expected_aligned, actual_aligned, missing_keys, extra_keys, reordered
+
+
+def compare_csv(expected_path, actual_path, key_columns=(), max_examples=5):
+    """
+    Compares two CSV files and returns a list of report lines, empty when the
+    files are byte-for-byte identical.
+    """
+    if filecmp.cmp(expected_path, actual_path, shallow=False):
+        return []
+
+    expected = _read_cells(expected_path)
+    actual = _read_cells(actual_path)
+    report = []
+
+    if list(expected.columns) != list(actual.columns):
+        report.append(
+            f"columns differ: expected {list(expected.columns)}, "
+            f"got {list(actual.columns)}"
+        )
+    if len(expected) != len(actual):
+        report.append(
+            f"row count differs: expected {len(expected)}, got {len(actual)}"
+        )
+
+    expected, actual, missing, extra, reordered = _align(
+        expected, actual, list(key_columns)
+    )
+    if missing or extra:
+        report.append(
+            f"{len(missing)} rows missing, {len(extra)} rows extra "
+            f"(matched on {' + '.join(key_columns)})"
+        )
+        for key in missing[:max_examples]:
+            report.append(f"    missing {key}")
+        for key in extra[:max_examples]:
+            report.append(f"    extra   {key}")
+    if reordered:
+        report.append("rows are in a different order")
+
+    key_values = expected.iloc[:, 0].to_numpy()
+    for column in expected.columns:
+        if column not in actual.columns:
+            continue
+        expected_values = expected[column].to_numpy()
+        actual_values = actual[column].to_numpy()
+        mismatches = np.flatnonzero(expected_values != actual_values)
+        if len(mismatches) == 0:
+            continue
+
+        detail = ""
+        if column in LIST_COLUMNS:
+            order_only = np.count_nonzero(
+                _sorted_tokens(expected_values[mismatches])
+                == _sorted_tokens(actual_values[mismatches])
+            )
+            detail = f", {order_only} only in \" | \" order"
+        elif column in PRICE_COLUMNS:
+            deltas = pd.to_numeric(
+                pd.Series(actual_values[mismatches]), errors="coerce"
+            ) - pd.to_numeric(pd.Series(expected_values[mismatches]), errors="coerce")
+            detail = f", max price delta {deltas.abs().max():.4f}"
+        report.append(f"{column}: {len(mismatches)} cells differ{detail}")
+        for row in mismatches[:max_examples]:
+            report.append(
+                f"    [{key_values[row]}]: "
+                f"{expected_values[row]!r} -> {actual_values[row]!r}"
+            )
+
+    if not report:
+        report.append("cells are identical, bytes differ (quoting or line endings)")
+    return report
+
+
+def compare_folders(expected_folder, actual_folder, max_examples=5):
+    identical = True
+    for file_name in OUTPUT_FILES:
+        report = compare_csv(
+            os.path.join(expected_folder, file_name),
+            os.path.join(actual_folder, file_name),
+            KEY_COLUMNS[file_name],
+            max_examples,
+        )
+        if report:
+            identical = False
+            print(f"{file_name}: DIFFERENT")
+            for line in report:
+                print(f"  {line}")
+        else:
+            print(f"{file_name}: identical")
+    return identical
+
+
+def run_harness(reference, candidate, sizes, inputs, keep_outputs, max_examples):
+    work_folder = tempfile.mkdtemp(prefix="golden_")
+    identical = True
+    try:
+        driver_path = os.path.join(work_folder, "golden_driver.py")
+        with open(driver_path, "w", encoding="utf-8") as file:
+            file.write(DRIVER)
+        reference_folder = resolve_implementation(reference, work_folder)
+        candidate_folder = resolve_implementation(candidate, work_folder)
+
+        for rows in sizes:
+            paths = ensure_dataset(rows)
+            expected_folder = os.path.join(work_folder, f"{rows}", "reference")
+            actual_folder = os.path.join(work_folder, f"{rows}", "candidate")
+            reference_seconds = run_implementation(
+                reference_folder, paths, expected_folder, inputs, driver_path
+            )
+            candidate_seconds = run_implementation(
+                candidate_folder, paths, actual_folder, inputs, driver_path
+            )
+            print(
+                f"\n{rows} rows: reference {reference_seconds:.2f} s, "
+                f"candidate {candidate_seconds:.2f} s "
+                f"({reference_seconds / max(candidate_seconds, 1e-9):.2f}x)"
+            )
+            identical &= compare_folders(expected_folder, actual_folder, max_examples)
+    finally:
+        if keep_outputs:
+            print(f"\nOutputs kept in {work_folder}")
+        else:
+            shutil.rmtree(work_folder, ignore_errors=True)
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden-output equivalence harness.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser(
+        "run", help="run reference and candidate on generated datasets"
+    )
+    run_parser.add_argument(
+        "--reference", default="HEAD", help="git revision or folder"
+    )
+    run_parser.add_argument(
+        "--candidate", default=APP_FOLDER, help="folder or git revision"
+    )
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[10000])
+    run_parser.add_argument(
+        "--inputs", help="JSON object overriding the pricing inputs"
+    )
+    run_parser.add_argument("--keep-outputs", action="store_true")
+    run_parser.add_argument("--max-examples", type=int, default=5)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare the outputs in two folders"
+    )
+    compare_parser.add_argument("expected_folder")
+    compare_parser.add_argument("actual_folder")
+    compare_parser.add_argument("--max-examples", type=int, default=5)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        identical = compare_folders(
+            args.expected_folder, args.actual_folder, args.max_examples
+        )
+    else:
+        inputs = pricing_inputs(json.loads(args.inputs or "{}"))
+        identical = run_harness(
+            args.reference,
+            args.candidate,
+            args.sizes,
+            inputs,
+            args.keep_outputs,
+            args.max_examples,
+        )
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
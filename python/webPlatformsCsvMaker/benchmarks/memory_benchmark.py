@@ -0,0 +1,169 @@
+# benchmarks/memory_benchmark.py
+#
+# Peak memory benchmark: runs twin_data_processing.main on a generated dataset
+# in memory and out of core (see data_processing/out_of_core) with each memory
+# budget, every run in its own process, and reports its peak resident memory
+# and time. Fails when an out-of-core run goes over its budget or writes other
+# CSVs than the run in memory. Results are appended to
+# benchmarks/results/memory.csv.
+#
+# Usage (from the application folder):
+#   python -m benchmarks.memory_benchmark --rows 200000 --budgets 512 1024
+
+import argparse
+import csv
+import filecmp
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import (
+    DEFAULT_INPUTS,
+    RESULTS_FOLDER,
+    Timer,
+    ensure_dataset,
+    git_revision,
+)
+
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGETS = [512, 1024]
+OUTPUTS = ["company1_output.csv", "company2_output.csv"]
+RESULT_FIELDS = ["timestamp", "revision", "rows", "budget_mb", "seconds", "peak_mb"]
+
+
+def peak_memory_mb():
+    """The peak resident memory of this process, in MB."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def run_child(paths, output_folder, budget_mb):
+    """Runs main in this process and prints its time and peak memory."""
+    from data_processing.ignored_brands import IGNORED_BRANDS
+    from data_processing.twin_data_processing import main as main_processing_function
+
+    with Timer() as timer:
+        main_processing_function(
+            paths["articles_file"],
+            paths["warehouse_file"],
+            paths["tecdoc_file"],
+            os.path.join(output_folder, OUTPUTS[0]),
+            os.path.join(output_folder, OUTPUTS[1]),
+            paths["brands_file"],
+            paths["oem_folder"],
+            IGNORED_BRANDS,
+            DEFAULT_INPUTS,
+            memory_budget_mb=budget_mb,
+        )
+    print(json.dumps({"seconds": timer.seconds, "peak_mb": peak_memory_mb()}))
+
+
+def measure(paths, output_folder, budget_mb):
+    """Returns (seconds, peak MB) of a run in a new process."""
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.memory_benchmark",
+        "--child",
+        json.dumps([paths, output_folder, budget_mb]),
+    ]
+    completed = subprocess.run(
+        command, cwd=APP_FOLDER, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result["seconds"], result["peak_mb"]
+
+
+def same_outputs(folder, other_folder):
+    return all(
+        filecmp.cmp(
+            os.path.join(folder, name), os.path.join(other_folder, name), shallow=False
+        )
+        for name in OUTPUTS
+    )
+
+
+def append_results(path, rows, results, revision):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_header = not os.path.exists(path)
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(path, "a", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        if write_header:
+            writer.writerow(RESULT_FIELDS)
+        for budget_mb, seconds, peak_mb in results:
+            writer.writerow(
+                [
+                    timestamp,
+                    revision,
+                    rows,
+                    "" if budget_mb is None else budget_mb,
+                    f"{seconds:.4f}",
+                    f"{peak_mb:.1f}",
+                ]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Peak memory of the processing, in memory and out of core."
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--budgets",
+        type=int,
+        nargs="+",
+        default=DEFAULT_BUDGETS,
+        help="out_of_core_memory_mb of the out-of-core runs",
+    )
+    parser.add_argument(
+        "--results", default=os.path.join(RESULTS_FOLDER, "memory.csv")
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(*json.loads(args.child))
+        return 0
+
+    paths = ensure_dataset(args.rows, args.seed)
+    results = []
+    failed = False
+    with tempfile.TemporaryDirectory() as folder:
+        reference = os.path.join(folder, "memory")
+        os.makedirs(reference)
+        seconds, peak_mb = measure(paths, reference, None)
+        results.append((None, seconds, peak_mb))
+        print(f"in memory      {seconds:10.2f} s {peak_mb:10.1f} MB")
+
+        for budget_mb in args.budgets:
+            output_folder = os.path.join(folder, str(budget_mb))
+            os.makedirs(output_folder)
+            seconds, peak_mb = measure(paths, output_folder, budget_mb)
+            results.append((budget_mb, seconds, peak_mb))
+            same = same_outputs(reference, output_folder)
+            print(
+                f"{budget_mb:>6} MB budget{seconds:10.2f} s {peak_mb:10.1f} MB"
+                f"{'' if same else '  (other CSVs)'}"
+            )
+            failed = failed or peak_mb > budget_mb or not same
+    append_results(args.results, args.rows, results, git_revision())
+
+    if failed:
+        print("FAILED: an out-of-core run is over its budget or wrote other CSVs")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
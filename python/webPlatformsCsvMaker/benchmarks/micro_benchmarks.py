@@ -0,0 +1,414 @@
+# benchmarks/micro_benchmarks.py
+#
+# Micro-benchmarks for the hot functions of the pipeline, run on in-memory
+# synthetic frames at several sizes. Every run is appended to
+# benchmarks/results/micro_history.jsonl; `compare` flags slowdowns between
+# two runs.
+#
+# Usage (from the application folder):
+#   python -m benchmarks.micro_benchmarks run
+#   python -m benchmarks.micro_benchmarks run --only custom_round --sizes 1000000
+#   python -m benchmarks.micro_benchmarks compare --threshold 0.1
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import RESULTS_FOLDER, git_revision
+from benchmarks.generate_dataset import AFTERMARKET_BRANDS, BRAND_MATCHES, TECDOC_BRANDS
+from data_processing.company1_processing import (
+    find_additional_cross_codes,
+    optimized_cross_code_generation,
+    update_brands,
+    vectorized_get_oem_number,
+)
+from data_processing.company2_processing import (
+    BRANDS_TO_IGNORE,
+    MANUAL_MAPPING,
+    RENAME_DICT,
+    market_prices,
+    match_brands,
+)
+from data_processing.cross_references import component_cross_codes
+from data_processing.csv_writer import csv_chunks
+from data_processing.data_cleaning import filter_merged_rows
+from data_processing.ignored_brands import IGNORED_BRANDS
+from data_processing.oe_keys import oe_cross_codes
+from data_processing.pricing import custom_round, round_prices
+from data_processing.pricing_scenarios import COMPANY1_KEYS, company1_prices
+
+HISTORY_FILE = os.path.join(RESULTS_FOLDER, "micro_history.jsonl")
+DEFAULT_THRESHOLD = 0.10
+# Number of unknown-OE codes looked up by find_additional_cross_codes
+CROSS_CODE_LOOKUPS = 50
+
+
+def _catalog(size, seed=0):
+    """Returns a merged-like frame and a matching OEM lookup."""
+    rng = np.random.default_rng(seed)
+    codes = [f"C{number}" for number in rng.permutation(size * 10)[:size].tolist()]
+    brand_pool = AFTERMARKET_BRANDS + IGNORED_BRANDS[:5] + ["MERC", "METAL", "STAR"]
+    brands = rng.choice(brand_pool, size=size).tolist()
+    df = pd.DataFrame(
+        {
+            "CODICE PRODOTTO": codes,
+            "BRAND": brands,
+            "DESCRIZIONE": rng.choice(["FILTRO OLIO", "DISCO FRENO"], size=size),
+            "GIACENZA": rng.integers(1, 40, size=size).astype(float),
+            "PRZ. ULT. ACQ.": np.round(rng.lognormal(2.5, 1.0, size=size), 2),
+            "UBICAZIONE": rng.choice(["A.01.1", "C.00.2", "B.12.3"], size=size),
+        }
+    )
+
+    oem_lookup = {}
+    group = 0
+    for index in np.flatnonzero(rng.random(size) >= 0.3).tolist():
+        if rng.random() < 0.3:
+            group += 1
+        key = (codes[index], brands[index][:5])
+        oem_lookup[key] = [f"{group:09d}"]
+        if rng.random() < 0.1:
+            # OE number pointing to another product code
+            oem_lookup[key].append(codes[int(rng.integers(size))])
+    return df, oem_lookup
+
+
+def _brands_file():
+    path = os.path.join(RESULTS_FOLDER, "micro_brands.csv")
+    if not os.path.exists(path):
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        pd.DataFrame(list(BRAND_MATCHES.items()), columns=["Brand", "Match"]).to_csv(
+            path, index=False
+        )
+    return path
+
+
+def _with_oe(df, oem_lookup):
+    df = df.copy()
+    df["CODICE OE"] = vectorized_get_oem_number(df, oem_lookup, IGNORED_BRANDS)
+    df["padded_oe"] = " " + df["CODICE OE"].str.strip() + " "
+    return df
+
+
+# Each case gets the size and returns (function, make_args); make_args is
+# called before every repetition and is not timed.
+def case_vectorized_get_oem_number(size):
+    df, oem_lookup = _catalog(size)
+    return vectorized_get_oem_number, lambda: (df, oem_lookup, IGNORED_BRANDS)
+
+
+def case_optimized_cross_code_generation(size):
+    df, oem_lookup = _catalog(size)
+    df = _with_oe(df, oem_lookup)
+    return optimized_cross_code_generation, lambda: (df, IGNORED_BRANDS)
+
+
+def case_component_cross_codes(size):
+    # All the cross codes at once, from the components of the OE numbers
+    df, oem_lookup = _catalog(size)
+    df = _with_oe(df, oem_lookup)
+    return component_cross_codes, lambda: (df, IGNORED_BRANDS, 50)
+
+
+def case_find_additional_cross_codes(size):
+    df, oem_lookup = _catalog(size)
+    df = _with_oe(df, oem_lookup)
+    unknown = df.loc[df["CODICE OE"] == "Unknown OE", "CODICE PRODOTTO"]
+    lookups = unknown.head(CROSS_CODE_LOOKUPS).tolist()
+
+    def run(cleaned_df):
+        return [
+            find_additional_cross_codes(
+                code, cleaned_df["padded_oe"], cleaned_df, IGNORED_BRANDS
+            )
+            for code in lookups
+        ]
+
+    return run, lambda: (df,)
+
+
+def case_match_brands(size):
+    df, _ = _catalog(size)
+    df = df[["CODICE PRODOTTO", "BRAND", "DESCRIZIONE", "GIACENZA"]].rename(
+        columns={"CODICE PRODOTTO": "TecDoc-ID", "BRAND": "TecDoc Brand"}
+    )
+    df_tecdoc = pd.DataFrame(
+        {"ID": range(len(TECDOC_BRANDS)), "Name": TECDOC_BRANDS}
+    )
+    return match_brands, lambda: (
+        df.copy(),
+        df_tecdoc,
+        BRANDS_TO_IGNORE,
+        MANUAL_MAPPING,
+        RENAME_DICT,
+    )
+
+
+def case_update_brands(size):
+    df, _ = _catalog(size)
+    brands_file = _brands_file()
+    columns = ["CODICE PRODOTTO", "BRAND"]
+    return update_brands, lambda: (df[columns].copy(), brands_file)
+
+
+def case_custom_round(size):
+    df, _ = _catalog(size)
+    prices = df["PRZ. ULT. ACQ."] * 1.19 + 5.5
+
+    def run(series):
+        return series.apply(custom_round)
+
+    return run, lambda: (prices,)
+
+
+def case_round_prices(size):
+    # Vectorized custom_round, same prices
+    df, _ = _catalog(size)
+    prices = (df["PRZ. ULT. ACQ."] * 1.19 + 5.5).to_numpy()
+    return round_prices, lambda: (prices,)
+
+
+def case_scenario_prices(size):
+    # Ten Tulero pricing scenarios at once, see pricing_scenarios
+    df, _ = _catalog(size)
+    costs = df["PRZ. ULT. ACQ."].to_numpy()
+    scenarios = [
+        {key: (1.10 + number / 40 if "markup" in key else 5.5) for key in COMPANY1_KEYS}
+        for number in range(10)
+    ]
+    return company1_prices, lambda: (costs, scenarios)
+
+
+def case_market_prices(size):
+    # Tyre24 prices of four markets in one pass, see company2_processing
+    df, _ = _catalog(size)
+    costs = df["PRZ. ULT. ACQ."].to_numpy()
+    markets = [
+        {"market": market, "column": f"Price_{market}", "markup": 1.19, "shipping": 5.5}
+        for market in ["it", "de", "fr", "es"]
+    ]
+    return market_prices, lambda: (costs, markets)
+
+
+def case_merge_row_filter(size):
+    df, _ = _catalog(size)
+    return filter_merged_rows, lambda: (df,)
+
+
+def case_csv_chunks(size):
+    df, oem_lookup = _catalog(size)
+    df = _with_oe(df, oem_lookup).drop(columns="padded_oe")
+
+    def run(df):
+        return sum(len(chunk) for chunk in csv_chunks(df))
+
+    return run, lambda: (df,)
+
+
+def case_to_csv(size):
+    # Reference for csv_chunks, same text
+    df, oem_lookup = _catalog(size)
+    df = _with_oe(df, oem_lookup).drop(columns="padded_oe")
+
+    def run(df):
+        return len(df.to_csv(index=False).encode("utf-8"))
+
+    return run, lambda: (df,)
+
+
+def case_oe_cross_codes(size):
+    # The codes of all the unknown-OE rows at once, by integer OE key
+    df, oem_lookup = _catalog(size)
+    df = _with_oe(df, oem_lookup)
+    unknown = df.loc[df["CODICE OE"] == "Unknown OE", "CODICE PRODOTTO"]
+    return oe_cross_codes, lambda: (unknown, df, IGNORED_BRANDS)
+
+
+CASES = {
+    "vectorized_get_oem_number": (
+        case_vectorized_get_oem_number,
+        [10000, 100000, 1000000],
+    ),
+    "optimized_cross_code_generation": (
+        case_optimized_cross_code_generation,
+        [10000, 100000, 1000000],
+    ),
+    "component_cross_codes": (case_component_cross_codes, [10000, 100000, 1000000]),
+    "find_additional_cross_codes": (
+        case_find_additional_cross_codes,
+        [10000, 100000],
+    ),
+    "oe_cross_codes": (case_oe_cross_codes, [10000, 100000, 1000000]),
+    "match_brands": (case_match_brands, [1000, 10000, 100000]),
+    "update_brands": (case_update_brands, [10000, 100000, 1000000]),
+    "custom_round": (case_custom_round, [10000, 100000, 1000000]),
+    "round_prices": (case_round_prices, [10000, 100000, 1000000]),
+    "scenario_prices": (case_scenario_prices, [10000, 100000, 1000000]),
+    "market_prices": (case_market_prices, [10000, 100000, 1000000]),
+    "merge_row_filter": (case_merge_row_filter, [10000, 100000]),
+    "csv_chunks": (case_csv_chunks, [10000, 100000, 1000000]),
+    "to_csv": (case_to_csv, [10000, 100000, 1000000]),
+}
+
+
+def time_case(function, make_args, repeats):
+    timings = []
+    for _ in range(repeats):
+        args = make_args()
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), timings
+
+
+def run_benchmarks(names, sizes, repeats, history_file):
+    run_id = uuid.uuid4().hex[:12]
+    revision = git_revision()
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    os.makedirs(os.path.dirname(history_file), exist_ok=True)
+
+    with open(history_file, "a", encoding="utf-8") as file:
+        for name in names:
+            make_case, default_sizes = CASES[name]
+            for size in sizes or default_sizes:
+                function, make_args = make_case(size)
+                best, timings = time_case(function, make_args, repeats)
+                record = {
+                    "run_id": run_id,
+                    "timestamp": timestamp,
+                    "revision": revision,
+                    "benchmark": name,
+                    "size": size,
+                    "seconds": best,
+                    "timings": timings,
+                    "python": platform.python_version(),
+                    "pandas": pd.__version__,
+                    "machine": platform.node(),
+                }
+                file.write(json.dumps(record) + "\n")
+                file.flush()
+                print(f"{name:<34}{size:>10d}{best:12.4f} s")
+
+    print(f"\nRun {run_id} ({revision}) appended to {history_file}")
+    return run_id
+
+
+def load_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _select_run(records, selector):
+    """Selects the records of a run id or of the latest run at a git revision."""
+    matching = [r for r in records if selector in (r["run_id"], r["revision"])]
+    if not matching:
+        return None, {}
+    run_id = matching[-1]["run_id"]
+    return run_id, {
+        (r["benchmark"], r["size"]): r["seconds"]
+        for r in records
+        if r["run_id"] == run_id
+    }
+
+
+def compare_runs(
+    history_file, baseline=None, candidate=None, threshold=DEFAULT_THRESHOLD
+):
+    """
+    Compares two runs from the history (by default the last two) and returns
+    the list of (benchmark, size, baseline, candidate, ratio) slowdowns above
+    the threshold.
+    """
+    records = load_history(history_file)
+    run_ids = list(dict.fromkeys(r["run_id"] for r in records))
+    if candidate is None:
+        if not run_ids:
+            raise ValueError("No micro-benchmark runs in the history.")
+        candidate = run_ids[-1]
+    candidate_id, candidate_results = _select_run(records, candidate)
+    if candidate_id is None:
+        raise ValueError(f"Run or revision not found: {candidate}")
+    if baseline is None:
+        earlier = run_ids[: run_ids.index(candidate_id)]
+        if not earlier:
+            raise ValueError("No earlier run to compare with.")
+        baseline = earlier[-1]
+    baseline_id, baseline_results = _select_run(records, baseline)
+    if baseline_id is None:
+        raise ValueError(f"Run or revision not found: {baseline}")
+
+    print(f"Baseline {baseline_id} vs candidate {candidate_id}\n")
+    slowdowns = []
+    for key, new_seconds in candidate_results.items():
+        old_seconds = baseline_results.get(key)
+        if old_seconds is None:
+            continue
+        ratio = new_seconds / old_seconds if old_seconds > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "SLOWER"
+            slowdowns.append((*key, old_seconds, new_seconds, ratio))
+        elif ratio < 1 - threshold:
+            flag = "faster"
+        name, size = key
+        print(
+            f"{name:<34}{size:>10d}{old_seconds:12.4f}{new_seconds:12.4f}"
+            f"{ratio:8.2f}x  {flag}"
+        )
+    return slowdowns
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks for hot functions."
+    )
+    parser.add_argument("--history", default=HISTORY_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run and append to the history")
+    run_parser.add_argument("--only", nargs="+", choices=sorted(CASES), default=None)
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=None)
+    run_parser.add_argument("--repeats", type=int, default=3)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare two runs and flag slowdowns"
+    )
+    compare_parser.add_argument("--baseline", help="run id or git revision")
+    compare_parser.add_argument("--candidate", help="run id or git revision")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        names = args.only or list(CASES)
+        run_benchmarks(names, args.sizes, args.repeats, args.history)
+        return 0
+
+    try:
+        slowdowns = compare_runs(
+            args.history, args.baseline, args.candidate, args.threshold
+        )
+    except ValueError as e:
+        print(str(e))
+        return 2
+    if slowdowns:
+        print(
+            f"\n{len(slowdowns)} benchmark(s) slower by more than "
+            f"{args.threshold:.0%}"
+        )
+        return 1
+    print("\nNo slowdowns above the threshold.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
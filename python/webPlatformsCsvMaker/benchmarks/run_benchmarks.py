@@ -0,0 +1,203 @@
+# benchmarks/run_benchmarks.py
+#
+# End-to-end benchmark: times every stage of the pipeline and the whole
+# twin_data_processing.main on generated datasets of increasing size.
+# Results are appended to benchmarks/results/end_to_end.csv, one row per
+# (size, stage), so scaling curves can be plotted across revisions.
+#
+# Usage (from the application folder):
+#   python -m benchmarks.run_benchmarks --sizes 10000 100000 1000000
+#   python -m benchmarks.run_benchmarks --sizes 1000000 --company1-workers 16
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from benchmarks.common import (
+    DEFAULT_INPUTS,
+    RESULTS_FOLDER,
+    Timer,
+    ensure_dataset,
+    git_revision,
+)
+from data_processing.company1_incremental import process_company1_incremental
+from data_processing.company1_processing import process_company1
+from data_processing.company2_processing import process_company2
+from data_processing.csv_writer import write_csv
+from data_processing.data_cleaning import (
+    load_and_clean_excel_file,
+    merge_cleaned_frames,
+)
+from data_processing.ignored_brands import IGNORED_BRANDS
+from data_processing.pricing import cost_base
+from data_processing.twin_data_processing import main as main_processing_function
+
+DEFAULT_SIZES = [10000, 30000, 100000]
+RESULT_FIELDS = ["timestamp", "revision", "rows", "stage", "seconds", "output_rows"]
+
+
+def benchmark_stages(
+    paths, output_folder, inputs=DEFAULT_INPUTS, run_main=True, company1_workers=1
+):
+    """Runs the pipeline stage by stage and returns a list of (stage, seconds, rows)."""
+    results = []
+
+    with Timer() as timer:
+        warehouse_df = load_and_clean_excel_file(paths["warehouse_file"], "warehouse")
+    results.append(("load_warehouse", timer.seconds, len(warehouse_df)))
+
+    with Timer() as timer:
+        articles_df = load_and_clean_excel_file(paths["articles_file"], "articles")
+    results.append(("load_articles", timer.seconds, len(articles_df)))
+
+    with Timer() as timer:
+        merged_df = merge_cleaned_frames(articles_df, warehouse_df)
+    results.append(("merge", timer.seconds, len(merged_df)))
+
+    # Shared by the two branches, as in twin_data_processing.main
+    with Timer() as timer:
+        base = cost_base(merged_df)
+    results.append(("cost_base", timer.seconds, len(base)))
+
+    with Timer() as timer:
+        company1_df = process_company1(
+            merged_df.copy(),
+            paths["brands_file"],
+            paths["oem_folder"],
+            IGNORED_BRANDS,
+            inputs["company1_markup"],
+            inputs["company1_shipping"],
+            base=base,
+            workers=company1_workers,
+        )
+    results.append(("company1", timer.seconds, len(company1_df)))
+
+    # Incremental Tulero run after 1% of the prices changed, starting from the
+    # state of a first run (see company1_incremental)
+    company1_args = [
+        paths["brands_file"],
+        paths["oem_folder"],
+        IGNORED_BRANDS,
+        inputs["company1_markup"],
+        inputs["company1_shipping"],
+        os.path.join(output_folder, "company1_incremental.csv"),
+    ]
+    process_company1_incremental(merged_df.copy(), *company1_args)
+    changed_df = merged_df.copy()
+    changed_df.loc[changed_df.index[::100], "PRZ. ULT. ACQ."] *= 1.1
+    with Timer() as timer:
+        incremental_df = process_company1_incremental(changed_df, *company1_args)
+    results.append(("company1_incremental_1pct", timer.seconds, len(incremental_df)))
+
+    with Timer() as timer:
+        company2_df = process_company2(
+            merged_df,
+            paths["tecdoc_file"],
+            inputs["company2_markets"],
+            base=base,
+        )
+    results.append(("company2", timer.seconds, len(company2_df)))
+
+    company1_output = os.path.join(output_folder, "company1_output.csv")
+    company2_output = os.path.join(output_folder, "company2_output.csv")
+    output_rows = len(company1_df) + len(company2_df)
+    with Timer() as timer:
+        company1_df.to_csv(company1_output, index=False)
+        company2_df.to_csv(company2_output, index=False)
+    results.append(("to_csv", timer.seconds, output_rows))
+
+    with Timer() as timer:
+        write_csv(company1_df, company1_output)
+        write_csv(company2_df, company2_output)
+    results.append(("write_csv", timer.seconds, output_rows))
+
+    with Timer() as timer:
+        write_csv(company1_df, company1_output + ".gz")
+        write_csv(company2_df, company2_output + ".gz")
+    results.append(("write_csv_gzip", timer.seconds, output_rows))
+
+    if run_main:
+        with Timer() as timer:
+            main_processing_function(
+                paths["articles_file"],
+                paths["warehouse_file"],
+                paths["tecdoc_file"],
+                company1_output,
+                company2_output,
+                paths["brands_file"],
+                paths["oem_folder"],
+                IGNORED_BRANDS,
+                inputs,
+                company1_workers=company1_workers,
+            )
+        results.append(("main", timer.seconds, output_rows))
+
+    return results
+
+
+def append_results(path, rows, results, revision):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_header = not os.path.exists(path)
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(path, "a", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        if write_header:
+            writer.writerow(RESULT_FIELDS)
+        for stage, seconds, output_rows in results:
+            writer.writerow(
+                [timestamp, revision, rows, stage, f"{seconds:.4f}", output_rows]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--oe-group-mean", type=float, default=3.0)
+    parser.add_argument("--unknown-oe-ratio", type=float, default=0.3)
+    parser.add_argument(
+        "--regenerate", action="store_true", help="rebuild the datasets"
+    )
+    parser.add_argument(
+        "--skip-main", action="store_true", help="do not time twin_data_processing.main"
+    )
+    parser.add_argument(
+        "--company1-workers",
+        type=int,
+        default=1,
+        help="processes preparing the Tulero rows (prepare_company1_shards)",
+    )
+    parser.add_argument(
+        "--results", default=os.path.join(RESULTS_FOLDER, "end_to_end.csv")
+    )
+    args = parser.parse_args()
+
+    revision = git_revision()
+    for rows in args.sizes:
+        paths = ensure_dataset(
+            rows,
+            seed=args.seed,
+            regenerate=args.regenerate,
+            oe_group_mean=args.oe_group_mean,
+            unknown_oe_ratio=args.unknown_oe_ratio,
+        )
+        with tempfile.TemporaryDirectory() as output_folder:
+            results = benchmark_stages(
+                paths,
+                output_folder,
+                run_main=not args.skip_main,
+                company1_workers=args.company1_workers,
+            )
+        append_results(args.results, rows, results, revision)
+
+        print(f"\n{rows} rows ({revision})")
+        for stage, seconds, output_rows in results:
+            print(f"  {stage:<16}{seconds:10.3f} s{output_rows:12d} rows")
+
+    print(f"\nResults appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/startup_benchmark.py
+#
+# Startup benchmark: launches main.py several times with the startup probe
+# enabled and measures the time from the process launch to the first paint of
+# the main window. Fails when the median is above the budget or when pandas,
+# numpy or pandarallel were imported before the first paint.
+#
+# Usage (from the application folder):
+#   python -m benchmarks.startup_benchmark
+#   python -m benchmarks.startup_benchmark --runs 10 --budget 1.5
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import BENCHMARKS_FOLDER, RESULTS_FOLDER, git_revision
+
+APP_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+DEFAULT_BUDGET = 1.5
+DEFAULT_RUNS = 5
+RESULT_FIELDS = ["timestamp", "revision", "run", "seconds", "heavy_modules_loaded"]
+
+
+def measure_startup(command, timeout):
+    """Returns (seconds to first paint, heavy modules loaded before it)."""
+    env = dict(os.environ, WEBSTOCK_STARTUP_PROBE="1")
+    # Allows running without a display (CI, SSH sessions)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    launched = time.time()
+    completed = subprocess.run(
+        command,
+        cwd=APP_FOLDER,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith("{"):
+            result = json.loads(line)
+            return result["first_paint"] - launched, result["heavy_modules_loaded"]
+    raise RuntimeError(
+        f"No startup probe output (exit status {completed.returncode}):\n"
+        f"{completed.stderr}"
+    )
+
+
+def append_results(path, results, revision):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_header = not os.path.exists(path)
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(path, "a", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        if write_header:
+            writer.writerow(RESULT_FIELDS)
+        for run, (seconds, heavy_modules) in enumerate(results, start=1):
+            writer.writerow(
+                [timestamp, revision, run, f"{seconds:.4f}", " ".join(heavy_modules)]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first paint of the GUI.")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument(
+        "--budget", type=float, default=DEFAULT_BUDGET, help="median, in seconds"
+    )
+    parser.add_argument(
+        "--command",
+        nargs="+",
+        default=[sys.executable, "main.py"],
+        help="command to launch, e.g. dist/WebStockUpdater.exe",
+    )
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument(
+        "--results", default=os.path.join(RESULTS_FOLDER, "startup.csv")
+    )
+    args = parser.parse_args()
+
+    results = []
+    for run in range(1, args.runs + 1):
+        seconds, heavy_modules = measure_startup(args.command, args.timeout)
+        results.append((seconds, heavy_modules))
+        loaded = f"  (loaded: {', '.join(heavy_modules)})" if heavy_modules else ""
+        print(f"run {run:>3}{seconds:10.3f} s{loaded}")
+    append_results(args.results, results, git_revision())
+
+    median = statistics.median(seconds for seconds, _ in results)
+    print(f"\nmedian {median:.3f} s, budget {args.budget:.3f} s")
+    failed = False
+    if median > args.budget:
+        print("FAILED: the median time to first paint is over the budget")
+        failed = True
+    if any(heavy_modules for _, heavy_modules in results):
+        print("FAILED: heavy modules are imported before the first paint")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,556 @@
+# cli.py
+#
+# Headless entry point for scheduled runs: reads config.json, runs the data
+# processing and the FTP uploads, and exits with a status code. It must never
+# import PyQt (directly or through worker.py/workerFtp.py).
+#
+#   python cli.py
+#   python cli.py --output /srv/feeds --company1-markup 22% --no-upload-company2
+#   python cli.py --company2-markup fr=22% --company2-shipping fr=9.5
+#   python cli.py --scenarios scenarios.json --summary-only
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from utility.config import (
+    CONFIG_FILE,
+    DATAFRAME_BACKENDS,
+    company1_workers_from_config,
+    dataframe_backend_errors,
+    dataframe_backend_from_config,
+    ftp_info_from_config,
+    load_config,
+    market_table_errors,
+    max_component_size_from_config,
+    memory_budget_from_config,
+    pricing_inputs_from_config,
+)
+from utility.profiling import get_profiling_interval, get_profiling_mode, profile_run
+
+EXIT_OK = 0
+EXIT_PROCESSING_FAILED = 1
+EXIT_INVALID_INPUT = 2
+EXIT_UPLOAD_FAILED = 3
+
+COMPANY_NAMES = {"company1": "Tulero", "company2": "Tyre24"}
+
+PATH_OPTIONS = [
+    # (argument, config key)
+    ("articles", "articles_file"),
+    ("warehouse", "warehouse_file"),
+    ("oem_folder", "oem_folder"),
+    ("brands", "brands_file"),
+    ("tecdoc", "tecdoc_file"),
+    ("output", "output_folder"),
+]
+# All a --quantities-only run reads
+QUANTITIES_PATH_KEYS = ["articles_file", "output_folder"]
+PRICING_OPTIONS = [
+    ("company1_markup", "company1_markup"),
+    ("company1_shipping", "company1_shipping"),
+]
+# --company2-markup MARKET=VALUE, --company2-shipping MARKET=VALUE
+MARKET_OPTIONS = [("company2_markup", "markup"), ("company2_shipping", "shipping")]
+# The options of the markets before company2_markets, e.g. --company2-markup-it
+LEGACY_MARKET_OPTIONS = ["it", "de"]
+
+
+def print_line(text, file=sys.stdout):
+    # One write per line, the uploads report from other threads
+    file.write(text + "\n")
+    file.flush()
+
+
+def markup(value):
+    """Parses a markup given as a multiplier ("1.19") or a percentage ("19%")."""
+    text = value.strip()
+    try:
+        if text.endswith("%"):
+            return round(1 + float(text[:-1]) / 100.0, 4)
+        return float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid markup: {value!r}")
+
+
+def shipping(value):
+    try:
+        return float(value.strip().replace("€", ""))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shipping cost: {value!r}")
+
+
+def market_value(parse, market=None):
+    """
+    Returns a parser of "MARKET=VALUE" into (market, parse(VALUE)), or of
+    VALUE into (market, parse(VALUE)) when market is given.
+    """
+
+    def parse_market_value(value):
+        if market is not None:
+            return market, parse(value)
+        name, separator, text = value.partition("=")
+        if not separator or not name.strip():
+            raise argparse.ArgumentTypeError(f"expected MARKET=VALUE: {value!r}")
+        return name.strip(), parse(text)
+
+    return parse_market_value
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Process the stock files and upload the marketplace CSVs."
+    )
+    parser.add_argument("--config", default=CONFIG_FILE, help="path of config.json")
+    parser.add_argument(
+        "--quantities-only",
+        action="store_true",
+        help="only refresh GIACENZA from the articles file in the CSVs of the "
+        "last full run",
+    )
+
+    parser.add_argument(
+        "--scenarios",
+        metavar="FILE",
+        help="compare the pricing scenarios of a JSON file, e.g. "
+        '[{"name": "low", "company1_markup": 1.15}]: writes their CSVs and a '
+        "summary in the scenarios folder of the output folder, uploads nothing",
+    )
+    parser.add_argument(
+        "--summary-only",
+        action="store_true",
+        help="with --scenarios, only write the summary",
+    )
+
+    paths = parser.add_argument_group("paths (default: config.json)")
+    paths.add_argument("--articles", help="articles Excel file")
+    paths.add_argument("--warehouse", help="warehouse Excel file")
+    paths.add_argument("--oem-folder", help="folder with the oemsDC*.csv files")
+    paths.add_argument("--brands", help="brands CSV file")
+    paths.add_argument("--tecdoc", help="TecDoc brand ID CSV file")
+    paths.add_argument("--output", help="output folder")
+
+    pricing = parser.add_argument_group(
+        "pricing (default: config.json), markups as 1.19 or 19%"
+    )
+    pricing.add_argument("--company1-markup", type=markup)
+    pricing.add_argument("--company1-shipping", type=shipping)
+    pricing.add_argument(
+        "--company2-markup",
+        metavar="MARKET=VALUE",
+        action="append",
+        type=market_value(markup),
+        help="markup of a market of company2_markets, e.g. fr=22%%; repeatable",
+    )
+    pricing.add_argument(
+        "--company2-shipping",
+        metavar="MARKET=VALUE",
+        action="append",
+        type=market_value(shipping),
+        help="shipping cost of a market of company2_markets, e.g. fr=9.5",
+    )
+    for market in LEGACY_MARKET_OPTIONS:
+        pricing.add_argument(
+            f"--company2-markup-{market}",
+            dest="company2_markup",
+            action="append",
+            type=market_value(markup, market),
+            help=argparse.SUPPRESS,
+        )
+        pricing.add_argument(
+            f"--company2-shipping-{market}",
+            dest="company2_shipping",
+            action="append",
+            type=market_value(shipping, market),
+            help=argparse.SUPPRESS,
+        )
+
+    upload = parser.add_argument_group("upload (default: config.json)")
+    upload.add_argument(
+        "--upload-company1", action=argparse.BooleanOptionalAction, default=None
+    )
+    upload.add_argument(
+        "--upload-company2", action=argparse.BooleanOptionalAction, default=None
+    )
+    upload.add_argument(
+        "--no-upload", action="store_true", help="only process, upload nothing"
+    )
+    upload.add_argument(
+        "--force-upload",
+        action="store_true",
+        help="upload the files even when they did not change since the last upload",
+    )
+    upload.add_argument(
+        "--stream-upload",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="upload the CSVs while they are written (ftp_stream_uploads)",
+    )
+
+    parser.add_argument(
+        "--compression",
+        choices=["none", "gzip", "zip"],
+        help="write (and upload) the CSVs compressed (default: output_compression)",
+    )
+    parser.add_argument(
+        "--delta",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="also write the rows added/changed/removed since the last run "
+        "(delta_feed)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="only process again the Tulero rows changed since the last run "
+        "(incremental_processing)",
+    )
+    parser.add_argument(
+        "--cross-components",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="cross codes from the connected components of the OE numbers, of "
+        "at most cross_reference_max_component products "
+        "(cross_reference_components)",
+    )
+    parser.add_argument(
+        "--canonical-oe",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="compare the OE numbers without punctuation and case in the cross "
+        "codes (canonical_oe_numbers)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="processes preparing the Tulero rows of large catalogs, 0: one per "
+        "CPU core (default: company1_workers)",
+    )
+    parser.add_argument(
+        "--out-of-core",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="process the catalog in chunks spilled to disk, for catalogs larger "
+        "than the memory (out_of_core_processing)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="memory of the out-of-core processing (default: out_of_core_memory_mb)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(DATAFRAME_BACKENDS),
+        help="dataframe engine of the merge and the Tulero/Tyre24 processing "
+        "(default: dataframe_backend)",
+    )
+    parser.add_argument(
+        "--checkpoints",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="save every stage, so that a failed run resumes after the last "
+        "stage done (stage_checkpoints)",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["off", "sampling"],
+        help="profile the processing (default: config.json/WEBSTOCK_PROFILE)",
+    )
+    return parser.parse_args(argv)
+
+
+def build_run_settings(args, config):
+    """Merges config.json with the command-line overrides."""
+    paths = {
+        key: getattr(args, name) or config.get(key) for name, key in PATH_OPTIONS
+    }
+
+    inputs = pricing_inputs_from_config(config)
+    for name, key in PRICING_OPTIONS:
+        value = getattr(args, name)
+        if value is not None:
+            inputs[key] = value
+    markets = {market.get("market"): market for market in inputs["company2_markets"]}
+    for name, key in MARKET_OPTIONS:
+        for market, value in getattr(args, name) or []:
+            if market in markets:
+                markets[market][key] = value
+
+    upload_company1 = config.get("upload_company1", True)
+    upload_company2 = config.get("upload_company2", True)
+    if args.upload_company1 is not None:
+        upload_company1 = args.upload_company1
+    if args.upload_company2 is not None:
+        upload_company2 = args.upload_company2
+    if args.no_upload:
+        upload_company1 = upload_company2 = False
+
+    return paths, inputs, upload_company1, upload_company2
+
+
+def market_option_errors(args, markets):
+    """Returns the --company2-markup/--company2-shipping of unknown markets."""
+    known = {market.get("market") for market in markets}
+    return [
+        f"unknown market in --{name.replace('_', '-')}: {market} "
+        f"(company2_markets has {', '.join(sorted(map(str, known)))})"
+        for name, _key in MARKET_OPTIONS
+        for market, _value in getattr(args, name) or []
+        if market not in known
+    ]
+
+
+def validate_settings(
+    paths, upload_company1, upload_company2, config, quantities_only=False
+):
+    """Returns a list of problems that prevent the run."""
+    errors = []
+    if not quantities_only:
+        markets = pricing_inputs_from_config(config)["company2_markets"]
+        errors += [f"config.json: {error}" for error in market_table_errors(markets)]
+    for name, key in PATH_OPTIONS:
+        if quantities_only and key not in QUANTITIES_PATH_KEYS:
+            continue
+        option = "--" + name.replace("_", "-")
+        if not paths[key]:
+            errors.append(f"missing {key} (set it in config.json or with {option})")
+        elif key != "output_folder" and not os.path.exists(paths[key]):
+            errors.append(f"{key} not found: {paths[key]}")
+
+    uploads = [("company1", upload_company1), ("company2", upload_company2)]
+    for company, enabled in uploads:
+        ftp_info = ftp_info_from_config(config, company)
+        if enabled and not all(ftp_info.values()):
+            errors.append(f"{company} FTP info is incomplete in config.json")
+
+    compression = config.get("output_compression", "none")
+    if compression not in ["none", "gzip", "zip"]:
+        errors.append(f"unknown output_compression in config.json: {compression}")
+    if not quantities_only:
+        errors += dataframe_backend_errors(dataframe_backend_from_config(config))
+    return errors
+
+
+def run(args):
+    config = load_config(args.config)
+    if args.compression is not None:
+        config["output_compression"] = args.compression
+    if args.cross_components is not None:
+        config["cross_reference_components"] = args.cross_components
+    if args.canonical_oe is not None:
+        config["canonical_oe_numbers"] = args.canonical_oe
+    if args.workers is not None:
+        config["company1_workers"] = args.workers
+    if args.out_of_core is not None:
+        config["out_of_core_processing"] = args.out_of_core
+    if args.memory_budget is not None:
+        config["out_of_core_memory_mb"] = args.memory_budget
+    if args.backend is not None:
+        config["dataframe_backend"] = args.backend
+    paths, inputs, upload_company1, upload_company2 = build_run_settings(args, config)
+    if args.scenarios:
+        upload_company1 = upload_company2 = False  # Only compared
+
+    errors = validate_settings(
+        paths, upload_company1, upload_company2, config, args.quantities_only
+    )
+    errors += market_option_errors(args, inputs["company2_markets"])
+    if errors:
+        for error in errors:
+            print(f"error: {error}", file=sys.stderr)
+        return EXIT_INVALID_INPUT
+
+    # Imported here so that --help and invalid arguments return at once
+    from data_processing.delta_feed import format_delta_counts
+    from data_processing.ignored_brands import IGNORED_BRANDS
+    from utility.ftp_utils import output_file_name, output_uploader_from_config
+
+    output_folder = paths["output_folder"]
+    os.makedirs(output_folder, exist_ok=True)
+    compression = config.get("output_compression", "none")
+    company1_output = os.path.join(
+        output_folder, output_file_name("company1", compression)
+    )
+    company2_output = os.path.join(
+        output_folder, output_file_name("company2", compression)
+    )
+    if args.scenarios:
+        return run_scenarios(
+            args,
+            paths,
+            inputs,
+            company1_output,
+            company2_output,
+            max_component_size_from_config(config),
+            config.get("canonical_oe_numbers", False),
+            company1_workers_from_config(config),
+        )
+    delta = config.get("delta_feed", False) if args.delta is None else args.delta
+    incremental = config.get("incremental_processing", False)
+    if args.incremental is not None:
+        incremental = args.incremental
+    checkpoint = config.get("stage_checkpoints", False)
+    if args.checkpoints is not None:
+        checkpoint = args.checkpoints
+    profiling_mode = args.profile or get_profiling_mode(config)
+
+    if args.stream_upload is not None:
+        config["ftp_stream_uploads"] = args.stream_upload
+    if args.force_upload:
+        config["ftp_skip_unchanged"] = False
+    # Each file is uploaded as soon as it is written, the results of the
+    # uploads are printed as they finish
+    uploader = output_uploader_from_config(
+        config,
+        output_folder,
+        ftp_info_from_config(config, "company1"),
+        ftp_info_from_config(config, "company2"),
+        upload_company1=upload_company1,
+        upload_company2=upload_company2,
+        progress=lambda company, message: print_line(message),
+    )
+
+    write_csv = uploader.write_csv if uploader else None
+    file_written = uploader.file_written if uploader else None
+    start = time.perf_counter()
+    try:
+        with profile_run(
+            profiling_mode, output_folder, get_profiling_interval(config)
+        ):
+            if args.quantities_only:
+                from data_processing.quantity_refresh import refresh_quantities
+
+                deltas = refresh_quantities(
+                    paths["articles_file"],
+                    company1_output,
+                    company2_output,
+                    write_csv=write_csv,
+                    delta=delta,
+                )
+            else:
+                from data_processing.twin_data_processing import (
+                    main as main_processing_function,
+                )
+
+                deltas = main_processing_function(
+                    paths["articles_file"],
+                    paths["warehouse_file"],
+                    paths["tecdoc_file"],
+                    company1_output,
+                    company2_output,
+                    paths["brands_file"],
+                    paths["oem_folder"],
+                    IGNORED_BRANDS,
+                    inputs,
+                    write_csv=write_csv,
+                    delta=delta,
+                    incremental=incremental,
+                    checkpoint=checkpoint,
+                    max_component_size=max_component_size_from_config(config),
+                    canonical_oe=config.get("canonical_oe_numbers", False),
+                    company1_workers=company1_workers_from_config(config),
+                    memory_budget_mb=memory_budget_from_config(config),
+                    file_written=file_written,
+                    backend=dataframe_backend_from_config(config),
+                    quantity_base=config.get("quantity_refresh", False),
+                )
+    except Exception as e:
+        if uploader is not None:
+            uploader.abort()
+        print(f"Data processing failed: {e}", file=sys.stderr)
+        return EXIT_PROCESSING_FAILED
+    print_line(f"Processing completed in {time.perf_counter() - start:.1f} s.")
+    for company, counts in (deltas or {}).items():
+        print_line(f"{COMPANY_NAMES[company]} delta: {format_delta_counts(counts)}")
+
+    if uploader is None:
+        print("Processing completed successfully without uploads.")
+        return EXIT_OK
+
+    success, _messages = uploader.finish()
+    print_line(f"Finished in {time.perf_counter() - start:.1f} s.")
+    return EXIT_OK if success else EXIT_UPLOAD_FAILED
+
+
+def run_scenarios(
+    args,
+    paths,
+    inputs,
+    company1_output,
+    company2_output,
+    max_component_size=None,
+    canonical_oe=False,
+    company1_workers=1,
+):
+    from data_processing.ignored_brands import IGNORED_BRANDS
+    from data_processing.pricing_scenarios import (
+        complete_scenarios,
+        load_scenarios,
+        pricing_keys,
+    )
+
+    try:
+        scenarios = load_scenarios(args.scenarios)
+        keys = pricing_keys(inputs["company2_markets"])
+        # Markups can be given as in the options, e.g. "19%"
+        for scenario in scenarios:
+            for key, value in scenario.items():
+                if key in keys and isinstance(value, str):
+                    parse = markup if "markup" in key else shipping
+                    scenario[key] = parse(value)
+        scenarios = complete_scenarios(scenarios, inputs)
+    except (OSError, ValueError, TypeError, argparse.ArgumentTypeError) as e:
+        print(f"error: invalid scenarios: {e}", file=sys.stderr)
+        return EXIT_INVALID_INPUT
+
+    from data_processing.twin_data_processing import pricing_scenarios
+
+    start = time.perf_counter()
+    try:
+        summary = pricing_scenarios(
+            paths["articles_file"],
+            paths["warehouse_file"],
+            paths["tecdoc_file"],
+            company1_output,
+            company2_output,
+            paths["brands_file"],
+            paths["oem_folder"],
+            IGNORED_BRANDS,
+            scenarios,
+            summary_only=args.summary_only,
+            max_component_size=max_component_size,
+            canonical_oe=canonical_oe,
+            company1_workers=company1_workers,
+        )
+    except Exception as e:
+        print(f"Data processing failed: {e}", file=sys.stderr)
+        return EXIT_PROCESSING_FAILED
+    print_line(
+        f"{len(summary)} scenarios priced in {time.perf_counter() - start:.1f} s."
+    )
+    for _, row in summary.iterrows():
+        revenues = ", ".join(
+            f"{row['company2_revenue_' + market['market']]:.2f} EUR "
+            f"({market['market'].upper()})"
+            for market in inputs["company2_markets"]
+        )
+        print_line(
+            f"{row['name']}: {COMPANY_NAMES['company1']} {row['company1_rows']} "
+            f"rows, {row['company1_revenue']:.2f} EUR; {COMPANY_NAMES['company2']} "
+            f"{row['company2_rows']} rows, {revenues}"
+        )
+    return EXIT_OK
+
+
+def main(argv=None):
+    return run(parse_arguments(argv))
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# data_processing/cancellation.py
+#
+# Cooperative cancellation of a run. The GUI cancels the CancellationToken of
+# the running Worker; the stages check it between them and in their long
+# loops (sheets, cross codes, brand matching) and stop with
+# ProcessingCancelled. The pandarallel workers get a pickled copy of the
+# token, which cannot see the flag of the GUI's one: cancel() also creates a
+# marker file that the copies check, so that every worker stops at its next
+# row and the pool exits on its own instead of being killed.
+
+import os
+import tempfile
+import uuid
+
+
+class ProcessingCancelled(Exception):
+    """Raised by CancellationToken.check once the run is cancelled."""
+
+
+class CancellationToken:
+    def __init__(self):
+        self.cancelled = False
+        self.remote = False  # A copy in a worker process
+        self.marker_path = os.path.join(
+            tempfile.gettempdir(), f"webstock-cancel-{uuid.uuid4().hex}"
+        )
+
+    def __getstate__(self):
+        return {"marker_path": self.marker_path}
+
+    def __setstate__(self, state):
+        self.cancelled = False
+        self.remote = True
+        self.marker_path = state["marker_path"]
+
+    def cancel(self):
+        self.cancelled = True
+        with open(self.marker_path, "w"):
+            pass
+
+    def is_cancelled(self):
+        if self.remote and not self.cancelled:
+            self.cancelled = os.path.exists(self.marker_path)
+        return self.cancelled
+
+    def check(self):
+        if self.is_cancelled():
+            raise ProcessingCancelled("Processing cancelled")
+
+    def close(self):
+        """Deletes the marker file, once the run is over."""
+        if not self.remote and os.path.exists(self.marker_path):
+            os.remove(self.marker_path)
+
+
+def check_cancelled(cancel_token):
+    """Raises ProcessingCancelled if cancel_token (None: no token) is cancelled."""
+    if cancel_token is not None:
+        cancel_token.check()
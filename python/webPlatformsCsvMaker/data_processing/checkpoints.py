@@ -0,0 +1,150 @@
+# data_processing/checkpoints.py
+#
+# Stage checkpoints. The result of every stage of a run (cleaned workbooks,
+# merged rows, OEM lookup, Tulero and Tyre24 frames) is saved in the
+# .checkpoints folder of the output folder, named after a key made of the
+# fingerprints of its inputs (files, prices, ignored brands). When a run fails,
+# e.g. in the cross codes, the retry loads the stages already done instead of
+# parsing the workbooks again. The frames are saved as Parquet when pyarrow is
+# installed, as pickle otherwise (or when a column mixes types). A successful
+# run deletes its checkpoints; a failed one those of the earlier runs.
+
+import hashlib
+import importlib.util
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+CHECKPOINT_FOLDER = ".checkpoints"
+# Change it when a stage gives a different result, so that the checkpoints of
+# an older version are not loaded
+CHECKPOINT_VERSION = 1
+PARQUET = importlib.util.find_spec("pyarrow") is not None
+EXTENSIONS = [".parquet", ".pkl"]
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return os.path.basename(path), stat.st_size, stat.st_mtime_ns
+
+
+def oem_folder_fingerprint(old_oems_folder):
+    # The files load_oem_lookup reads
+    return sorted(
+        file_fingerprint(os.path.join(old_oems_folder, file))
+        for file in os.listdir(old_oems_folder)
+        if file.startswith("oemsDC") and file.endswith(".csv")
+    )
+
+
+def stage_key(*parts):
+    """Returns a short hash of parts (fingerprints, prices...)."""
+    text = repr((CHECKPOINT_VERSION,) + parts)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def oem_lookup_to_frame(oem_lookup):
+    keys = list(oem_lookup)
+    return pd.DataFrame(
+        {
+            "article_altc": [key[0] for key in keys],
+            "brand_prefix": [key[1] for key in keys],
+            # vectorized_get_oem_number joins them anyway
+            "oem_numbers": [" | ".join(oem_lookup[key]) for key in keys],
+        }
+    )
+
+
+def oem_lookup_from_frame(df):
+    return {
+        (article, prefix): [numbers]
+        for article, prefix, numbers in zip(
+            df["article_altc"], df["brand_prefix"], df["oem_numbers"]
+        )
+    }
+
+
+def write_frame(df, path):
+    """Writes df to path + ".parquet", or to path + ".pkl" without pyarrow."""
+    if PARQUET:
+        temporary_path = path + ".parquet.tmp"
+        try:
+            df.to_parquet(temporary_path)
+            os.replace(temporary_path, path + ".parquet")
+            return
+        except Exception:
+            # e.g. ints and strings in the same column
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+    temporary_path = path + ".pkl.tmp"
+    df.to_pickle(temporary_path)
+    os.replace(temporary_path, path + ".pkl")
+
+
+def read_frame(path):
+    """Returns the frame write_frame(df, path) wrote, None when there is none."""
+    if os.path.exists(path + ".parquet") and PARQUET:
+        df = pd.read_parquet(path + ".parquet")
+        # Parquet gives None for the missing strings
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].where(df[column].notna(), np.nan)
+        return df
+    if os.path.exists(path + ".pkl"):
+        return pd.read_pickle(path + ".pkl")
+    return None
+
+
+class StageCheckpoints:
+    """The checkpoints of a run, in output_folder/.checkpoints."""
+
+    def __init__(self, output_folder):
+        self.folder = os.path.join(output_folder, CHECKPOINT_FOLDER)
+        self.used = set()
+        self.lock = threading.Lock()  # The two branches run in threads
+
+    def run(self, stage, key, compute, to_frame=None, from_frame=None):
+        """
+        Returns the saved result of stage for key, or computes and saves it.
+        A result that is not a DataFrame is saved as to_frame(result) and
+        loaded with from_frame.
+        """
+        name = f"{stage}-{key}"
+        path = os.path.join(self.folder, name)
+        with self.lock:
+            self.used.update(name + extension for extension in EXTENSIONS)
+        try:
+            df = read_frame(path)
+        except Exception:
+            df = None  # e.g. cut short by a crash, computed again
+        if df is not None:
+            return from_frame(df) if from_frame else df
+
+        result = compute()
+        os.makedirs(self.folder, exist_ok=True)
+        write_frame(to_frame(result) if to_frame else result, path)
+        return result
+
+    def collect_garbage(self, succeeded):
+        """
+        Deletes the checkpoints of the earlier runs, and those of this run when
+        it succeeded.
+        """
+        if not os.path.isdir(self.folder):
+            return
+        for name in os.listdir(self.folder):
+            if succeeded or name not in self.used:
+                os.remove(os.path.join(self.folder, name))
+        if succeeded:
+            os.rmdir(self.folder)
+
+
+class NoCheckpoints:
+    """Runs the stages without saving them."""
+
+    def run(self, stage, key, compute, to_frame=None, from_frame=None):
+        return compute()
+
+    def collect_garbage(self, succeeded):
+        pass
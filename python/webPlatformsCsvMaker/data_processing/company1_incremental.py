@@ -0,0 +1,350 @@
+# data_processing/company1_incremental.py
+#
+# Incremental Tulero processing. When the workbooks change only partly, only
+# the merged rows that changed are processed again (OEM lookup, cross codes,
+# brands, prices), with the rows whose cross codes depend on them:
+# - the rows with the same CODICE OE, which optimized_cross_code_generation
+#   groups together;
+# - the rows without OE numbers whose code is one of their OE numbers, see
+#   find_additional_cross_codes.
+# The other rows are taken from the output of the last run. Every run keeps
+# the fingerprint, CODICE OE and output of each merged row next to the CSV
+# (company1_output.rows.pkl), and the OEM numbers of the oemsDC files
+# (company1_output.oems.pkl) so that they are not read again. A change of the
+# OEM files, the brands file, the ignored brands or the prices makes a full
+# run.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cancellation import check_cancelled
+from .checkpoints import file_fingerprint, oem_folder_fingerprint
+from .company1_processing import (
+    complete_company1_rows,
+    load_oem_lookup,
+    prepare_company1_rows,
+    vectorized_get_oem_number,
+)
+from .output_paths import incremental_state_path, oem_lookup_path
+
+STATE_VERSION = 1
+# Above this share of changed rows a full run is as fast
+MAX_CHANGED_FRACTION = 0.5
+UNKNOWN_OE = "Unknown OE"
+ROW_COLUMN = "_row"  # Position of an output row in merged_df
+
+
+def run_settings(
+    old_oems_folder, brands_file_path, ignored_brands, markup, shipping_cost
+):
+    """Everything the output depends on besides the merged rows."""
+    return {
+        "version": STATE_VERSION,
+        "oems": oem_folder_fingerprint(old_oems_folder),
+        "brands": file_fingerprint(brands_file_path),
+        "ignored_brands": sorted(ignored_brands),
+        "markup": markup,
+        "shipping_cost": shipping_cost,
+    }
+
+
+def row_keys(merged_df):
+    """Returns the hash of every merged row and its occurrence among equal rows."""
+    hashes = pd.util.hash_pandas_object(merged_df, index=False).to_numpy()
+    # Numbers the identical rows, so that they are paired in order
+    occurrences = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+    return hashes, occurrences
+
+
+def row_products(merged_df):
+    """CODICE PRODOTTO and BRAND, stripped as prepare_company1_rows does."""
+    return pd.DataFrame(
+        {
+            column: merged_df[column].astype(str).str.strip().to_numpy()
+            for column in ["CODICE PRODOTTO", "BRAND"]
+        }
+    )
+
+
+def _write_pickle(value, path):
+    temporary_path = path + ".tmp"
+    pd.to_pickle(value, temporary_path)
+    os.replace(temporary_path, path)
+
+
+def _read_pickle(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_pickle(path)
+    except Exception:
+        # e.g. written by another version of pandas: a full run rewrites it
+        return None
+
+
+def save_oem_numbers(oem_lookup, fingerprint, output_path):
+    keys = list(oem_lookup)
+    numbers = pd.Series(
+        [" | ".join(oem_lookup[key]) for key in keys],
+        index=pd.MultiIndex.from_arrays(
+            [[key[0] for key in keys], [key[1] for key in keys]]
+        ),
+        dtype=object,
+    )
+    saved = {"oems": fingerprint, "numbers": numbers}
+    _write_pickle(saved, oem_lookup_path(output_path))
+
+
+def load_oem_numbers(fingerprint, output_path):
+    """Returns the joined OEM numbers by (article, brand prefix), or None."""
+    saved = _read_pickle(oem_lookup_path(output_path))
+    if saved is None or saved["oems"] != fingerprint:
+        return None
+    return saved["numbers"]
+
+
+def oem_lookup_for(numbers, products):
+    """The part of the load_oem_lookup dictionary that products look up."""
+    keys = pd.MultiIndex.from_arrays(
+        [products["CODICE PRODOTTO"], products["BRAND"].str[:5]]
+    )
+    found = numbers.reindex(keys).to_numpy()
+    return {key: [value] for key, value in zip(keys, found) if isinstance(value, str)}
+
+
+def _process_rows(
+    merged_df,
+    oem_lookup,
+    brands_file_path,
+    ignored_brands,
+    markup,
+    shipping_cost,
+    references=None,
+    parallel=True,
+    cancel_token=None,
+):
+    """
+    Returns the rows as process_company1 does, with the CODICE PRODOTTO,
+    BRAND and CODICE OE of every merged row before the brands are renamed.
+    """
+    prepared = prepare_company1_rows(merged_df, oem_lookup, ignored_brands, markup)
+    # Copied, the next steps change the columns in place
+    products = pd.DataFrame(
+        {
+            "code": prepared["CODICE PRODOTTO"].to_numpy(copy=True),
+            "brand": prepared["BRAND"].to_numpy(copy=True),
+            "oe": prepared["CODICE OE"].to_numpy(copy=True),
+        }
+    )
+    result = complete_company1_rows(
+        prepared,
+        brands_file_path,
+        ignored_brands,
+        shipping_cost,
+        references,
+        parallel,
+        cancel_token,
+    )
+    return products, result
+
+
+def _cross_code_references(code, brand, oe, contributor, searched_codes):
+    """
+    The rows find_additional_cross_codes can match for searched_codes, in
+    merged order: the rows with OE numbers among which one of the codes is.
+    """
+    if any(searched == "" or " " in searched for searched in searched_codes):
+        # Can match across the " | " separators
+        mask = contributor
+    else:
+        oes = pd.Series(pd.unique(oe[contributor]), dtype=object)
+        words = oes.str.split(" ").explode()
+        matching_oes = oes[np.unique(words.index[words.isin(searched_codes)])]
+        mask = contributor & pd.Series(oe).isin(matching_oes).to_numpy()
+    references = pd.DataFrame(
+        {"CODICE PRODOTTO": code[mask], "BRAND": brand[mask], "CODICE OE": oe[mask]}
+    )
+    references["padded_oe"] = " " + references["CODICE OE"].str.strip() + " "
+    return references
+
+
+def _drop_moved_rows(positions, limit):
+    """
+    Sets to -1 the last positions of the rows that moved among the others,
+    e.g. a copy of a row inserted before it, so that the rows kept from the
+    last run are in the same order: the order of the cross codes is.
+    """
+    positions = positions.copy()
+    while (positions < 0).sum() <= limit:
+        matched = np.flatnonzero(positions >= 0)
+        descents = np.flatnonzero(np.diff(positions[matched]) < 0)
+        if not len(descents):
+            break
+        positions[matched[descents]] = -1
+        positions[matched[descents + 1]] = -1
+    return positions
+
+
+def _process_changes(
+    merged_df,
+    hashes,
+    occurrences,
+    state,
+    numbers,
+    brands_file_path,
+    ignored_brands,
+    markup,
+    shipping_cost,
+    cancel_token=None,
+):
+    """
+    Returns the rows table and the output of the new run, processing again
+    only what changed since state. None when a full run is needed.
+    """
+    old = state["rows"]
+    old_keys = pd.MultiIndex.from_arrays([old["hash"], old["occurrence"]])
+    positions = old_keys.get_indexer(pd.MultiIndex.from_arrays([hashes, occurrences]))
+    limit = MAX_CHANGED_FRACTION * len(merged_df)
+    positions = _drop_moved_rows(positions, limit)
+    changed = positions < 0
+    kept = positions[~changed]
+    removed = np.ones(len(old), dtype=bool)
+    removed[kept] = False
+    if changed.sum() + removed.sum() > limit:
+        return None
+
+    # CODICE PRODOTTO, BRAND and CODICE OE of all the rows
+    changed_products = row_products(merged_df[changed])
+    changed_values = {
+        "code": changed_products["CODICE PRODOTTO"].to_numpy(),
+        "brand": changed_products["BRAND"].to_numpy(),
+        "oe": [],
+    }
+    if changed.any():
+        changed_values["oe"] = vectorized_get_oem_number(
+            changed_products, oem_lookup_for(numbers, changed_products), ignored_brands
+        )
+    columns = {}
+    for column, new_values in changed_values.items():
+        values = np.empty(len(merged_df), dtype=object)
+        values[~changed] = old[column].to_numpy()[kept]
+        values[changed] = new_values
+        columns[column] = values
+    code, brand, oe = columns["code"], columns["brand"], columns["oe"]
+
+    # Rows with OE numbers are the cross codes of the others
+    ignored = pd.Series(brand).isin(ignored_brands).to_numpy()
+    contributor = (oe != UNKNOWN_OE) & ~ignored
+    unknown = (oe == UNKNOWN_OE) & ~ignored
+    old_oe = old["oe"].to_numpy()
+    old_ignored = old["brand"].isin(ignored_brands).to_numpy()
+    old_contributor = (old_oe != UNKNOWN_OE) & ~old_ignored
+    changed_oes = set(oe[changed & contributor]) | set(
+        old_oe[removed & old_contributor]
+    )
+    changed_words = {word for value in changed_oes for word in value.split(" ")}
+
+    # The changed rows, their CODICE OE groups and the rows without OE
+    # numbers they can be a cross code of
+    recompute = changed | (contributor & pd.Series(oe).isin(changed_oes).to_numpy())
+    unknown_codes = pd.Series(code[unknown], dtype=object)
+    affected = unknown_codes.isin(changed_words)
+    if changed_oes:
+        affected |= (unknown_codes == "") | unknown_codes.str.contains(" ", regex=False)
+    recompute[np.flatnonzero(unknown)[affected.to_numpy()]] = True
+
+    rows = pd.DataFrame({"hash": hashes, "occurrence": occurrences, **columns})
+    output = state["output"]
+    # Positions of the last output rows in merged_df, -1 when removed
+    new_positions = np.full(len(old), -1)
+    new_positions[kept] = np.flatnonzero(~changed)
+    cached_rows = new_positions[output[ROW_COLUMN].to_numpy()]
+    reuse = cached_rows >= 0
+    reuse[reuse] = ~recompute[cached_rows[reuse]]
+    parts = [output[reuse].assign(**{ROW_COLUMN: cached_rows[reuse]})]
+
+    if recompute.any():
+        references = _cross_code_references(
+            code, brand, oe, contributor, set(code[recompute & unknown])
+        )
+        recompute_df = merged_df[recompute].copy()
+        _products, result = _process_rows(
+            recompute_df,
+            oem_lookup_for(numbers, row_products(recompute_df)),
+            brands_file_path,
+            ignored_brands,
+            markup,
+            shipping_cost,
+            references,
+            parallel=False,  # Few rows, starting the workers takes longer
+            cancel_token=cancel_token,
+        )
+        row_positions = merged_df.index.get_indexer(result.index)
+        parts.append(result.assign(**{ROW_COLUMN: row_positions}))
+
+    parts = [part for part in parts if len(part)] or parts[:1]
+    output = pd.concat(parts).sort_values(ROW_COLUMN, kind="stable")
+    return rows, output.reset_index(drop=True)
+
+
+def process_company1_incremental(
+    merged_df,
+    brands_file_path,
+    old_oems_folder,
+    ignored_brands,
+    markup,
+    shipping_cost,
+    output_path,  # The Tulero CSV, the state is kept next to it
+    cancel_token=None,  # See cancellation
+):
+    """
+    Returns the same as process_company1, processing again only the rows
+    that changed since the last run for output_path.
+    """
+    settings = run_settings(
+        old_oems_folder, brands_file_path, ignored_brands, markup, shipping_cost
+    )
+    hashes, occurrences = row_keys(merged_df)
+    state = _read_pickle(incremental_state_path(output_path))
+    numbers = load_oem_numbers(settings["oems"], output_path)
+
+    update = None
+    if state is not None and state["settings"] == settings and numbers is not None:
+        update = _process_changes(
+            merged_df,
+            hashes,
+            occurrences,
+            state,
+            numbers,
+            brands_file_path,
+            ignored_brands,
+            markup,
+            shipping_cost,
+            cancel_token,
+        )
+    if update is None:
+        oem_lookup = load_oem_lookup(old_oems_folder)
+        save_oem_numbers(oem_lookup, settings["oems"], output_path)
+        check_cancelled(cancel_token)
+        products, result = _process_rows(
+            merged_df,
+            oem_lookup,
+            brands_file_path,
+            ignored_brands,
+            markup,
+            shipping_cost,
+            cancel_token=cancel_token,
+        )
+        rows = products.assign(hash=hashes, occurrence=occurrences)
+        row_positions = merged_df.index.get_indexer(result.index)
+        output = result.assign(**{ROW_COLUMN: row_positions}).reset_index(drop=True)
+    else:
+        rows, output = update
+
+    saved = {"settings": settings, "rows": rows, "output": output}
+    _write_pickle(saved, incremental_state_path(output_path))
+    result = output.drop(columns=[ROW_COLUMN])
+    result.index = merged_df.index[output[ROW_COLUMN].to_numpy()]
+    return result
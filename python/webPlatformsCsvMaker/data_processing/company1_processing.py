@@ -1,11 +1,22 @@
+import multiprocessing
 import os
 
+from .cancellation import check_cancelled
+from .cross_references import component_cross_codes
+from .oe_keys import oe_cross_codes, oe_group_keys
+from .pricing import MINIMUM_PRICE, cost_base, round_cents, round_prices
+
 # Set to True for development, False for production
 DEBUG_MODE = False
 
 if DEBUG_MODE:
     from tqdm import tqdm
 
+# Rows of a shard at least, see prepare_company1_shards: on fewer rows
+# starting the worker processes takes longer than preparing them
+MIN_SHARD_ROWS = 250000
+CANCEL_POLL_SECONDS = 0.5
+
 
 def vectorized_get_oem_number(df, oem_lookup, IGNORED_BRANDS):
     import numpy as np
@@ -51,56 +62,104 @@ def update_brands(df_output, brands_file_path):
     return df_output
 
 
-def optimized_cross_code_generation(cleaned_df, ignored_brands):
+def optimized_cross_code_generation(
+    cleaned_df, ignored_brands, cancel_token=None, canonical_oe=False
+):
+    import numpy as np
     import pandas as pd
 
-    cross_references = {}
-    iterrows = (
-        tqdm(
-            cleaned_df.iterrows(), total=len(cleaned_df), desc="Generating cross codes"
+    # The products of each CODICE OE group, by integer key (see oe_keys)
+    contributor = (cleaned_df["CODICE OE"] != "Unknown OE") & (
+        ~cleaned_df["BRAND"].isin(ignored_brands)
+    )
+    groups = oe_group_keys(
+        cleaned_df.loc[contributor, "CODICE OE"].to_numpy(), canonical_oe
+    )
+    products = cleaned_df.loc[contributor, "CODICE PRODOTTO"].to_numpy()
+    check_cancelled(cancel_token)
+
+    # The cross codes of each group were set with Series.update, which aligns
+    # the codes with the labels of the index: only a row whose label is one of
+    # the codes gets them, from the last group with that code
+    labelled = pd.Series(products).isin(cleaned_df.index).to_numpy()
+    last_groups = dict(zip(products[labelled], groups[labelled]))
+    cross_codes = {}
+    for product, group in last_groups.items():
+        check_cancelled(cancel_token)
+        cross_codes[product] = " | ".join(
+            code for code in products[groups == group] if code != product
         )
-        if DEBUG_MODE
-        else cleaned_df.iterrows()
+
+    return pd.Series(
+        np.asarray(cleaned_df.index.map(cross_codes).fillna(""), dtype=object),
+        index=cleaned_df.index,
     )
 
-    for _, row in iterrows:
-        codice_oe = row["CODICE OE"]
-        codice_prodotto = row["CODICE PRODOTTO"]
-        brand = row["BRAND"]
 
-        if codice_oe != "Unknown OE" and brand not in ignored_brands:
-            if codice_oe not in cross_references:
-                cross_references[codice_oe] = []
-            cross_references[codice_oe].append(codice_prodotto)
+def oem_file_names(old_oems_folder):
+    """The oemsDC files of the folder, in the order they are loaded."""
+    return [
+        file
+        for file in os.listdir(old_oems_folder)
+        if file.startswith("oemsDC") and file.endswith(".csv")
+    ]
 
-    cross_codes_series = pd.Series(index=cleaned_df.index, dtype=str)
 
-    if DEBUG_MODE:
-        for codice_oe, prodotti in tqdm(
-            cross_references.items(), desc="Updating CODICI CROSS"
-        ):
-            cross_codes = {
-                prodotto: " | ".join([code for code in prodotti if code != prodotto])
-                for prodotto in prodotti
-            }
-            cross_codes_series.update(pd.Series(cross_codes))
-    else:
-        for codice_oe, prodotti in cross_references.items():
-            cross_codes = {
-                prodotto: " | ".join([code for code in prodotti if code != prodotto])
-                for prodotto in prodotti
-            }
-            cross_codes_series.update(pd.Series(cross_codes))
+def clean_oem_rows(oems_df):
+    """Returns the article_altc, oem_number and brand_prefix of oemsDC rows."""
+    oems_df["article_altc"] = oems_df["article_altc"].astype(str).str.strip()
+    oems_df["oem_number"] = (
+        oems_df["oem_number"].astype(str).str.strip().str.replace(" ", "")
+    )
+    oems_df["article_alt_brands"] = (
+        oems_df["article_alt_brands"].astype(str).str.strip()
+    )
+    oems_df["brand_prefix"] = oems_df["article_alt_brands"].str[:5]
+    return oems_df[["article_altc", "oem_number", "brand_prefix"]]
 
-    return cross_codes_series.fillna("")
 
+def load_oem_lookup(old_oems_folder):
+    """Returns {(article_altc, brand prefix): [oem_number, ...]} of the oemsDC files."""
+    import pandas as pd
 
-def process_company1(
-    merged_df, brands_file_path, old_oems_folder, ignored_brands, markup, shipping_cost
+    old_oems_files = oem_file_names(old_oems_folder)
+    all_oem_mappings = pd.DataFrame()
+
+    iter_old_oems_files = (
+        tqdm(old_oems_files, desc="Building old OEM mappings")
+        if DEBUG_MODE
+        else old_oems_files
+    )
+
+    for file_name in iter_old_oems_files:
+        file_path = os.path.join(old_oems_folder, file_name)
+        oems_df = pd.read_csv(file_path, dtype=str)
+        all_oem_mappings = pd.concat([all_oem_mappings, clean_oem_rows(oems_df)])
+
+    return (
+        all_oem_mappings.groupby(["article_altc", "brand_prefix"])["oem_number"]
+        .apply(list)
+        .to_dict()
+    )
+
+
+def prepare_company1_rows(
+    merged_df,
+    oem_lookup,
+    ignored_brands,
+    markup,
+    base=None,
+    oem_numbers=vectorized_get_oem_number,  # e.g. polars_backend.oem_numbers
 ):
-    import numpy as np
+    """
+    Adds CODICE OE and PREZZO to merged_df and puts it in the output columns.
+    base is pricing.cost_base(merged_df), computed when None.
+    """
     import pandas as pd
 
+    if base is None:
+        base = cost_base(merged_df)
+
     # print("process_company1 function started")
     # Proceed with the rest of the processing
     merged_df["CODICE OE"] = pd.NA
@@ -141,53 +200,16 @@ def process_company1(
     merged_df["CODICE PRODOTTO"] = merged_df["CODICE PRODOTTO"].str.strip()
     merged_df["BRAND"] = merged_df["BRAND"].str.strip()
 
-    old_oems_files = [
-        file
-        for file in os.listdir(old_oems_folder)
-        if file.startswith("oemsDC") and file.endswith(".csv")
-    ]
-    all_oem_mappings = pd.DataFrame()
-
-    iter_old_oems_files = (
-        tqdm(old_oems_files, desc="Building old OEM mappings")
-        if DEBUG_MODE
-        else old_oems_files
-    )
-
-    for file_name in iter_old_oems_files:
-        file_path = os.path.join(old_oems_folder, file_name)
-        oems_df = pd.read_csv(file_path, dtype=str)
-        oems_df["article_altc"] = oems_df["article_altc"].astype(str).str.strip()
-        oems_df["oem_number"] = (
-            oems_df["oem_number"].astype(str).str.strip().str.replace(" ", "")
-        )
-        oems_df["article_alt_brands"] = (
-            oems_df["article_alt_brands"].astype(str).str.strip()
-        )
-        oems_df["brand_prefix"] = oems_df["article_alt_brands"].str[:5]
-        all_oem_mappings = pd.concat(
-            [all_oem_mappings, oems_df[["article_altc", "oem_number", "brand_prefix"]]]
-        )
-
-    oem_lookup = (
-        all_oem_mappings.groupby(["article_altc", "brand_prefix"])["oem_number"]
-        .apply(list)
-        .to_dict()
-    )
-
     if DEBUG_MODE:
         tqdm.pandas(desc="Updating CODICE OE with old OEMs")
-        merged_df["CODICE OE"] = vectorized_get_oem_number(
-            merged_df, oem_lookup, ignored_brands
-        )
+        merged_df["CODICE OE"] = oem_numbers(merged_df, oem_lookup, ignored_brands)
     else:
-        merged_df["CODICE OE"] = vectorized_get_oem_number(
-            merged_df, oem_lookup, ignored_brands
-        )
+        merged_df["CODICE OE"] = oem_numbers(merged_df, oem_lookup, ignored_brands)
 
     # Update PREZZO based on PRZ. ULT. ACQ.
-    merged_df["PREZZO"] = merged_df["PRZ. ULT. ACQ."].apply(
-        lambda x: round(float(x) * markup, 2) if pd.notnull(x) else x
+    # round(cost * markup, 2) of every cost, NaN stays NaN
+    merged_df["PREZZO"] = round_cents(
+        base["cost"].loc[merged_df.index].to_numpy() * markup
     )
     merged_df.drop(columns=["PRZ. ULT. ACQ."], inplace=True)
 
@@ -213,28 +235,143 @@ def process_company1(
     ]
     merged_df = merged_df[columns_order]
     merged_df["CODICI CROSS"] = ""
+    return merged_df
 
-    # Apply optimized cross-code generation function
-    merged_df["CODICI CROSS"] = optimized_cross_code_generation(
-        merged_df, ignored_brands
-    )
 
+def shard_bounds(rows, workers):
+    """The (start, end) positions of the contiguous shards of rows, in order."""
+    import numpy as np
+
+    shards = max(1, min(workers, rows // MIN_SHARD_ROWS))
+    bounds = np.linspace(0, rows, shards + 1).astype(int).tolist()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def shard_oem_lookups(merged_df, oem_lookup, bounds):
+    """
+    The parts of oem_lookup that the rows of the shards (start, end) of
+    bounds look up, one dict per shard. All the rows are matched at once.
+    """
+    import pandas as pd
+
+    if not oem_lookup:
+        return [{} for _bounds in bounds]
+    codes = merged_df["CODICE PRODOTTO"].astype(str).str.strip()
+    prefixes = merged_df["BRAND"].astype(str).str.strip().str[:5]
+    row_keys = pd.MultiIndex.from_arrays([codes, prefixes])
+    found = row_keys.isin(pd.MultiIndex.from_tuples(list(oem_lookup)))
+    return [
+        {key: oem_lookup[key] for key in row_keys[start:end][found[start:end]]}
+        for start, end in bounds
+    ]
+
+
+def prepare_company1_shards(
+    merged_df,
+    oem_lookup,
+    ignored_brands,
+    markup,
+    base=None,  # pricing.cost_base(merged_df), computed when None
+    workers=1,  # Processes preparing the shards, 1: in this process
+    cancel_token=None,  # See cancellation
+):
+    """
+    Returns prepare_company1_rows of merged_df, preparing its shards (ranges
+    of rows, each with only its OEM numbers) in a pool of worker processes.
+    The preparation is row by row, so the shards are concatenated in order;
+    the cross codes link rows across all the OE groups and are added after.
+    The workers are terminated on cancellation and on the first error.
+    """
+    import pandas as pd
+
+    if base is None:
+        base = cost_base(merged_df)
+    bounds = shard_bounds(len(merged_df), workers)
+    if len(bounds) == 1:
+        return prepare_company1_rows(
+            merged_df, oem_lookup, ignored_brands, markup, base
+        )
+
+    lookups = shard_oem_lookups(merged_df, oem_lookup, bounds)
+    # Spawned as the pandarallel workers, see twin_data_processing. Leaving
+    # the pool terminates its workers, also those still preparing a shard
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(len(bounds)) as pool:
+        results = [
+            pool.apply_async(
+                prepare_company1_rows,
+                (
+                    merged_df.iloc[start:end],
+                    lookup,
+                    ignored_brands,
+                    markup,
+                    base.iloc[start:end],
+                ),
+            )
+            for (start, end), lookup in zip(bounds, lookups)
+        ]
+        pending = results
+        while pending:
+            check_cancelled(cancel_token)
+            pending[0].wait(CANCEL_POLL_SECONDS)
+            for result in pending:
+                if result.ready() and not result.successful():
+                    result.get()  # Raises the error of the shard
+            pending = [result for result in pending if not result.ready()]
+        shards = [result.get() for result in results]
+    return pd.concat(shards)
+
+
+def add_unknown_oe_cross_codes(
+    merged_df,
+    ignored_brands,
+    references=None,
+    parallel=True,
+    cancel_token=None,
+    canonical_oe=False,  # See oe_keys
+    find_cross_codes=oe_cross_codes,  # e.g. polars_backend.oe_cross_codes
+):
+    """
+    Fills CODICI CROSS of the rows without OE numbers with the products whose
+    OE numbers contain their code, searched in references (default: merged_df).
+    """
+    if references is None:
+        references = merged_df
     # Handle cases where CODICE OE is unknown and brand is not ignored
-    merged_df["padded_oe"] = " " + merged_df["CODICE OE"].str.strip() + " "
     unknown_oe_mask = (merged_df["CODICE OE"] == "Unknown OE") & (
         ~merged_df["BRAND"].isin(ignored_brands)
     )
-    merged_df.loc[unknown_oe_mask, "CODICI CROSS"] = merged_df.loc[
-        unknown_oe_mask, "CODICE PRODOTTO"
-    ].parallel_apply(
-        lambda codice_prodotto: find_additional_cross_codes(
-            codice_prodotto, merged_df["padded_oe"], merged_df, ignored_brands
-        )
+    unknown_codes = merged_df.loc[unknown_oe_mask, "CODICE PRODOTTO"]
+    # Looked up by integer key in the OE numbers of references
+    cross_codes = find_cross_codes(
+        unknown_codes, references, ignored_brands, canonical_oe, cancel_token
     )
+    searched = [code is None for code in cross_codes]
+    if any(searched):
+        # Codes with spaces, searched in the joined OE numbers
+        searched_codes = unknown_codes[searched]
+        references = references.assign(
+            padded_oe=" " + references["CODICE OE"].str.strip() + " "
+        )
+        apply = searched_codes.parallel_apply if parallel else searched_codes.apply
+
+        def search(codice_prodotto):
+            # Also runs in the pandarallel workers, with a copy of the token
+            check_cancelled(cancel_token)
+            return find_additional_cross_codes(
+                codice_prodotto, references["padded_oe"], references, ignored_brands
+            )
+
+        found = iter(apply(search).tolist())
+        cross_codes = [next(found) if code is None else code for code in cross_codes]
+
+    merged_df.loc[unknown_oe_mask, "CODICI CROSS"] = cross_codes
 
-    # Drop the 'padded_oe' column
-    merged_df.drop(columns=["padded_oe"], inplace=True)
 
+def label_company1_rows(
+    merged_df, brands_file_path, ignored_brands, cancel_token=None
+):
+    """Fills the fixed columns and renames the brands."""
     # Fill the "CONFEZIONE" column with "1 pz" and the "QUANTITÀ MINIMA" column with "1"
     merged_df["CONFEZIONE"] = "1 pz"
     merged_df["QUANTITÀ MINIMA"] = "1"
@@ -261,6 +398,7 @@ def process_company1(
     # print("Ensured specified columns remain empty")
 
     # Update brands
+    check_cancelled(cancel_token)
     merged_df = update_brands(merged_df, brands_file_path)
 
     # print("Updated brands")
@@ -276,6 +414,13 @@ def process_company1(
 
     print("Dropped 'UBICAZIONE' column") """
 
+    return merged_df
+
+
+def price_company1_rows(merged_df, shipping_cost):
+    """Drops the rows under the minimum price and adds the shipping to PREZZO."""
+    import pandas as pd
+
     # **Add the custom rules here**
 
     # Convert 'PREZZO' to numeric if it's not already
@@ -284,7 +429,7 @@ def process_company1(
     # print("Converted 'PREZZO' to numeric if it's not already")
 
     # Filter out all rows where PREZZO is less than 4.50
-    merged_df = merged_df[merged_df["PREZZO"] >= 4.50]
+    merged_df = merged_df[merged_df["PREZZO"] >= MINIMUM_PRICE]
 
     # print("Filtered out all rows where PREZZO is less than 4.50")
 
@@ -293,20 +438,8 @@ def process_company1(
 
     # print("Added 7.50 to all remaining PREZZO")
 
-    # Define the custom rounding function
-    def custom_round(price):
-        if pd.isnull(price):
-            return price
-        decimal_part = price % 1
-        if decimal_part <= 0.5:
-            return np.floor(price - 1) + 0.9
-        else:
-            return np.floor(price) + 0.9
-
-    # print("Defined the custom rounding function")
-
     # Apply the custom rounding to 'PREZZO'
-    merged_df["PREZZO"] = merged_df["PREZZO"].apply(custom_round)
+    merged_df["PREZZO"] = round_prices(merged_df["PREZZO"])
 
     # print("Applied the custom rounding to 'PREZZO'")
 
@@ -315,3 +448,102 @@ def process_company1(
     # print("TULERO READY")
 
     return company1_df
+
+
+def finish_company1_rows(
+    merged_df, brands_file_path, ignored_brands, shipping_cost, cancel_token=None
+):
+    """Fills the fixed columns, renames the brands and prices the rows."""
+    merged_df = label_company1_rows(
+        merged_df, brands_file_path, ignored_brands, cancel_token
+    )
+    return price_company1_rows(merged_df, shipping_cost)
+
+
+def add_cross_codes(
+    merged_df,
+    ignored_brands,
+    references=None,
+    parallel=True,
+    cancel_token=None,
+    max_component_size=None,  # See cross_references, None: exact CODICE OE groups
+    canonical_oe=False,  # Compare the canonical OE numbers, see oe_keys
+    find_cross_codes=oe_cross_codes,  # See add_unknown_oe_cross_codes
+):
+    """Fills CODICI CROSS of the prepared rows."""
+    if max_component_size is not None:
+        merged_df["CODICI CROSS"] = component_cross_codes(
+            merged_df, ignored_brands, max_component_size, cancel_token, canonical_oe
+        )
+        return
+
+    # Apply optimized cross-code generation function
+    merged_df["CODICI CROSS"] = optimized_cross_code_generation(
+        merged_df, ignored_brands, cancel_token, canonical_oe
+    )
+    add_unknown_oe_cross_codes(
+        merged_df,
+        ignored_brands,
+        references,
+        parallel,
+        cancel_token,
+        canonical_oe,
+        find_cross_codes,
+    )
+
+
+def complete_company1_rows(
+    merged_df,
+    brands_file_path,
+    ignored_brands,
+    shipping_cost,
+    references=None,  # See add_unknown_oe_cross_codes
+    parallel=True,
+    cancel_token=None,  # See cancellation
+    max_component_size=None,  # See add_cross_codes
+    canonical_oe=False,  # See add_cross_codes
+):
+    """Adds the cross codes to the prepared rows and finishes them."""
+    add_cross_codes(
+        merged_df,
+        ignored_brands,
+        references,
+        parallel,
+        cancel_token,
+        max_component_size,
+        canonical_oe,
+    )
+    return finish_company1_rows(
+        merged_df, brands_file_path, ignored_brands, shipping_cost, cancel_token
+    )
+
+
+def process_company1(
+    merged_df,
+    brands_file_path,
+    old_oems_folder,
+    ignored_brands,
+    markup,
+    shipping_cost,
+    oem_lookup=None,  # load_oem_lookup(old_oems_folder), loaded when None
+    cancel_token=None,  # See cancellation
+    base=None,  # pricing.cost_base(merged_df), computed when None
+    max_component_size=None,  # See add_cross_codes
+    canonical_oe=False,  # See add_cross_codes
+    workers=1,  # See prepare_company1_shards
+):
+    if oem_lookup is None:
+        oem_lookup = load_oem_lookup(old_oems_folder)
+    check_cancelled(cancel_token)
+    merged_df = prepare_company1_shards(
+        merged_df, oem_lookup, ignored_brands, markup, base, workers, cancel_token
+    )
+    return complete_company1_rows(
+        merged_df,
+        brands_file_path,
+        ignored_brands,
+        shipping_cost,
+        cancel_token=cancel_token,
+        max_component_size=max_component_size,
+        canonical_oe=canonical_oe,
+    )
@@ -0,0 +1,112 @@
+# data_processing/cross_references.py
+#
+# Cross codes from the connected components of the OE numbers, used instead of
+# the exact CODICE OE groups when "cross_reference_components" is set. Those
+# groups only join the products whose whole CODICE OE is the same, so "A | B"
+# is never a cross code of "A", and a product without OE numbers only gets
+# those having its code among theirs. Here every product is linked to
+# each of its OE numbers, and to the OE number equal to its code; union-find
+# joins the linked products into components in near-linear time, and CODICI
+# CROSS of a product lists the other codes of its component. A union that
+# would make a component larger than the maximum size is skipped, so that an
+# OE number shared by many products (e.g. a generic one) does not chain
+# unrelated products together.
+
+import numpy as np
+import pandas as pd
+
+from .cancellation import check_cancelled
+from .oe_keys import NO_KEY, OE_SEPARATOR, UNKNOWN_OE, OeKeys
+
+
+def find_root(parent, node):
+    while parent[node] != node:
+        parent[node] = parent[parent[node]]  # Path halving
+        node = parent[node]
+    return node
+
+
+def join_components(sizes, edges, max_size, cancel_token=None):
+    """
+    Returns the parent list of the union-find of the nodes, sizes[node] being
+    the number of products of each node, after joining the two nodes of every
+    edge in order (by size), skipping the unions that would make a component
+    of more than max_size products.
+    """
+    parent = list(range(len(sizes)))
+    sizes = list(sizes)
+    for first, second in edges:
+        check_cancelled(cancel_token)
+        first = find_root(parent, first)
+        second = find_root(parent, second)
+        if first == second or sizes[first] + sizes[second] > max_size:
+            continue
+        if sizes[first] < sizes[second]:
+            first, second = second, first
+        parent[second] = first
+        sizes[first] += sizes[second]
+    return parent
+
+
+def oe_edges(codes, oes, linked, canonical=False):
+    """
+    Returns the (row, OE number) edges of the linked rows, the OE numbers
+    being numbered after the rows by their key (see oe_keys): first those of
+    CODICE OE, then the codes that are an OE number of a product. Also
+    returns the number of OE numbers.
+    """
+    known = linked & (oes != UNKNOWN_OE)
+    numbers = (
+        pd.Series(oes[known], index=np.flatnonzero(known), dtype=object)
+        .str.split(OE_SEPARATOR, regex=False)
+        .explode()
+    )
+    numbers = numbers[numbers.notna() & (numbers != "")]
+    keys = OeKeys(canonical)
+    number_ids = keys.intern(numbers.to_numpy())
+    numbered = number_ids != NO_KEY
+
+    linked_rows = np.flatnonzero(linked)
+    code_ids = keys.lookup(codes[linked_rows])
+    matched = code_ids != NO_KEY
+
+    rows = np.concatenate([numbers.index.to_numpy()[numbered], linked_rows[matched]])
+    targets = len(codes) + np.concatenate([number_ids[numbered], code_ids[matched]])
+    return list(zip(rows.tolist(), targets.tolist())), len(keys.ids)
+
+
+def component_cross_codes(
+    cleaned_df,
+    ignored_brands,
+    max_component_size,  # Products in a component at most
+    cancel_token=None,  # See cancellation
+    canonical=False,  # Compare the canonical OE numbers, see oe_keys
+):
+    """
+    Returns CODICI CROSS of every row of cleaned_df (with CODICE PRODOTTO,
+    BRAND and CODICE OE): the other codes of its component, in row order.
+    """
+    codes = cleaned_df["CODICE PRODOTTO"].to_numpy(dtype=object)
+    oes = cleaned_df["CODICE OE"].to_numpy(dtype=object)
+    linked = ~cleaned_df["BRAND"].isin(ignored_brands).to_numpy()
+
+    edges, number_count = oe_edges(codes, oes, linked, canonical)
+    # The rows count as products, the OE numbers do not
+    sizes = [1] * len(codes) + [0] * number_count
+    parent = join_components(sizes, edges, max_component_size, cancel_token)
+
+    components = {}
+    linked_rows = np.flatnonzero(linked).tolist()
+    roots = [find_root(parent, row) for row in linked_rows]
+    for row, root in zip(linked_rows, roots):
+        components.setdefault(root, {})[codes[row]] = None  # Ordered set
+
+    cross_codes = [""] * len(codes)
+    for row, root in zip(linked_rows, roots):
+        check_cancelled(cancel_token)
+        component = components[root]
+        if len(component) > 1:
+            cross_codes[row] = " | ".join(
+                code for code in component if code != codes[row]
+            )
+    return pd.Series(cross_codes, index=cleaned_df.index, dtype=object)
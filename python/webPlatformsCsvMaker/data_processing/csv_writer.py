@@ -0,0 +1,256 @@
+# data_processing/csv_writer.py
+#
+# Writes the marketplace CSVs. The text is exactly what df.to_csv(path,
+# index=False) writes, but it is encoded column by column: every column is
+# factorized and only its distinct values are formatted and quoted, then the
+# rows are joined in one pass. Compression (.gz, .zip) and the file writes
+# run in a separate thread, overlapping with the encoding of the next rows.
+
+import csv
+import io
+import os
+import queue
+import re
+import threading
+import zipfile
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Rows encoded at a time
+DEFAULT_CHUNK_ROWS = 100000
+# zlib's default level: close to the size of level 9, several times faster
+COMPRESSION_LEVEL = 6
+# Encoded chunks buffered between the encoder and the writer thread
+WRITE_QUEUE_CHUNKS = 4
+COMPRESSIONS = {".gz": "gzip", ".zip": "zip"}
+# Fixed timestamp of the zip entry, so that an unchanged feed gives the same
+# bytes (see utility/upload_manifest.py)
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+LINE_TERMINATOR = os.linesep  # As to_csv with a path
+
+
+def _quoted_characters():
+    # Which of these the csv module quotes depends on the Python version and
+    # on the line terminator, so ask it
+    quoted = []
+    for character in [",", '"', "\r", "\n"]:
+        output = io.StringIO()
+        csv.writer(output, lineterminator=LINE_TERMINATOR).writerow(
+            [character, "x"]
+        )
+        if output.getvalue().startswith('"'):
+            quoted.append(character)
+    return "[" + re.escape("".join(quoted)) + "]"
+
+
+_NEEDS_QUOTES = _quoted_characters()
+
+
+def compression_for_path(path):
+    """Returns "gzip", "zip" or None from the extension, like to_csv."""
+    return COMPRESSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def _quote(text):
+    """Quotes an object array of strings as csv.QUOTE_MINIMAL does."""
+    series = pd.Series(text, dtype=object)
+    needs_quotes = series.str.contains(_NEEDS_QUOTES, regex=True)
+    if needs_quotes.any():
+        quoted = series[needs_quotes].str.replace('"', '""', regex=False)
+        series[needs_quotes] = '"' + quoted + '"'
+    return series.to_numpy()
+
+
+def _encode_column(values):
+    """Returns the CSV fields of a column, None when it needs to_csv."""
+    kind = values.dtype.kind
+    if kind == "f" and values.dtype.itemsize in (4, 8):
+        # Factorized on the bits, so that 0.0 and -0.0 stay apart
+        codes, uniques = pd.factorize(values.view(f"i{values.dtype.itemsize}"))
+        text = uniques.view(values.dtype).astype(str).astype(object)
+        fields = text[codes]
+        fields[np.isnan(values)] = ""
+        return fields
+    if kind in "iub":
+        codes, uniques = pd.factorize(values)
+        return uniques.astype(str).astype(object)[codes]
+    if kind == "O":
+        codes, uniques = pd.factorize(values)
+        if not all(type(value) is str for value in uniques):
+            # e.g. ints and strings; 1, 1.0 and True would share a code
+            mask = pd.isna(values)
+            text = np.array([str(value) for value in values], dtype=object)
+            text[mask] = ""
+            codes, uniques = pd.factorize(text)
+        # Missing values get the code -1, i.e. the last field
+        fields = np.append(_quote(uniques), "")
+        return fields[codes]
+    return None
+
+
+def _supports(df):
+    return (
+        df.shape[1] > 1  # The csv module quotes a lone empty field
+        and not isinstance(df.columns, pd.MultiIndex)
+        and all(
+            isinstance(dtype, np.dtype) and dtype.kind in "fiubO"
+            for dtype in df.dtypes
+        )
+    )
+
+
+def _encode_rows(df):
+    columns = [_encode_column(df.iloc[:, i].to_numpy()) for i in range(df.shape[1])]
+    if any(column is None for column in columns):
+        return df.to_csv(index=False, header=False, lineterminator=LINE_TERMINATOR)
+    return LINE_TERMINATOR.join(map(",".join, zip(*columns))) + LINE_TERMINATOR
+
+
+def csv_chunks(df, chunk_rows=DEFAULT_CHUNK_ROWS, header=True):
+    """
+    Yields the UTF-8 bytes of df.to_csv(path, index=False), in chunks; without
+    the header row when header is False.
+    """
+    if not _supports(df):
+        for start in range(0, max(len(df), 1), chunk_rows):
+            chunk = df.iloc[start : start + chunk_rows]
+            yield chunk.to_csv(
+                index=False,
+                header=header and start == 0,
+                lineterminator=LINE_TERMINATOR,
+            ).encode("utf-8")
+        return
+
+    if header:
+        names = np.array([str(column) for column in df.columns], dtype=object)
+        yield (",".join(_quote(names)) + LINE_TERMINATOR).encode("utf-8")
+    for start in range(0, len(df), chunk_rows):
+        yield _encode_rows(df.iloc[start : start + chunk_rows]).encode("utf-8")
+
+
+class _ChunkSink:
+    """Unseekable file collecting what zipfile writes."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+class _Compressor:
+    """Compresses a CSV given in chunks; the output does not depend on time."""
+
+    def __init__(self, compression, member_name):
+        self.compression = compression
+        if compression == "gzip":
+            # wbits=31 writes the gzip header and trailer
+            self.compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+        elif compression == "zip":
+            self.sink = _ChunkSink()
+            self.archive = zipfile.ZipFile(self.sink, "w")
+            member = zipfile.ZipInfo(member_name, date_time=ZIP_DATE_TIME)
+            member.compress_type = zipfile.ZIP_DEFLATED  # At zlib's level 6
+            self.member = self.archive.open(member, "w")
+
+    def compress(self, data):
+        if self.compression == "gzip":
+            return self.compressor.compress(data)
+        if self.compression == "zip":
+            self.member.write(data)
+            return self.sink.take()
+        return data
+
+    def finish(self):
+        if self.compression == "gzip":
+            return self.compressor.flush()
+        if self.compression == "zip":
+            self.member.close()
+            self.archive.close()
+            return self.sink.take()
+        return b""
+
+
+def output_chunks(df, output_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields the bytes of the file write_csv(df, output_path) writes."""
+    compression = compression_for_path(output_path)
+    member_name = os.path.splitext(os.path.basename(output_path))[0]
+    compressor = _Compressor(compression, member_name)
+    for chunk in csv_chunks(df, chunk_rows):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    data = compressor.finish()
+    if data:
+        yield data
+
+
+class CsvWriter:
+    """
+    Writes a CSV given in frames, as write_csv writes their concatenation:
+    the header of the first frame, then the rows of all of them; close ends
+    the file. The chunks are compressed and written by another thread while
+    the next ones are encoded.
+    """
+
+    def __init__(self, output_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.output_path = output_path
+        self.chunk_rows = chunk_rows
+        self.header = True
+        self.chunks = queue.Queue(maxsize=WRITE_QUEUE_CHUNKS)
+        self.failed = []
+        self.writer = threading.Thread(
+            target=self._write, name=f"write-{os.path.basename(output_path)}"
+        )
+        self.writer.start()
+
+    def _write(self):
+        compression = compression_for_path(self.output_path)
+        member_name = os.path.splitext(os.path.basename(self.output_path))[0]
+        chunk = b""
+        try:
+            compressor = _Compressor(compression, member_name)
+            with open(self.output_path, "wb") as file:
+                while (chunk := self.chunks.get()) is not None:
+                    file.write(compressor.compress(chunk))
+                file.write(compressor.finish())
+        except Exception as e:
+            self.failed.append(e)
+            # Keeps the encoder from blocking on a full queue
+            while chunk is not None:
+                chunk = self.chunks.get()
+
+    def write(self, df):
+        for chunk in csv_chunks(df, self.chunk_rows, self.header):
+            self.chunks.put(chunk)
+        self.header = False
+
+    def close(self):
+        self.chunks.put(None)
+        self.writer.join()
+        if self.failed:
+            raise self.failed[0]
+
+
+def write_csv(df, output_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Writes df like df.to_csv(output_path, index=False); a .gz or .zip path
+    is compressed, see CsvWriter.
+    """
+    writer = CsvWriter(output_path, chunk_rows)
+    try:
+        writer.write(df)
+    finally:
+        writer.close()
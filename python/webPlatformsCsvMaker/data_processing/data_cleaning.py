@@ -2,6 +2,8 @@ import re
 
 import pandas as pd
 
+from .cancellation import check_cancelled
+
 DEBUG_MODE = False
 
 if DEBUG_MODE:
@@ -32,7 +34,7 @@ def validate_other_sheet(df):
     )
 
 
-def load_and_clean_excel_file(file_path, file_type):
+def load_and_clean_excel_file(file_path, file_type, cancel_token=None):
     # print(f"Loading and cleaning the {file_type} file...")
     # print(f"{file_type.capitalize()} file path:", file_path)
     xls = pd.ExcelFile(file_path)
@@ -45,6 +47,7 @@ def load_and_clean_excel_file(file_path, file_type):
         else xls.sheet_names
     )
     for sheet_name in iter_sheets:
+        check_cancelled(cancel_token)
         df = pd.read_excel(xls, sheet_name=sheet_name, header=0, dtype=str)
         if not first_sheet_validated:
             if validate_first_sheet(df):
@@ -61,7 +64,7 @@ def load_and_clean_excel_file(file_path, file_type):
 
     # Identify and drop the column that starts with 'mgs'
     first_sheet_df = relevant_sheets[0][1]
-    mgs_column = [col for col in first_sheet_df.columns if col.startswith("mgs")]
+    mgs_column = mgs_columns(first_sheet_df)
     if mgs_column:
         first_sheet_df = first_sheet_df.drop(columns=mgs_column)
 
@@ -71,6 +74,18 @@ def load_and_clean_excel_file(file_path, file_type):
         aligned_sheets.append(df)
 
     df_combined = pd.concat(aligned_sheets, ignore_index=True)
+    return clean_sheet_rows(df_combined, file_type)
+
+
+def mgs_columns(first_sheet_df):
+    return [col for col in first_sheet_df.columns if col.startswith("mgs")]
+
+
+def clean_sheet_rows(df_combined, file_type):
+    """
+    Cleans the rows of the relevant sheets, aligned on the columns of the
+    first one. Row by row: out_of_core cleans the rows a chunk at a time.
+    """
     df_combined = df_combined[~df_combined.iloc[:, 2].isin(["", "."])]
 
     # Drop unnecessary columns
@@ -165,6 +180,10 @@ def merge_files(articles_file_path, warehouse_file_path):
     # Load and clean the articles file
     articles_df = load_and_clean_excel_file(articles_file_path, "articles")
 
+    return merge_cleaned_frames(articles_df, warehouse_df)
+
+
+def merge_cleaned_frames(articles_df, warehouse_df):
     # Merge the warehouse data with articles data on 'CODICE PRODOTTO' and 'BRAND'
     warehouse_df["BRAND"] = warehouse_df["BRAND"].str.strip()
     articles_df["BRAND"] = articles_df["BRAND"].str.strip()
@@ -196,21 +215,28 @@ def merge_files(articles_file_path, warehouse_file_path):
         how="inner",  # Use 'inner' to get only successful matches
     )
 
-    # Filter out all rows where UBICAZIONE starts with 'c.00' or 'C.00' and DESCRIZIONE does not contain 'FILTRO', 'FILTRI', 'filtro', 'filtri'
-    pattern = r"^[cC]\.00"
-    keywords = ["FILTRO", "FILTRI", "filtro", "filtri"]
-
-    def filter_condition(row):
-        ubicazione_match = re.match(pattern, row["UBICAZIONE"])
-        descrizione_contains_keywords = any(kw in row["DESCRIZIONE"] for kw in keywords)
-        return not (ubicazione_match and not descrizione_contains_keywords)
-
-    if DEBUG_MODE:
-        tqdm.pandas(desc="Applying additional filtering")
-        merged_df = merged_df.progress_apply(filter_condition, axis=1)
-    else:
-        merged_df = merged_df[merged_df.apply(filter_condition, axis=1)]
+    merged_df = filter_merged_rows(merged_df)
 
     merged_df.drop(columns=["UBICAZIONE"], inplace=True)
 
     return merged_df
+
+
+# Filter out all rows where UBICAZIONE starts with 'c.00' or 'C.00' and DESCRIZIONE does not contain 'FILTRO', 'FILTRI', 'filtro', 'filtri'
+FILTER_LOCATION_PATTERN = r"^[cC]\.00"
+FILTER_KEYWORDS = ["FILTRO", "FILTRI", "filtro", "filtri"]
+
+
+def filter_condition(row):
+    ubicazione_match = re.match(FILTER_LOCATION_PATTERN, row["UBICAZIONE"])
+    descrizione_contains_keywords = any(
+        kw in row["DESCRIZIONE"] for kw in FILTER_KEYWORDS
+    )
+    return not (ubicazione_match and not descrizione_contains_keywords)
+
+
+def filter_merged_rows(merged_df):
+    if DEBUG_MODE:
+        tqdm.pandas(desc="Applying additional filtering")
+        return merged_df[merged_df.progress_apply(filter_condition, axis=1)]
+    return merged_df[merged_df.apply(filter_condition, axis=1)]
@@ -0,0 +1,94 @@
+# data_processing/delta_feed.py
+#
+# Delta feeds: the rows added, changed and removed since the previous run.
+# Every output is kept as a snapshot indexed by the hash of its key
+# (CODICE PRODOTTO + BRAND, TecDoc-ID + TecDoc Brand); the next run joins
+# its rows to the snapshot on that hash and compares one hash per row,
+# instead of comparing the rows cell by cell.
+
+import os
+
+import pandas as pd
+
+from . import csv_writer
+from .output_paths import split_output_path
+
+DELTA_KEYS = {
+    "company1": ["CODICE PRODOTTO", "BRAND"],
+    "company2": ["TecDoc-ID", "TecDoc Brand"],
+}
+DELTA_KINDS = ["added", "changed", "removed"]
+SNAPSHOT_SUFFIX = ".snapshot.pkl"
+KEY_HASH = "_key_hash"
+ROW_HASH = "_row_hash"
+
+
+def snapshot_path(output_path):
+    return split_output_path(output_path)[0] + SNAPSHOT_SUFFIX
+
+
+def delta_paths(output_path):
+    """Returns {"added": ".../company1_output_added.csv", ...}."""
+    base, extension = split_output_path(output_path)
+    return {kind: f"{base}_{kind}{extension}" for kind in DELTA_KINDS}
+
+
+def row_hashes(df, key_columns):
+    """Returns the 64-bit hashes of the keys and of the whole rows of df."""
+    keys = df[key_columns].astype(str)
+    # Numbers the repeated keys, so that duplicates are paired in order
+    keys["_occurrence"] = keys.groupby(key_columns, sort=False).cumcount()
+    key_hash = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    row_hash = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return key_hash, row_hash
+
+
+def compute_delta(previous, df, key_hash, row_hash):
+    """
+    Returns the added, changed and removed rows of df against the previous
+    snapshot, which holds the key and row hashes of the previous output.
+    """
+    previous_keys = pd.Index(previous[KEY_HASH].to_numpy())
+    positions = previous_keys.get_indexer(key_hash)
+    found = positions >= 0
+    previous_row_hash = previous[ROW_HASH].to_numpy()
+
+    changed = found.copy()
+    changed[found] = previous_row_hash[positions[found]] != row_hash[found]
+    removed = ~previous_keys.isin(key_hash)
+    columns = [c for c in previous.columns if c not in (KEY_HASH, ROW_HASH)]
+    return {
+        "added": df[~found],
+        "changed": df[changed],
+        "removed": previous.loc[removed, columns],
+    }
+
+
+def write_delta_feed(df, output_path, key_columns, write=csv_writer.write_csv):
+    """
+    Writes the delta of df against the snapshot of the previous run next to
+    output_path, then replaces the snapshot. Returns the number of rows of
+    each delta file, or None on the first run.
+    """
+    key_hash, row_hash = row_hashes(df, key_columns)
+    path = snapshot_path(output_path)
+    counts = None
+    if os.path.exists(path):
+        delta = compute_delta(pd.read_pickle(path), df, key_hash, row_hash)
+        for kind, delta_path in delta_paths(output_path).items():
+            write(delta[kind], delta_path)
+        counts = {kind: len(rows) for kind, rows in delta.items()}
+
+    snapshot = df.reset_index(drop=True).assign(
+        **{KEY_HASH: key_hash, ROW_HASH: row_hash}
+    )
+    temporary_path = path + ".tmp"
+    snapshot.to_pickle(temporary_path)
+    os.replace(temporary_path, path)
+    return counts
+
+
+def format_delta_counts(counts):
+    if counts is None:
+        return "no previous run, the delta starts with the next one"
+    return ", ".join(f"{counts[kind]} {kind}" for kind in DELTA_KINDS)
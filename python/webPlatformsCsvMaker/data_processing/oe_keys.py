@@ -0,0 +1,129 @@
+# data_processing/oe_keys.py
+#
+# Integer keys of the OE numbers. The cross codes compare OE numbers with each
+# other and with product codes: instead of searching the joined CODICE OE
+# strings for every product, each distinct OE number (or code) is normalized
+# once and interned to an integer, and the products are looked up in an index
+# by key. The exact keys compare the OE numbers as CODICE OE holds them (the
+# OEM loader removes their spaces); with "canonical_oe_numbers" the keys also
+# ignore punctuation and case, so "0986-452.041" and "0986452041" are the same
+# OE number.
+
+import numpy as np
+import pandas as pd
+
+from .cancellation import check_cancelled
+
+UNKNOWN_OE = "Unknown OE"
+OE_SEPARATOR = " | "  # See vectorized_get_oem_number
+NO_KEY = -1
+
+
+class OeKeys:
+    """Interns the normalized OE numbers and codes to integers."""
+
+    def __init__(self, canonical=False):
+        self.canonical = canonical
+        self.ids = {}
+
+    def normalize(self, values):
+        values = pd.Series(values, dtype=object).astype(str)
+        if self.canonical:
+            return values.str.upper().str.replace(r"[\W_]+", "", regex=True)
+        return values
+
+    def _keys(self, values, add):
+        # Each distinct value is normalized and hashed once
+        codes, uniques = pd.factorize(self.normalize(values))
+        if add:
+            ids = [self.ids.setdefault(value, len(self.ids)) for value in uniques]
+        else:
+            ids = [self.ids.get(value, NO_KEY) for value in uniques]
+        ids = np.array(ids + [NO_KEY], dtype=np.int64)  # NO_KEY for code -1
+        if self.canonical:
+            # Only punctuation: not an OE number
+            ids[:-1][uniques == ""] = NO_KEY
+        return ids[codes]
+
+    def intern(self, values):
+        """Returns the key of every value, adding the new ones."""
+        return self._keys(values, add=True)
+
+    def lookup(self, values):
+        """Returns the key of every value, NO_KEY for those not interned."""
+        return self._keys(values, add=False)
+
+
+def oe_numbers(oes, canonical=False):
+    """
+    Returns the OE numbers of the CODICE OE values, one by row of a Series
+    indexed by their position in oes. The exact numbers are the words of
+    CODICE OE, as the space-padded search of find_additional_cross_codes
+    matched them (the separators included).
+    """
+    oes = pd.Series(oes, dtype=object).reset_index(drop=True)
+    if canonical:
+        numbers = oes.str.split(OE_SEPARATOR, regex=False)
+    else:
+        numbers = oes.str.strip().str.split(" ", regex=False)
+    return numbers.explode().dropna()
+
+
+def oe_group_keys(oes, canonical=False):
+    """
+    Returns the key of the whole CODICE OE of every value: equal for the
+    values with the same OE numbers (the same canonical ones, in order).
+    """
+    if not canonical:
+        return OeKeys().intern(oes)
+    numbers = oe_numbers(oes, canonical=True)
+    number_keys = pd.Series(OeKeys(canonical=True).intern(numbers.to_numpy()))
+    # e.g. "3,17" for the OE numbers of keys 3 and 17
+    joined = number_keys.astype(str).groupby(numbers.index.to_numpy()).agg(",".join)
+    return OeKeys().intern(joined.reindex(range(len(oes)), fill_value="").to_numpy())
+
+
+def oe_cross_codes(
+    codes,
+    references,
+    ignored_brands,
+    canonical=False,
+    cancel_token=None,  # See cancellation
+):
+    """
+    Returns the cross codes of codes, a list: the product codes of the
+    references (with OE numbers, brand not ignored) having each code among
+    their OE numbers, in the order of the references. None for the codes the
+    keys cannot match, the exact codes with spaces.
+    """
+    contributor = (references["CODICE OE"] != UNKNOWN_OE) & ~references[
+        "BRAND"
+    ].isin(ignored_brands)
+    oes = references.loc[contributor, "CODICE OE"].to_numpy()
+    products = references.loc[contributor, "CODICE PRODOTTO"].to_numpy()
+
+    keys = OeKeys(canonical)
+    numbers = oe_numbers(oes, canonical)
+    index = pd.DataFrame(
+        {
+            "key": keys.intern(numbers.to_numpy()),
+            "product": products[numbers.index.to_numpy()],
+        }
+    )
+    codes = pd.Series(codes, dtype=object).reset_index(drop=True)
+    code_keys = keys.lookup(codes.to_numpy())
+    check_cancelled(cancel_token)
+
+    # The products of the searched OE numbers, each once, in reference order
+    index = index[index["key"].isin(code_keys) & (index["key"] != NO_KEY)]
+    index = index.drop_duplicates()
+    joined = index.groupby("key", sort=False)["product"].agg(" | ".join)
+    cross_codes = pd.Series(code_keys).map(joined).fillna("").tolist()
+    check_cancelled(cancel_token)
+
+    if not canonical:
+        # Matched across the words of CODICE OE by the search
+        spaced = codes.str.contains(" ", regex=False).to_numpy()
+        for position in np.flatnonzero(spaced):
+            cross_codes[position] = None
+    return cross_codes
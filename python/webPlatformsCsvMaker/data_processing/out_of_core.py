@@ -0,0 +1,666 @@
+# data_processing/out_of_core.py
+#
+# Out-of-core processing ("out_of_core_processing"), for catalogs larger than
+# the memory of the machine. The workbooks are streamed a chunk of rows at a
+# time and the cleaned rows are spilled to the .spill folder of the output
+# folder. The steps that join rows by key (the merge of the workbooks, the OEM
+# lookup, the cross codes) split both sides into partitions by a hash of the
+# key, join each partition on its own and put the results back in the order
+# of the rows. The Tulero and Tyre24 rows are then built a chunk at a time,
+# with the functions of a run in memory, and appended to the CSVs: the files
+# are the same. The chunks and partitions are sized after the memory budget,
+# "out_of_core_memory_mb".
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+from .cancellation import check_cancelled
+from .company1_processing import (
+    clean_oem_rows,
+    finish_company1_rows,
+    oem_file_names,
+    prepare_company1_rows,
+)
+from .company2_processing import process_company2
+from .csv_writer import DEFAULT_CHUNK_ROWS, CsvWriter
+from .data_cleaning import (
+    clean_sheet_rows,
+    filter_merged_rows,
+    mgs_columns,
+    validate_first_sheet,
+    validate_other_sheet,
+)
+from .oe_keys import OE_SEPARATOR, UNKNOWN_OE, OeKeys, oe_numbers
+from .pricing import cost_base
+from .quantity_refresh import discard_quantity_base
+
+SPILL_FOLDER = ".spill"
+# Memory of the interpreter and the libraries, outside the chunks
+BASE_MEMORY_MB = 256
+# Memory a row of a chunk takes at most through the steps, see
+# benchmarks/memory_benchmark.py
+ROW_BYTES = 2048
+MIN_CHUNK_ROWS = 1000
+# Bytes of an oemsDC line at least, to size the partitions of the OEM rows
+MIN_OEM_LINE_BYTES = 16
+MERGE_KEYS = ["CODICE PRODOTTO", "BRAND"]
+OEM_KEYS = ["article_altc", "brand_prefix"]
+POSITION = "_position"  # Of the row in the whole frame
+WAREHOUSE_POSITION = "_warehouse_position"
+ORDER = "_order"  # Of the OE number among all of them
+SEPARATOR_WORD = OE_SEPARATOR.strip()
+
+
+def chunk_rows_for_budget(memory_budget_mb):
+    """The rows of a chunk, or of a partition, within memory_budget_mb."""
+    free_bytes = max(memory_budget_mb - BASE_MEMORY_MB, 0) * 2**20
+    return max(MIN_CHUNK_ROWS, int(free_bytes // ROW_BYTES))
+
+
+def _partition_count(rows, chunk_rows):
+    return max(1, -(-rows // chunk_rows))
+
+
+class SpillFolder:
+    """Frames spilled to the .spill folder of output_folder, removed by close."""
+
+    def __init__(self, output_folder):
+        self.folder = os.path.join(output_folder, SPILL_FOLDER)
+        # Left by a run that was killed
+        shutil.rmtree(self.folder, ignore_errors=True)
+        os.makedirs(self.folder)
+
+    def _path(self, name, numbers):
+        return os.path.join(self.folder, "-".join([name, *map(str, numbers)]) + ".pkl")
+
+    def write(self, data, name, *numbers):
+        pd.to_pickle(data, self._path(name, numbers))
+
+    def pop(self, name, *numbers):
+        """Reads what was written as name, numbers and removes it."""
+        path = self._path(name, numbers)
+        data = pd.read_pickle(path)
+        os.remove(path)
+        return data
+
+    def read(self, name, *numbers):
+        return pd.read_pickle(self._path(name, numbers))
+
+    def close(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class SpilledFrame:
+    """A frame spilled in chunks, the frame being their concatenation."""
+
+    def __init__(self, spill, name):
+        self.spill = spill
+        self.name = name
+        self.lengths = []
+        # Of the numeric columns, as the concatenation would have them
+        self.dtypes = {}
+
+    @property
+    def rows(self):
+        return sum(self.lengths)
+
+    def starts(self):
+        """The position of the first row of each chunk, and the rows."""
+        return np.cumsum([0, *self.lengths])
+
+    def append(self, df):
+        self.spill.write(df, self.name, len(self.lengths))
+        self.lengths.append(len(df))
+
+    def chunk(self, number):
+        df = self.spill.read(self.name, number)
+        return df.astype(self.dtypes) if self.dtypes else df
+
+    def __iter__(self):
+        for number in range(len(self.lengths)):
+            yield self.chunk(number)
+
+
+def _spill_parts(spill, df, parts, count, name, number):
+    """Spills the rows of df in each part 0..count-1 as (name, part, number)."""
+    order = np.argsort(parts, kind="stable")  # Keeps the order of the rows
+    bounds = np.searchsorted(parts[order], np.arange(count + 1))
+    for part in range(count):
+        rows = order[bounds[part] : bounds[part + 1]]
+        spill.write(df.iloc[rows], name, part, number)
+
+
+def _hash_parts(df, columns, partitions):
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    return (hashes % np.uint64(partitions)).astype(np.int64)
+
+
+def _chunk_parts(positions, starts):
+    """The chunk of each row position, starts as SpilledFrame.starts."""
+    return np.searchsorted(starts, positions, side="right") - 1
+
+
+def _read_parts(spill, name, part, count):
+    return pd.concat(
+        [spill.pop(name, part, number) for number in range(count)],
+        ignore_index=True,
+    )
+
+
+def _cell_value(cell):
+    """The value pd.read_excel reads from an openpyxl cell."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+def _spill_sheet(spill, sheet, name, chunk_rows, cancel_token=None):
+    """
+    Spills the rows pd.read_excel reads from sheet as lists of values,
+    chunk_rows at a time. Returns the header row, the number of chunks, the
+    rows up to the last one with data and the number of columns.
+    """
+    sheet.reset_dimensions()
+    header, rows, chunks = [], [], 0
+    last_row, width = -1, 0
+    for number, row in enumerate(sheet.rows):
+        values = [_cell_value(cell) for cell in row]
+        while values and values[-1] == "":
+            values.pop()  # The empty cells ending the row
+        if values:
+            last_row = number
+            width = max(width, len(values))
+        if number == 0:
+            header = values
+        rows.append(values)
+        if len(rows) == chunk_rows:
+            check_cancelled(cancel_token)
+            spill.write(rows, name, chunks)
+            chunks += 1
+            rows = []
+    if rows:
+        spill.write(rows, name, chunks)
+        chunks += 1
+    return header, chunks, last_row + 1, width
+
+
+def _parse_rows(rows, width):
+    """The frame pd.read_excel(header=0, dtype=str) makes of rows."""
+    data = [row + [""] * (width - len(row)) for row in rows]
+    try:
+        return TextParser(data, header=0, dtype=str, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def _common_dtypes(dtypes):
+    """
+    The dtype of each numeric column in the concatenation of the chunks, e.g.
+    float64 when a chunk parsed only integers and another one decimals.
+    """
+    common = {}
+    for column, column_dtypes in dtypes.items():
+        if all(dtype.kind in "iuf" for dtype in column_dtypes):
+            common[column] = np.result_type(*column_dtypes)
+    return common
+
+
+def clean_workbook(spill, file_path, file_type, chunk_rows, cancel_token=None):
+    """
+    Returns the rows load_and_clean_excel_file returns, as a SpilledFrame:
+    the sheets are streamed with openpyxl as pd.read_excel reads them, and
+    cleaned a chunk at a time.
+    """
+    book = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheets = []
+        for number, sheet_name in enumerate(book.sheetnames):
+            check_cancelled(cancel_token)
+            name = f"{file_type}-sheet{number}"
+            sheets.append(
+                (
+                    name,
+                    *_spill_sheet(
+                        spill, book[sheet_name], name, chunk_rows, cancel_token
+                    ),
+                )
+            )
+    finally:
+        book.close()
+
+    cleaned = SpilledFrame(spill, f"{file_type}-cleaned")
+    dtypes = {}
+    columns = None  # Of the first sheet, without its mgs column
+    for name, header, chunks, rows, width in sheets:
+        columns_df = _parse_rows([header], width) if rows else pd.DataFrame()
+        if columns is None:
+            if not validate_first_sheet(columns_df):
+                raise ValueError("First sheet is not valid")
+            dropped = mgs_columns(columns_df)
+            columns = columns_df.drop(columns=dropped).columns
+            relevant = True
+        else:
+            dropped = []
+            relevant = validate_other_sheet(columns_df)
+
+        for number in range(chunks):
+            check_cancelled(cancel_token)
+            values = spill.pop(name, number)
+            # Without the header and the empty rows ending the sheet
+            values = values[: max(rows - number * chunk_rows, 0)]
+            if number == 0:
+                values = values[1:]
+            if not relevant or not values:
+                continue
+            df = _parse_rows([header, *values], width).drop(columns=dropped)
+            df.columns = columns
+            parsed = (~df.iloc[:, 2].isin(["", "."])).any()
+            df = clean_sheet_rows(df, file_type)
+            if parsed:
+                # The chunks with rows to parse set the numeric dtypes
+                for column, dtype in df.dtypes.items():
+                    dtypes.setdefault(column, []).append(dtype)
+            cleaned.append(df)
+
+    if columns is None:
+        raise ValueError(f"No relevant sheets found in the {file_type} Excel file")
+    if not cleaned.lengths:
+        cleaned.append(
+            clean_sheet_rows(pd.DataFrame(columns=columns, dtype=object), file_type)
+        )
+    cleaned.dtypes = _common_dtypes(dtypes)
+    return cleaned
+
+
+def merge_workbooks(spill, articles, warehouse, chunk_rows, cancel_token=None):
+    """
+    Returns the rows merge_cleaned_frames returns for the cleaned articles
+    and warehouse, as a SpilledFrame with a chunk by chunk of articles.
+    """
+    partitions = _partition_count(articles.rows + warehouse.rows, chunk_rows)
+    sides = [
+        ("articles", articles, None),
+        ("warehouse", warehouse, [*MERGE_KEYS, "UBICAZIONE"]),
+    ]
+    for side, frame, columns in sides:
+        for number, (df, start) in enumerate(zip(frame, frame.starts())):
+            check_cancelled(cancel_token)
+            if columns is not None:
+                df = df[columns]
+            df = df.assign(
+                **{key: df[key].str.strip() for key in MERGE_KEYS},
+                **{POSITION: np.arange(start, start + len(df))},
+            )
+            parts = _hash_parts(df, MERGE_KEYS, partitions)
+            _spill_parts(spill, df, parts, partitions, f"{side}-part", number)
+
+    starts = articles.starts()
+    chunks = len(articles.lengths)
+    for partition in range(partitions):
+        check_cancelled(cancel_token)
+        articles_df = _read_parts(spill, "articles-part", partition, chunks)
+        warehouse_df = _read_parts(
+            spill, "warehouse-part", partition, len(warehouse.lengths)
+        ).rename(columns={POSITION: WAREHOUSE_POSITION})
+        merged_df = pd.merge(articles_df, warehouse_df, on=MERGE_KEYS, how="inner")
+        parts = _chunk_parts(merged_df[POSITION].to_numpy(), starts)
+        _spill_parts(spill, merged_df, parts, chunks, "merged-part", partition)
+
+    merged = SpilledFrame(spill, "merged")
+    offset = 0
+    for number in range(chunks):
+        check_cancelled(cancel_token)
+        # An inner merge has the rows of the articles in order, each with its
+        # warehouse rows in order (pandas >= 2.2)
+        merged_df = _read_parts(spill, "merged-part", number, partitions)
+        merged_df = merged_df.sort_values(
+            [POSITION, WAREHOUSE_POSITION], kind="stable", ignore_index=True
+        ).drop(columns=[POSITION, WAREHOUSE_POSITION])
+        # The labels of the merge of the whole frames
+        merged_df.index = pd.RangeIndex(offset, offset + len(merged_df))
+        offset += len(merged_df)
+        if len(merged_df):
+            merged_df = filter_merged_rows(merged_df)
+        # The empty chunks are left out, but an empty merge has one
+        if len(merged_df) or (number == chunks - 1 and not merged.lengths):
+            merged.append(merged_df.drop(columns=["UBICAZIONE"]))
+    return merged
+
+
+def _spill_oem_parts(spill, old_oems_folder, partitions, chunk_rows):
+    """Spills the cleaned oemsDC rows by partition; returns their chunks."""
+    chunks = 0
+    for file_name in oem_file_names(old_oems_folder):
+        file_path = os.path.join(old_oems_folder, file_name)
+        for oems_df in pd.read_csv(file_path, dtype=str, chunksize=chunk_rows):
+            oems_df = clean_oem_rows(oems_df)
+            parts = _hash_parts(oems_df, OEM_KEYS, partitions)
+            _spill_parts(spill, oems_df, parts, partitions, "oems-part", chunks)
+            chunks += 1
+    return chunks
+
+
+def _oem_row_estimate(old_oems_folder):
+    return sum(
+        os.path.getsize(os.path.join(old_oems_folder, file_name))
+        for file_name in oem_file_names(old_oems_folder)
+    ) // MIN_OEM_LINE_BYTES
+
+
+def spill_oem_lookups(spill, merged, old_oems_folder, chunk_rows, cancel_token=None):
+    """
+    Spills the entries of load_oem_lookup each chunk of merged looks up, see
+    chunk_oem_lookup; the OEM rows are joined with the catalog by partition.
+    """
+    partitions = _partition_count(
+        max(merged.rows, _oem_row_estimate(old_oems_folder)), chunk_rows
+    )
+    oem_chunks = _spill_oem_parts(spill, old_oems_folder, partitions, chunk_rows)
+    for number, merged_df in enumerate(merged):
+        check_cancelled(cancel_token)
+        # The keys vectorized_get_oem_number looks up
+        keys = pd.DataFrame(
+            {
+                "article_altc": merged_df["CODICE PRODOTTO"].str.strip(),
+                "brand_prefix": merged_df["BRAND"].str.strip().str[:5],
+            }
+        ).drop_duplicates()
+        parts = _hash_parts(keys, OEM_KEYS, partitions)
+        _spill_parts(spill, keys, parts, partitions, "keys-part", number)
+
+    chunks = len(merged.lengths)
+    for partition in range(partitions):
+        check_cancelled(cancel_token)
+        if oem_chunks:
+            oems_df = _read_parts(spill, "oems-part", partition, oem_chunks)
+        else:
+            oems_df = pd.DataFrame(columns=[*OEM_KEYS, "oem_number"], dtype=object)
+        # The OE numbers of each key, in the order of the files and rows
+        numbers = oems_df.groupby(OEM_KEYS, sort=False)["oem_number"].agg(
+            OE_SEPARATOR.join
+        )
+        for number in range(chunks):
+            keys = spill.pop("keys-part", partition, number)
+            lookup = keys.join(numbers, on=OEM_KEYS, how="inner")
+            spill.write(lookup, "lookup-part", number, partition)
+    return partitions
+
+
+def chunk_oem_lookup(spill, number, partitions):
+    """The entries of load_oem_lookup chunk number of merged looks up."""
+    lookup = _read_parts(spill, "lookup-part", number, partitions)
+    # A single number joined as vectorized_get_oem_number joins them
+    return {
+        (code, prefix): [numbers]
+        for code, prefix, numbers in zip(
+            lookup["article_altc"], lookup["brand_prefix"], lookup["oem_number"]
+        )
+    }
+
+
+def prepare_company1_chunks(
+    spill,
+    merged,
+    partitions,  # Of the OEM lookup, also used for the cross codes
+    ignored_brands,
+    markup,
+    canonical_oe=False,
+    cancel_token=None,
+):
+    """
+    Returns the rows prepare_company1_rows returns for merged, a chunk at a
+    time, and the codes searched in CODICE OE (see _search_codes). Spills
+    the OE numbers and the codes without OE numbers, by partition of their
+    key, for spill_cross_codes.
+    """
+    prepared = SpilledFrame(spill, "company1-rows")
+    keys = OeKeys(canonical_oe)  # Only normalizes them
+    searched = {}
+    order = 0
+    for number, (merged_df, start) in enumerate(zip(merged, merged.starts())):
+        check_cancelled(cancel_token)
+        oem_lookup = chunk_oem_lookup(spill, number, partitions)
+        rows = prepare_company1_rows(merged_df, oem_lookup, ignored_brands, markup)
+        prepared.append(rows)
+
+        # As oe_cross_codes: the OE numbers of the rows with some, the codes of
+        # the rows without, the ignored brands left out
+        ignored = rows["BRAND"].isin(ignored_brands).to_numpy()
+        known = (rows["CODICE OE"] != UNKNOWN_OE).to_numpy()
+        contributor = known & ~ignored
+        numbers = oe_numbers(rows["CODICE OE"].to_numpy()[contributor], canonical_oe)
+        products = rows["CODICE PRODOTTO"].to_numpy()[contributor]
+        tokens = pd.DataFrame(
+            {
+                "key": keys.normalize(numbers.to_numpy()).to_numpy(),
+                "product": products[numbers.index.to_numpy()],
+                ORDER: np.arange(order, order + len(numbers)),
+            }
+        )
+        order += len(numbers)
+        unknown = ~known & ~ignored
+        codes = pd.DataFrame(
+            {
+                "code": rows["CODICE PRODOTTO"].to_numpy()[unknown],
+                POSITION: start + np.flatnonzero(unknown),
+            }
+        )
+        codes["key"] = keys.normalize(codes["code"].to_numpy()).to_numpy()
+        if canonical_oe:
+            # Only punctuation: no key
+            tokens = tokens[tokens["key"] != ""]
+            codes = codes[codes["key"] != ""]
+        else:
+            # The separators would all be in one partition: the codes with
+            # spaces, and the separator itself, are searched in CODICE OE
+            search = codes["code"].str.contains(" ", regex=False) | (
+                codes["code"] == SEPARATOR_WORD
+            )
+            searched.update(zip(codes.loc[search, POSITION], codes.loc[search, "code"]))
+            codes = codes[~search]
+            tokens = tokens[tokens["key"] != SEPARATOR_WORD]
+
+        for name, df in [("tokens-part", tokens), ("codes-part", codes)]:
+            parts = _hash_parts(df, ["key"], partitions)
+            _spill_parts(spill, df, parts, partitions, name, number)
+    return prepared, searched
+
+
+def spill_cross_codes(spill, prepared, partitions, cancel_token=None):
+    """
+    Spills the cross codes oe_cross_codes finds for the codes spilled by
+    prepare_company1_chunks, by chunk of prepared, see chunk_cross_codes.
+    """
+    starts = prepared.starts()
+    chunks = len(prepared.lengths)
+    for partition in range(partitions):
+        check_cancelled(cancel_token)
+        tokens = _read_parts(spill, "tokens-part", partition, chunks)
+        codes = _read_parts(spill, "codes-part", partition, chunks)
+        # The products of each code, each once, in the order of the OE numbers
+        matches = (
+            codes[[POSITION, "key"]]
+            .merge(tokens, on="key")
+            .sort_values([POSITION, ORDER], kind="stable")
+            .drop_duplicates([POSITION, "product"])
+        )
+        cross_codes = (
+            matches.groupby(POSITION, sort=False)["product"]
+            .agg(OE_SEPARATOR.join)
+            .reset_index()
+        )
+        parts = _chunk_parts(cross_codes[POSITION].to_numpy(), starts)
+        _spill_parts(spill, cross_codes, parts, chunks, "cross-part", partition)
+
+
+def chunk_cross_codes(spill, number, partitions):
+    """The cross codes of the rows of chunk number, by position."""
+    cross_codes = _read_parts(spill, "cross-part", number, partitions)
+    return cross_codes.set_index(POSITION)["product"]
+
+
+def _search_codes(prepared, searched, ignored_brands, cancel_token=None):
+    """
+    The cross codes of the codes find_additional_cross_codes searches in the
+    joined CODICE OE, by position: {position: cross codes}.
+    """
+    found = {code: [] for code in set(searched.values())}
+    for rows in prepared:
+        contributor = (rows["CODICE OE"] != UNKNOWN_OE) & ~rows["BRAND"].isin(
+            ignored_brands
+        )
+        padded_oe = " " + rows.loc[contributor, "CODICE OE"].str.strip() + " "
+        products = rows.loc[contributor, "CODICE PRODOTTO"]
+        for code, code_products in found.items():
+            check_cancelled(cancel_token)
+            matches = padded_oe.str.contains(f" {code} ", regex=False)
+            code_products.extend(products[matches])
+    cross_codes = {
+        code: OE_SEPARATOR.join(pd.unique(np.array(products, dtype=object)))
+        for code, products in found.items()
+    }
+    return {position: cross_codes[code] for position, code in searched.items()}
+
+
+def company1_chunks(
+    spill,
+    prepared,
+    partitions,
+    searched,
+    brands_file_path,
+    ignored_brands,
+    shipping_cost,
+    cancel_token=None,
+):
+    """Yields the Tulero rows of each chunk of prepared, with their cross codes."""
+    for number, (rows, start) in enumerate(zip(prepared, prepared.starts())):
+        check_cancelled(cancel_token)
+        cross_codes = chunk_cross_codes(spill, number, partitions)
+        # The other rows keep none: see optimized_cross_code_generation, the
+        # labels of the merged rows are numbers
+        unknown_oe_mask = (rows["CODICE OE"] == UNKNOWN_OE) & (
+            ~rows["BRAND"].isin(ignored_brands)
+        )
+        positions = start + np.flatnonzero(unknown_oe_mask.to_numpy())
+        found = pd.Series(positions).map(cross_codes).fillna("")
+        rows.loc[unknown_oe_mask, "CODICI CROSS"] = [
+            searched.get(position, codes)
+            for position, codes in zip(positions, found)
+        ]
+        yield finish_company1_rows(
+            rows, brands_file_path, ignored_brands, shipping_cost, cancel_token
+        )
+
+
+def _write_chunks(frames, output_path, chunk_rows, file_written=None):
+    """Writes the concatenation of frames to output_path, see CsvWriter."""
+    writer = CsvWriter(output_path, min(chunk_rows, DEFAULT_CHUNK_ROWS))
+    try:
+        try:
+            for df in frames:
+                writer.write(df)
+        finally:
+            writer.close()
+    except BaseException:
+        # Not a CSV to upload
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    if file_written is not None:
+        file_written(output_path)
+
+
+def process_out_of_core(
+    articles_file_path,
+    warehouse_file_path,
+    tecdoc_file_path,
+    company1_output,
+    company2_output,
+    brands_file_path,
+    old_oems_folder,
+    ignored_brands,
+    inputs,
+    memory_budget_mb,
+    file_written=None,  # Called as file_written(path) once each CSV is written
+    cancel_token=None,  # See cancellation
+    canonical_oe=False,  # See oe_keys
+):
+    """
+    Writes the Tulero and Tyre24 CSVs twin_data_processing.main writes,
+    within about memory_budget_mb MB; the spilled rows are removed at the end.
+    """
+    chunk_rows = chunk_rows_for_budget(memory_budget_mb)
+    # quantity_refresh would refresh the outputs of an older run
+    for output_path in [company1_output, company2_output]:
+        discard_quantity_base(output_path)
+
+    spill = SpillFolder(os.path.dirname(company1_output))
+    try:
+        articles = clean_workbook(
+            spill, articles_file_path, "articles", chunk_rows, cancel_token
+        )
+        warehouse = clean_workbook(
+            spill, warehouse_file_path, "warehouse", chunk_rows, cancel_token
+        )
+        merged = merge_workbooks(spill, articles, warehouse, chunk_rows, cancel_token)
+
+        # Tyre24 is written first: its upload overlaps with Tulero
+        _write_chunks(
+            (
+                process_company2(
+                    merged_df,
+                    tecdoc_file_path,
+                    inputs["company2_markets"],
+                    cancel_token=cancel_token,
+                )
+                for merged_df in merged
+            ),
+            company2_output,
+            chunk_rows,
+            file_written,
+        )
+
+        partitions = spill_oem_lookups(
+            spill, merged, old_oems_folder, chunk_rows, cancel_token
+        )
+        prepared, searched = prepare_company1_chunks(
+            spill,
+            merged,
+            partitions,
+            ignored_brands,
+            inputs["company1_markup"],
+            canonical_oe,
+            cancel_token,
+        )
+        spill_cross_codes(spill, prepared, partitions, cancel_token)
+        if searched:
+            searched = _search_codes(prepared, searched, ignored_brands, cancel_token)
+        _write_chunks(
+            company1_chunks(
+                spill,
+                prepared,
+                partitions,
+                searched,
+                brands_file_path,
+                ignored_brands,
+                inputs["company1_shipping"],
+                cancel_token,
+            ),
+            company1_output,
+            chunk_rows,
+            file_written,
+        )
+    finally:
+        spill.close()
@@ -0,0 +1,32 @@
+# data_processing/output_paths.py
+#
+# Names of the files kept next to the CSVs. Only uses the standard library,
+# so that the window can check them without loading pandas.
+
+import os
+
+QUANTITY_BASE_SUFFIX = ".base.pkl"
+INCREMENTAL_STATE_SUFFIX = ".rows.pkl"
+OEM_LOOKUP_SUFFIX = ".oems.pkl"
+
+
+def split_output_path(output_path):
+    """Splits ".../company1_output.csv.gz" into (".../company1_output", ".csv.gz")."""
+    folder, name = os.path.split(output_path)
+    base, dot, extension = name.partition(".")
+    return os.path.join(folder, base), dot + extension
+
+
+def quantity_base_path(output_path):
+    """The last full-run output kept for quantity_refresh."""
+    return split_output_path(output_path)[0] + QUANTITY_BASE_SUFFIX
+
+
+def incremental_state_path(output_path):
+    """The row fingerprints and outputs kept for company1_incremental."""
+    return split_output_path(output_path)[0] + INCREMENTAL_STATE_SUFFIX
+
+
+def oem_lookup_path(output_path):
+    """The OEM numbers of the oemsDC files, kept for company1_incremental."""
+    return split_output_path(output_path)[0] + OEM_LOOKUP_SUFFIX
@@ -0,0 +1,306 @@
+# data_processing/polars_backend.py
+#
+# Polars backend of the processing ("dataframe_backend": "polars" in
+# config.json, see twin_data_processing.backend_stages). pandas stays the
+# reference: the workbooks, the oemsDC files and the TecDoc brands are still
+# read by the pandas loaders, and every stage takes and returns the pandas
+# frames of its pandas version (same rows, values, dtypes and index), so that
+# the CSVs are the same. The steps that pandas runs row by row in Python run
+# here as multi-threaded Polars joins: the merge of the workbooks and its
+# location filter, the grouping of the oemsDC rows, the OE numbers and cross
+# codes of the Tulero rows and the TecDoc brands of the Tyre24 rows. The
+# columns go to and from Polars through numpy, which does not need pyarrow.
+# benchmarks/backend_compare checks the parity and times both backends.
+
+import os
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from .cancellation import check_cancelled
+from .company1_processing import (
+    add_cross_codes,
+    clean_oem_rows,
+    finish_company1_rows,
+    oem_file_names,
+    prepare_company1_rows,
+)
+from .company2_processing import (
+    BRANDS_TO_IGNORE,
+    MANUAL_MAPPING,
+    ORIGINAL_BRANDS,
+    RENAME_DICT,
+    price_company2_rows,
+)
+from .data_cleaning import FILTER_KEYWORDS, FILTER_LOCATION_PATTERN
+from . import oe_keys
+from .oe_keys import OE_SEPARATOR, UNKNOWN_OE
+from .pricing import cost_base
+
+MERGE_KEYS = ["CODICE PRODOTTO", "BRAND"]
+OEM_KEYS = ["article_altc", "brand_prefix"]
+BRAND_PREFIX_LENGTH = 5  # See match_brands and vectorized_get_oem_number
+EXCLUDED_TECDOC_BRANDS = ["BEX", "RESO"]  # Dropped by match_brands
+
+
+def _strings(values):
+    """A Polars String Series of a pandas column (or array) of strings."""
+    return pl.Series(np.asarray(values, dtype=object), dtype=pl.String)
+
+
+def merge_cleaned_frames(articles_df, warehouse_df):
+    """data_cleaning.merge_cleaned_frames, joined and filtered in Polars."""
+    for df in [articles_df, warehouse_df]:
+        for column in MERGE_KEYS:
+            df[column] = df[column].str.strip()
+
+    articles = pl.DataFrame(
+        {
+            "code": _strings(articles_df["CODICE PRODOTTO"]),
+            "brand": _strings(articles_df["BRAND"]),
+            "description": _strings(articles_df["DESCRIZIONE"]),
+        }
+    ).with_row_index("article")
+    warehouse = pl.DataFrame(
+        {
+            "code": _strings(warehouse_df["CODICE PRODOTTO"]),
+            "brand": _strings(warehouse_df["BRAND"]),
+            "location": _strings(warehouse_df["UBICAZIONE"]),
+        }
+    )
+    # In the order of the pandas inner merge: by article, then warehouse row
+    merged = articles.join(
+        warehouse, on=["code", "brand"], how="inner", maintain_order="left_right"
+    ).with_row_index("merged")
+    # See data_cleaning.filter_condition
+    filtered_out = pl.col("location").str.contains(FILTER_LOCATION_PATTERN) & ~pl.col(
+        "description"
+    ).str.contains_any(FILTER_KEYWORDS)
+    kept = merged.filter(~filtered_out)
+
+    # The articles columns of the merged rows, labelled by merge position
+    merged_df = articles_df.take(kept["article"].to_numpy())
+    merged_df.index = pd.Index(kept["merged"].to_numpy().astype(np.int64))
+    return merged_df
+
+
+def load_oem_lookup(old_oems_folder):
+    """company1_processing.load_oem_lookup, grouped in Polars."""
+    oems = pl.concat(
+        [
+            pl.DataFrame(
+                {
+                    column: _strings(oems_df[column])
+                    for column in ["article_altc", "oem_number", "brand_prefix"]
+                }
+            )
+            for oems_df in (
+                clean_oem_rows(
+                    pd.read_csv(os.path.join(old_oems_folder, file_name), dtype=str)
+                )
+                for file_name in oem_file_names(old_oems_folder)
+            )
+        ]
+    )
+    # The OE numbers of a key in file and row order, the keys sorted as by
+    # the pandas groupby
+    grouped = oems.group_by(OEM_KEYS, maintain_order=True).agg("oem_number")
+    grouped = grouped.sort(OEM_KEYS)
+    keys = zip(grouped["article_altc"].to_list(), grouped["brand_prefix"].to_list())
+    return dict(zip(keys, grouped["oem_number"].to_list()))
+
+
+def oem_numbers(df, oem_lookup, ignored_brands):
+    """company1_processing.vectorized_get_oem_number, by a Polars join."""
+    lookup = pl.DataFrame(
+        {
+            "code": [code for code, _prefix in oem_lookup],
+            "prefix": [prefix for _code, prefix in oem_lookup],
+            "oe": [OE_SEPARATOR.join(numbers) for numbers in oem_lookup.values()],
+        },
+        schema={"code": pl.String, "prefix": pl.String, "oe": pl.String},
+    )
+    rows = pl.DataFrame(
+        {"code": _strings(df["CODICE PRODOTTO"]), "brand": _strings(df["BRAND"])}
+    ).with_columns(prefix=pl.col("brand").str.slice(0, BRAND_PREFIX_LENGTH))
+    numbers = rows.join(
+        lookup, on=["code", "prefix"], how="left", maintain_order="left"
+    ).select(
+        pl.when(pl.col("brand").is_in(list(ignored_brands)))
+        .then(pl.lit(""))
+        .otherwise(pl.col("oe").fill_null(UNKNOWN_OE))
+    )
+    return numbers.to_series().to_numpy()
+
+
+def oe_cross_codes(
+    codes,
+    references,
+    ignored_brands,
+    canonical=False,
+    cancel_token=None,  # See cancellation
+):
+    """
+    oe_keys.oe_cross_codes, the exact OE numbers joined in Polars. The
+    canonical ones are matched by oe_keys.
+    """
+    if canonical:
+        return oe_keys.oe_cross_codes(
+            codes, references, ignored_brands, canonical, cancel_token
+        )
+    contributor = (references["CODICE OE"] != UNKNOWN_OE) & ~references[
+        "BRAND"
+    ].isin(ignored_brands)
+    # The words of CODICE OE, as oe_keys.oe_numbers splits them
+    numbers = pl.DataFrame(
+        {
+            "oe": _strings(references.loc[contributor, "CODICE OE"].str.strip()),
+            "product": _strings(references.loc[contributor, "CODICE PRODOTTO"]),
+        }
+    ).with_columns(pl.col("oe").str.split(" ")).explode("oe")
+    codes = pd.Series(codes, dtype=object).reset_index(drop=True).astype(str)
+    searched = pl.DataFrame({"oe": _strings(codes)})
+    check_cancelled(cancel_token)
+
+    # The products of the searched OE numbers, each once, in reference order
+    joined = (
+        numbers.filter(pl.col("oe").is_in(searched["oe"].implode()))
+        .unique(maintain_order=True)
+        .group_by("oe", maintain_order=True)
+        .agg(pl.col("product").str.join(OE_SEPARATOR))
+    )
+    cross_codes = (
+        searched.join(joined, on="oe", how="left", maintain_order="left")["product"]
+        .fill_null("")
+        .to_list()
+    )
+    check_cancelled(cancel_token)
+
+    # Matched across the words of CODICE OE by the search
+    spaced = codes.str.contains(" ", regex=False).to_numpy()
+    for position in np.flatnonzero(spaced):
+        cross_codes[position] = None
+    return cross_codes
+
+
+def process_company1(
+    merged_df,
+    brands_file_path,
+    old_oems_folder,
+    ignored_brands,
+    markup,
+    shipping_cost,
+    oem_lookup=None,  # load_oem_lookup(old_oems_folder), loaded when None
+    cancel_token=None,  # See cancellation
+    base=None,  # pricing.cost_base(merged_df), computed when None
+    max_component_size=None,  # See company1_processing.add_cross_codes
+    canonical_oe=False,  # See company1_processing.add_cross_codes
+    workers=1,  # Not used, Polars runs the joins on its own threads
+):
+    """
+    company1_processing.process_company1 with the OE numbers and the exact
+    cross codes joined in Polars.
+    """
+    if oem_lookup is None:
+        oem_lookup = load_oem_lookup(old_oems_folder)
+    check_cancelled(cancel_token)
+    merged_df = prepare_company1_rows(
+        merged_df, oem_lookup, ignored_brands, markup, base, oem_numbers=oem_numbers
+    )
+    add_cross_codes(
+        merged_df,
+        ignored_brands,
+        cancel_token=cancel_token,
+        max_component_size=max_component_size,
+        canonical_oe=canonical_oe,
+        find_cross_codes=oe_cross_codes,
+    )
+    return finish_company1_rows(
+        merged_df, brands_file_path, ignored_brands, shipping_cost, cancel_token
+    )
+
+
+def match_brand(prefix, tecdoc_brand_dict):
+    """The TecDoc brand and ID that match_brands gives to a brand prefix."""
+    if prefix in BRANDS_TO_IGNORE:
+        return prefix, ""
+    if prefix in MANUAL_MAPPING:
+        tecdoc_brand = MANUAL_MAPPING[prefix]
+        return tecdoc_brand, tecdoc_brand_dict.get(tecdoc_brand, "")
+    for brand_tecdoc, brand_id in tecdoc_brand_dict.items():
+        if brand_tecdoc.startswith(prefix):
+            return brand_tecdoc, brand_id
+    return prefix, ""
+
+
+def prepare_company2_rows(merged_df, tecdoc_file_path, cancel_token=None, base=None):
+    """
+    company2_processing.prepare_company2_rows: each distinct brand prefix is
+    matched once, and the rows get the brands and IDs of their prefix by a
+    Polars join.
+    """
+    if base is None:
+        base = cost_base(merged_df)
+    stocked = base["stocked"].to_numpy()
+
+    df_tecdoc = pd.read_csv(tecdoc_file_path)
+    df_tecdoc.columns = ["ID", "Name"]
+    tecdoc_brand_dict = pd.Series(
+        df_tecdoc["ID"].values, index=df_tecdoc["Name"]
+    ).to_dict()
+
+    rows = pl.DataFrame(
+        {"prefix": _strings(merged_df["BRAND"].to_numpy()[stocked])}
+    ).with_columns(pl.col("prefix").str.slice(0, BRAND_PREFIX_LENGTH))
+    prefixes = rows["prefix"].unique(maintain_order=True).to_list()
+    matches = [match_brand(prefix, tecdoc_brand_dict) for prefix in prefixes]
+    check_cancelled(cancel_token)
+    # The IDs are kept as read (integers, "" when unmatched), by position
+    brand_ids = np.empty(len(matches), dtype=object)
+    brand_ids[:] = [brand_id for _brand, brand_id in matches]
+    brands = pl.DataFrame(
+        {
+            "prefix": pl.Series(prefixes, dtype=pl.String),
+            "brand": pl.Series([brand for brand, _id in matches], dtype=pl.String),
+            "match": pl.Series(range(len(matches)), dtype=pl.Int64),
+        }
+    )
+    rows = (
+        rows.join(brands, on="prefix", how="left", maintain_order="left")
+        .with_row_index("row")
+        .filter(~pl.col("brand").is_in(EXCLUDED_TECDOC_BRANDS))
+        .with_columns(pl.col("brand").replace(RENAME_DICT))
+        .with_columns(
+            brand_type=pl.when(pl.col("brand").is_in(ORIGINAL_BRANDS))
+            .then(pl.lit("ORIGINAL"))
+            .otherwise(pl.lit("AFTERMARKET"))
+        )
+    )
+    check_cancelled(cancel_token)
+
+    kept = np.flatnonzero(stocked)[rows["row"].to_numpy()]
+    return pd.DataFrame(
+        {
+            "TecDoc-ID": merged_df["CODICE PRODOTTO"].to_numpy()[kept],
+            "TecDoc Brand": rows["brand"].to_numpy(),
+            "Description": merged_df["DESCRIZIONE"].to_numpy()[kept],
+            "Quantity": base["quantity"].to_numpy()[kept],
+            "PRZ. ULT. ACQ.": base["cost"].to_numpy()[kept],
+            "TecDoc Brand ID": brand_ids[rows["match"].to_numpy()],
+            "Brand Type": rows["brand_type"].to_numpy(),
+        },
+        index=merged_df.index[kept],
+    )
+
+
+def process_company2(
+    merged_df,
+    tecdoc_file_path,
+    markets,  # See utility/config.company2_markets_from_config
+    cancel_token=None,  # See cancellation
+    base=None,  # pricing.cost_base(merged_df), computed when None
+):
+    """company2_processing.process_company2, the brands matched in Polars."""
+    merged_df = prepare_company2_rows(merged_df, tecdoc_file_path, cancel_token, base)
+    return price_company2_rows(merged_df, markets)
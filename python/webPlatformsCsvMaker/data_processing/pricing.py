@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# The rows priced under it (before shipping) are not listed
+MINIMUM_PRICE = 4.50
+
+
+def cost_base(merged_df):
+    """
+    The purchase cost and quantity in stock of every merged row as floats (NaN
+    when not a number), with the index of merged_df, and whether the row is
+    in stock with a cost. Computed once for both marketplaces, which then
+    only apply their markups and shipping costs.
+    """
+    costs = pd.to_numeric(merged_df["PRZ. ULT. ACQ."], errors="coerce")
+    quantities = pd.to_numeric(merged_df["GIACENZA"], errors="coerce")
+    return pd.DataFrame(
+        {
+            "cost": costs.to_numpy(dtype=float),
+            "quantity": quantities.to_numpy(dtype=float),
+            "stocked": (costs.notna() & (quantities > 0)).to_numpy(),
+        },
+        index=merged_df.index,
+    )
+
+
+# Define the custom rounding function
+def custom_round(price):
+    if pd.isnull(price):
+        return price
+    decimal_part = price % 1
+    if decimal_part <= 0.5:
+        return np.floor(price - 1) + 0.9
+    else:
+        return np.floor(price) + 0.9
+
+
+def round_prices(prices):
+    """custom_round of every price of an array, in one pass."""
+    prices = np.asarray(prices, dtype=float)
+    return np.where(
+        prices % 1 <= 0.5, np.floor(prices - 1) + 0.9, np.floor(prices) + 0.9
+    )
+
+
+def round_cents(values):
+    """round(value, 2) of every value of an array, in one pass."""
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, 2)
+    # np.round scales by 100 first, so next to half a cent it can round the
+    # other way than round(), which looks at the exact binary value. There
+    # the exact value of value * 200 (product + error, Dekker's product)
+    # tells on which side of the half cent the value is
+    scaled = np.abs(values) * 100
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    magnitude = np.abs(values[near_half])
+    cents = np.floor(scaled[near_half])
+    product = magnitude * 200
+    split = magnitude * 134217729.0  # 2**27 + 1
+    high = split - (split - magnitude)
+    error = (high * 200 - product) + (magnitude - high) * 200
+    side = (product - (2 * cents + 1)) + error
+    # Exactly half a cent is rounded to even, as round() does
+    up = (side > 0) | ((side == 0) & (cents % 2 == 1))
+    rounded[near_half] = np.copysign((cents + up) / 100, values[near_half])
+    return rounded
@@ -0,0 +1,245 @@
+# data_processing/pricing_scenarios.py
+#
+# Pricing scenarios: compares several markup/shipping sets in one run. The
+# workbooks are merged and the Tulero and Tyre24 rows are built once (OEM
+# numbers, cross codes, brands) without prices; the prices of all the
+# scenarios are then computed at once, as a (rows x scenarios) matrix of the
+# purchase costs. Each scenario gives the CSVs a run with its values would
+# write, and a line of the summary: rows of each CSV and their revenue
+# (price x quantity in stock).
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from . import csv_writer
+from .cancellation import check_cancelled
+from .company1_processing import (
+    add_cross_codes,
+    label_company1_rows,
+    prepare_company1_shards,
+)
+from .company2_processing import (
+    EXCLUDED_BRANDS,
+    output_columns,
+    prepare_company2_rows,
+)
+from .output_paths import split_output_path
+from .pricing import MINIMUM_PRICE, round_cents, round_prices
+
+SCENARIO_FOLDER = "scenarios"  # In the output folder
+SUMMARY_FILE = "summary.csv"
+COMPANY1_KEYS = ["company1_markup", "company1_shipping"]
+
+
+def pricing_keys(markets):
+    """The keys a scenario can set, company2_markup_it etc. for the markets."""
+    return COMPANY1_KEYS + [
+        f"company2_{value}_{market['market']}"
+        for market in markets
+        for value in ["markup", "shipping"]
+    ]
+
+
+def load_scenarios(path):
+    """Reads a JSON list of scenarios: [{"name": "low", "company1_markup": 1.15}]."""
+    with open(path, encoding="utf-8") as file:
+        scenarios = json.load(file)
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ValueError(f"{path} must contain a list of scenarios")
+    return scenarios
+
+
+def complete_scenarios(scenarios, inputs):
+    """
+    Returns the scenarios with a name and all the pricing values, those a
+    scenario does not set are taken from inputs: {"name", "company1_markup",
+    "company1_shipping", "company2_markets"}.
+    """
+    markets = inputs["company2_markets"]
+    completed = []
+    for number, scenario in enumerate(scenarios, start=1):
+        unknown = set(scenario) - set(pricing_keys(markets)) - {"name"}
+        if unknown:
+            raise ValueError(f"Unknown scenario keys: {', '.join(sorted(unknown))}")
+        values = {key: float(scenario.get(key, inputs[key])) for key in COMPANY1_KEYS}
+        values["company2_markets"] = [
+            {
+                **market,
+                **{
+                    value: float(
+                        scenario.get(
+                            f"company2_{value}_{market['market']}", market[value]
+                        )
+                    )
+                    for value in ["markup", "shipping"]
+                },
+            }
+            for market in markets
+        ]
+        completed.append({"name": str(scenario.get("name", number)), **values})
+    names = [scenario["name"] for scenario in completed]
+    for name in names:
+        # Part of the file names
+        if not re.fullmatch(r"[\w.-]+", name):
+            raise ValueError(f"Invalid scenario name: {name!r}")
+    if len(set(names)) != len(names):
+        raise ValueError("The scenario names must be different")
+    return completed
+
+
+def _column(scenarios, key):
+    return np.array([scenario[key] for scenario in scenarios])
+
+
+def _market_values(scenarios, key):
+    """(scenarios x markets) array of the markups or shippings."""
+    return np.array(
+        [
+            [market[key] for market in scenario["company2_markets"]]
+            for scenario in scenarios
+        ]
+    )
+
+
+def summary_values(scenario):
+    """The values of a completed scenario, with the keys of the scenario files."""
+    values = {key: scenario[key] for key in ["name"] + COMPANY1_KEYS}
+    for market in scenario["company2_markets"]:
+        for value in ["markup", "shipping"]:
+            values[f"company2_{value}_{market['market']}"] = market[value]
+    return values
+
+
+def company1_prices(costs, scenarios):
+    """
+    Returns which rows each scenario keeps and their PREZZO, as process_company1
+    computes them: (rows x scenarios) arrays.
+    """
+    base = round_cents(costs[:, None] * _column(scenarios, "company1_markup"))
+    prices = round_prices(base + _column(scenarios, "company1_shipping"))
+    return base >= MINIMUM_PRICE, prices
+
+
+def company2_prices(costs, scenarios):
+    """
+    Returns which rows each scenario keeps, (rows x scenarios), and their
+    price in every market, (rows x scenarios x markets), as
+    company2_processing.market_prices computes them.
+    """
+    prices = costs[:, None, None] * _market_values(scenarios, "markup")
+    return (
+        prices[:, :, 0] >= MINIMUM_PRICE,
+        round_prices(prices + _market_values(scenarios, "shipping")),
+    )
+
+
+def company1_catalog(
+    merged_df,
+    base,
+    brands_file_path,
+    oem_lookup,
+    ignored_brands,
+    cancel_token=None,
+    max_component_size=None,  # See company1_processing.add_cross_codes
+    canonical_oe=False,  # See company1_processing.add_cross_codes
+    workers=1,  # See company1_processing.prepare_company1_shards
+):
+    """The Tulero rows before pricing, with the index of merged_df."""
+    rows = prepare_company1_shards(
+        merged_df.copy(), oem_lookup, ignored_brands, 1.0, base, workers, cancel_token
+    )
+    add_cross_codes(
+        rows,
+        ignored_brands,
+        cancel_token=cancel_token,
+        max_component_size=max_component_size,
+        canonical_oe=canonical_oe,
+    )
+    return label_company1_rows(rows, brands_file_path, ignored_brands, cancel_token)
+
+
+def company2_catalog(merged_df, base, tecdoc_file_path, cancel_token=None):
+    """The Tyre24 rows before pricing, with their purchase cost."""
+    rows = prepare_company2_rows(merged_df, tecdoc_file_path, cancel_token, base)
+    return rows[~rows["TecDoc Brand"].isin(EXCLUDED_BRANDS)]
+
+
+def _revenue(keep, prices, quantities):
+    """Price x quantity of the rows each scenario keeps, summed by scenario."""
+    return np.round(np.where(keep, prices, 0.0).T @ quantities, 2)
+
+
+def scenario_path(output_path, name):
+    """output_folder/scenarios/company1_output_<name>.csv for output_path."""
+    base, extension = split_output_path(output_path)
+    folder, file_name = os.path.split(base)
+    return os.path.join(folder, SCENARIO_FOLDER, f"{file_name}_{name}{extension}")
+
+
+def write_scenarios(
+    base,  # pricing.cost_base of the merged rows
+    company1_rows,  # See company1_catalog
+    company2_rows,  # See company2_catalog
+    scenarios,  # See complete_scenarios
+    company1_output,
+    company2_output,
+    write_csv=None,  # Called as write_csv(df, path) instead of csv_writer's
+    summary_only=False,  # Only write the summary, not the CSVs
+    cancel_token=None,  # See cancellation
+):
+    """
+    Writes the Tulero and Tyre24 CSVs of every scenario in the scenarios
+    folder next to the outputs, and the summary. Returns the summary.
+    """
+    # prepare_company1_rows prices the purchase costs of the merged rows
+    company1_keep, company1_price = company1_prices(
+        base["cost"].loc[company1_rows.index].to_numpy(), scenarios
+    )
+    company2_keep, company2_price = company2_prices(
+        company2_rows["PRZ. ULT. ACQ."].to_numpy(dtype=float), scenarios
+    )
+    company1_quantity = company1_rows["GIACENZA"].to_numpy(dtype=float)
+    company2_quantity = company2_rows["Quantity"].to_numpy(dtype=float)
+
+    markets = scenarios[0]["company2_markets"]
+    summary = pd.DataFrame([summary_values(scenario) for scenario in scenarios])
+    summary["company1_rows"] = company1_keep.sum(axis=0)
+    summary["company1_revenue"] = _revenue(
+        company1_keep, company1_price, company1_quantity
+    )
+    summary["company2_rows"] = company2_keep.sum(axis=0)
+    for number, market in enumerate(markets):
+        summary[f"company2_revenue_{market['market']}"] = _revenue(
+            company2_keep, company2_price[:, :, number], company2_quantity
+        )
+    summary_path = os.path.join(
+        os.path.dirname(company1_output), SCENARIO_FOLDER, SUMMARY_FILE
+    )
+    os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+    csv_writer.write_csv(summary, summary_path)
+    if summary_only:
+        return summary
+
+    write = write_csv or csv_writer.write_csv
+    for number, scenario in enumerate(scenarios):
+        check_cancelled(cancel_token)
+        keep1 = company1_keep[:, number]
+        keep2 = company2_keep[:, number]
+        company1_df = company1_rows[keep1].copy()
+        company1_df["PREZZO"] = company1_price[keep1, number]
+        company2_df = company2_rows[keep2].copy()
+        for column, market in enumerate(markets):
+            company2_df[market["column"]] = company2_price[keep2, number, column]
+        for df, output_path in [
+            (company1_df, company1_output),
+            (company2_df[output_columns(markets)], company2_output),
+        ]:
+            path = scenario_path(output_path, scenario["name"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write(df, path)
+
+    return summary
@@ -0,0 +1,135 @@
+# data_processing/quantity_refresh.py
+#
+# Quantities-only refresh. During the day only GIACENZA changes, so instead
+# of running the whole pipeline (OEM lookup, cross codes, TecDoc brands) the
+# new quantities are joined onto the outputs of the last full run. With
+# "quantity_refresh" in config.json, every full run keeps its outputs as
+# company1_output.base.pkl, with the article (CODICE PRODOTTO, BRAND) each row
+# comes from, since the output brands are renamed.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from . import csv_writer
+from .cancellation import check_cancelled
+from .data_cleaning import load_and_clean_excel_file
+from .delta_feed import DELTA_KEYS, write_delta_feed
+from .output_paths import quantity_base_path
+
+SOURCE_KEYS = ["CODICE PRODOTTO", "BRAND"]
+QUANTITY_COLUMNS = {"company1": "GIACENZA", "company2": "Quantity"}
+SOURCE_CODE = "_source_code"
+SOURCE_BRAND = "_source_brand"
+
+
+def has_quantity_base(output_path):
+    return os.path.exists(quantity_base_path(output_path))
+
+
+def save_quantity_base(result, merged_df, output_path):
+    """Keeps a full-run output with the article key of every row."""
+    # The branches keep the index of merged_df
+    source = merged_df.loc[result.index, SOURCE_KEYS]
+    base = result.assign(
+        **{
+            SOURCE_CODE: source["CODICE PRODOTTO"].to_numpy(),
+            SOURCE_BRAND: source["BRAND"].to_numpy(),
+        }
+    )
+    path = quantity_base_path(output_path)
+    temporary_path = path + ".tmp"
+    base.to_pickle(temporary_path)
+    os.replace(temporary_path, path)
+
+
+def discard_quantity_base(output_path):
+    """Removes the base of an older run, which a refresh would start from."""
+    if has_quantity_base(output_path):
+        os.remove(quantity_base_path(output_path))
+
+
+def load_quantities(articles_file_path, cancel_token=None):
+    """
+    Returns GIACENZA by (CODICE PRODOTTO, BRAND), for the articles in stock.
+    Raises ValueError when an article has several rows: the full run keeps
+    each of them with its own GIACENZA, and the outputs it kept do not say
+    which row an output row comes from.
+    """
+    # Only keeps GIACENZA > 0 with a purchase price, as the full run
+    articles_df = load_and_clean_excel_file(
+        articles_file_path, "articles", cancel_token
+    )
+    duplicated = articles_df.duplicated(SOURCE_KEYS)
+    if duplicated.any():
+        examples = ", ".join(
+            f"{code} {brand}"
+            for code, brand in articles_df.loc[duplicated, SOURCE_KEYS]
+            .drop_duplicates()
+            .head(5)
+            .itertuples(index=False)
+        )
+        raise ValueError(
+            f"{duplicated.sum()} articles have several rows in "
+            f"{os.path.basename(articles_file_path)} (e.g. {examples}), their "
+            "quantities cannot be refreshed, process all the files"
+        )
+    return articles_df.set_index(SOURCE_KEYS)["GIACENZA"]
+
+
+def refresh_output(base, quantities, quantity_column):
+    """Returns the rows of base still in stock, with their new quantity."""
+    source = pd.MultiIndex.from_arrays([base[SOURCE_CODE], base[SOURCE_BRAND]])
+    positions = quantities.index.get_indexer(source)
+    in_stock = positions >= 0
+    columns = [c for c in base.columns if c not in (SOURCE_CODE, SOURCE_BRAND)]
+    refreshed = base.loc[in_stock, columns].copy()
+    refreshed[quantity_column] = quantities.to_numpy()[positions[in_stock]]
+    return refreshed
+
+
+def refresh_quantities(
+    articles_file_path,
+    company1_output,
+    company2_output,
+    write_csv=None,  # Called as write_csv(df, path) instead of csv_writer's
+    delta=False,
+    cancel_token=None,  # See cancellation
+):
+    """
+    Rewrites the Tulero and Tyre24 CSVs of the last full run with the
+    quantities of the articles workbook. Articles out of stock are dropped and
+    come back when they are in stock again; articles that were not in the
+    last full run, and the cross codes, need a full run. Returns the same as
+    twin_data_processing.main.
+    """
+    outputs = {"company1": company1_output, "company2": company2_output}
+    for output_path in outputs.values():
+        if not has_quantity_base(output_path):
+            raise ValueError(
+                f"No full run found for {os.path.basename(output_path)}, "
+                "process all the files first with quantity_refresh on in "
+                "config.json"
+            )
+
+    quantities = load_quantities(articles_file_path, cancel_token)
+    write = write_csv or csv_writer.write_csv
+
+    def refresh(company, output_path):
+        base = pd.read_pickle(quantity_base_path(output_path))
+        refreshed = refresh_output(base, quantities, QUANTITY_COLUMNS[company])
+        check_cancelled(cancel_token)
+        write(refreshed, output_path)
+        if delta:
+            return write_delta_feed(refreshed, output_path, DELTA_KEYS[company])
+        return None
+
+    # The two files are written in parallel
+    with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+        futures = {
+            company: executor.submit(refresh, company, output_path)
+            for company, output_path in outputs.items()
+        }
+        deltas = {company: future.result() for company, future in futures.items()}
+    return deltas if delta else None
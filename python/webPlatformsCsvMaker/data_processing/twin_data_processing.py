@@ -1,11 +1,29 @@
 import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from pandarallel import pandarallel
 
-from .data_cleaning import merge_files
-from .company1_processing import process_company1
+from . import csv_writer
+from .cancellation import check_cancelled
+from .checkpoints import (
+    NoCheckpoints,
+    StageCheckpoints,
+    file_fingerprint,
+    oem_folder_fingerprint,
+    oem_lookup_from_frame,
+    oem_lookup_to_frame,
+    stage_key,
+)
+from .data_cleaning import load_and_clean_excel_file, merge_cleaned_frames
+from .delta_feed import DELTA_KEYS, write_delta_feed
+from .pricing import cost_base
+from .pricing_scenarios import company1_catalog, company2_catalog, write_scenarios
+from .quantity_refresh import discard_quantity_base, save_quantity_base
+from .company1_incremental import process_company1_incremental
+from .company1_processing import load_oem_lookup, process_company1
 from .company2_processing import process_company2
+from .out_of_core import process_out_of_core
 
 multiprocessing.freeze_support()
 multiprocessing.set_start_method("spawn", force=True)
@@ -29,40 +47,318 @@ def main(
     old_oems_folder,
     ignored_brands,
     inputs,  # Add the inputs for pricing adjustments
+    write_csv=None,  # Called as write_csv(df, path) instead of csv_writer's
+    delta=False,  # Also write the rows added/changed/removed since the last run
+    incremental=False,  # Only process the Tulero rows changed since the last run
+    checkpoint=False,  # Save the stages, so that a retry resumes after them
+    cancel_token=None,  # cancellation.CancellationToken, checked by the stages
+    max_component_size=None,  # Cross codes from OE components, see cross_references
+    canonical_oe=False,  # Compare the OE numbers without punctuation and case
+    company1_workers=1,  # See company1_processing.prepare_company1_shards
+    memory_budget_mb=None,  # Process out of core in this budget, see out_of_core
+    file_written=None,  # Called as file_written(path) after each out-of-core CSV
+    backend="pandas",  # Dataframe engine of the stages, see backend_stages
+    quantity_base=False,  # Keep the outputs for quantity_refresh
+):
+    """
+    Processes the stock files and writes the Tulero and Tyre24 CSVs. With
+    delta, returns the number of rows of each delta file by company (None on
+    the first run), see delta_feed. Raises cancellation.ProcessingCancelled
+    when cancel_token is cancelled. With max_component_size or canonical_oe
+    the Tulero rows are always all processed, incremental only works with the
+    exact OE groups. With memory_budget_mb the CSVs are written by
+    out_of_core, without checkpoints, delta or incremental processing; the
+    out-of-core and incremental Tulero rows are processed by pandas with any
+    backend.
+    """
+    if memory_budget_mb is not None:
+        if max_component_size is not None:
+            raise ValueError(
+                "The cross reference components need the whole catalog in "
+                "memory: turn off out_of_core_processing or "
+                "cross_reference_components"
+            )
+        process_out_of_core(
+            articles_file_path,
+            warehouse_file_path,
+            tecdoc_file_path,
+            company1_output,
+            company2_output,
+            brands_file_path,
+            old_oems_folder,
+            ignored_brands,
+            inputs,
+            memory_budget_mb,
+            file_written,
+            cancel_token,
+            canonical_oe,
+        )
+        return None
+
+    if checkpoint:
+        # See checkpoints, in the output folder
+        checkpoints = StageCheckpoints(os.path.dirname(company1_output))
+    else:
+        checkpoints = NoCheckpoints()
+    try:
+        deltas = _process_and_write(
+            checkpoints,
+            articles_file_path,
+            warehouse_file_path,
+            tecdoc_file_path,
+            company1_output,
+            company2_output,
+            brands_file_path,
+            old_oems_folder,
+            ignored_brands,
+            inputs,
+            write_csv,
+            delta,
+            incremental and max_component_size is None and not canonical_oe,
+            cancel_token,
+            max_component_size,
+            canonical_oe,
+            company1_workers,
+            backend_stages(backend),
+            quantity_base,
+        )
+    except Exception:
+        checkpoints.collect_garbage(succeeded=False)
+        raise
+    checkpoints.collect_garbage(succeeded=True)
+    return deltas if delta else None
+
+
+def backend_stages(backend):
+    """
+    Returns the merge_cleaned_frames, load_oem_lookup, process_company1 and
+    process_company2 of a dataframe backend, see utility/config
+    DATAFRAME_BACKENDS: pandas, the reference, or polars_backend.
+    """
+    if backend == "pandas":
+        return merge_cleaned_frames, load_oem_lookup, process_company1, process_company2
+    if backend == "polars":
+        # Imports polars, an optional dependency
+        from . import polars_backend
+
+        return (
+            polars_backend.merge_cleaned_frames,
+            polars_backend.load_oem_lookup,
+            polars_backend.process_company1,
+            polars_backend.process_company2,
+        )
+    raise ValueError(f"Unknown dataframe backend: {backend}")
+
+
+def _process_and_write(
+    checkpoints,
+    articles_file_path,
+    warehouse_file_path,
+    tecdoc_file_path,
+    company1_output,
+    company2_output,
+    brands_file_path,
+    old_oems_folder,
+    ignored_brands,
+    inputs,
+    write_csv,
+    delta,
+    incremental,
+    cancel_token,
+    max_component_size,
+    canonical_oe,
+    company1_workers,
+    stages,  # See backend_stages
+    quantity_base,
 ):
+    merge_frames, load_lookup, company1_rows, company2_rows = stages
+    # Each stage is keyed by the fingerprints of its inputs (not the backend,
+    # the backends give the same frames)
+    articles_key = stage_key(file_fingerprint(articles_file_path))
+    warehouse_key = stage_key(file_fingerprint(warehouse_file_path))
+    merged_key = stage_key(articles_key, warehouse_key)
+    oem_key = stage_key(oem_folder_fingerprint(old_oems_folder))
+    company1_key = stage_key(
+        merged_key,
+        oem_key,
+        file_fingerprint(brands_file_path),
+        sorted(ignored_brands),
+        inputs["company1_markup"],
+        inputs["company1_shipping"],
+        max_component_size,
+        canonical_oe,
+    )
+    company2_key = stage_key(
+        merged_key,
+        file_fingerprint(tecdoc_file_path),
+        inputs["company2_markets"],
+    )
+
     # Merge files
-    merged_df = merge_files(articles_file_path, warehouse_file_path)
+    def merge():
+        warehouse_df = checkpoints.run(
+            "warehouse",
+            warehouse_key,
+            lambda: load_and_clean_excel_file(
+                warehouse_file_path, "warehouse", cancel_token
+            ),
+        )
+        articles_df = checkpoints.run(
+            "articles",
+            articles_key,
+            lambda: load_and_clean_excel_file(
+                articles_file_path, "articles", cancel_token
+            ),
+        )
+        check_cancelled(cancel_token)
+        return merge_frames(articles_df, warehouse_df)
 
-    # Use ThreadPoolExecutor to run Tulero and Tyre24 processing concurrently
-    with ThreadPoolExecutor() as executor:
-        company1_future = executor.submit(
-            process_company1,
-            merged_df.copy(),  # Use copy to avoid potential conflicts
+    merged_df = checkpoints.run("merged", merged_key, merge)
+    # After a failure or cancel the completed stages of this run are kept, so
+    # the retry resumes after them; a successful run deletes them
+    check_cancelled(cancel_token)
+    # The costs and quantities are parsed once, for both branches
+    base = cost_base(merged_df)
+
+    def company1():
+        company1_args = [
+            merged_df.copy(),  # Tulero adds its columns to it
             brands_file_path,
             old_oems_folder,
             ignored_brands,
             inputs["company1_markup"],  # Pass markup for Tulero
             inputs["company1_shipping"],  # Pass shipping for Tulero
+        ]
+        if incremental:
+            # See company1_incremental, the state is kept next to the CSV
+            return process_company1_incremental(
+                *company1_args, company1_output, cancel_token=cancel_token
+            )
+        oem_lookup = checkpoints.run(
+            "oem_lookup",
+            oem_key,
+            lambda: load_lookup(old_oems_folder),
+            to_frame=oem_lookup_to_frame,
+            from_frame=oem_lookup_from_frame,
         )
-        company2_future = executor.submit(
-            process_company2,
-            merged_df.copy(),  # Use copy to avoid potential conflicts
+        return company1_rows(
+            *company1_args,
+            oem_lookup=oem_lookup,
+            cancel_token=cancel_token,
+            base=base,
+            max_component_size=max_component_size,
+            canonical_oe=canonical_oe,
+            workers=company1_workers,
+        )
+
+    def company2():
+        return company2_rows(
+            merged_df,  # Not changed, Tyre24 builds its own frame
             tecdoc_file_path,
-            inputs["company2_markup_it"],  # Pass markup for Tyre24 (Italy)
-            inputs["company2_shipping_it"],  # Pass shipping for Tyre24 (Italy)
-            inputs["company2_markup_de"],  # Pass markup for Tyre24 (Germany)
-            inputs["company2_shipping_de"],  # Pass shipping for Tyre24 (Germany)
+            inputs["company2_markets"],  # Markup and shipping of each market
+            cancel_token=cancel_token,
+            base=base,
+        )
+
+    # Use ThreadPoolExecutor to run Tulero and Tyre24 processing concurrently
+    with ThreadPoolExecutor() as executor:
+        company1_future = executor.submit(
+            checkpoints.run, "company1", company1_key, company1
+        )
+        company2_future = executor.submit(
+            checkpoints.run, "company2", company2_key, company2
         )
 
-        # Wait for both to complete and get the results
-        company1_result = company1_future.result()
-        company2_result = company2_future.result()
+        # Write each result as soon as its branch is done, so that its upload
+        # (see write_csv) overlaps with the other branch; when both are done
+        # the two files are written in parallel
+        outputs = {
+            company1_future: ("company1", company1_output),
+            company2_future: ("company2", company2_output),
+        }
+        # e.g. ftp_utils.OutputUploader.write_csv, which also uploads
+        write = write_csv or csv_writer.write_csv
 
-    # print("Both processes completed.")
+        def write_output(result, company, output_path):
+            check_cancelled(cancel_token)
+            write(result, output_path)
+            if quantity_base:
+                # Used by quantity_refresh.refresh_quantities
+                save_quantity_base(result, merged_df, output_path)
+            else:
+                # A refresh would start from the outputs of an older run
+                discard_quantity_base(output_path)
+            if delta:
+                return write_delta_feed(result, output_path, DELTA_KEYS[company])
+            return None
 
-    # Save the results to CSV files
-    company1_result.to_csv(company1_output, index=False)
-    company2_result.to_csv(company2_output, index=False)
+        writes = {
+            outputs[future][0]: executor.submit(
+                write_output, future.result(), *outputs[future]
+            )
+            for future in as_completed(outputs)
+        }
+        return {company: future.result() for company, future in writes.items()}
+
+
+def pricing_scenarios(
+    articles_file_path,
+    warehouse_file_path,
+    tecdoc_file_path,
+    company1_output,
+    company2_output,
+    brands_file_path,
+    old_oems_folder,
+    ignored_brands,
+    scenarios,  # See pricing_scenarios.complete_scenarios
+    write_csv=None,
+    summary_only=False,  # Only write the summary, not the CSVs
+    cancel_token=None,
+    max_component_size=None,  # See main
+    canonical_oe=False,  # See main
+    company1_workers=1,  # See main
+):
+    """
+    Writes the CSVs and the summary of every pricing scenario, see
+    pricing_scenarios: the rows are built once and priced for all of them.
+    Returns the summary.
+    """
+    merged_df = merge_cleaned_frames(
+        load_and_clean_excel_file(articles_file_path, "articles", cancel_token),
+        load_and_clean_excel_file(warehouse_file_path, "warehouse", cancel_token),
+    )
+    check_cancelled(cancel_token)
+    base = cost_base(merged_df)
+    oem_lookup = load_oem_lookup(old_oems_folder)
+
+    # The Tulero and Tyre24 rows are built concurrently, as in a run
+    with ThreadPoolExecutor() as executor:
+        company1_future = executor.submit(
+            company1_catalog,
+            merged_df,
+            base,
+            brands_file_path,
+            oem_lookup,
+            ignored_brands,
+            cancel_token,
+            max_component_size,
+            canonical_oe,
+            company1_workers,
+        )
+        company2_future = executor.submit(
+            company2_catalog, merged_df, base, tecdoc_file_path, cancel_token
+        )
+        company1_rows = company1_future.result()
+        company2_rows = company2_future.result()
 
-    # print(f"Tulero CSV saved to {company1_output}")
-    # print(f"Tyre24 CSV saved to {company2_output}")
+    return write_scenarios(
+        base,
+        company1_rows,
+        company2_rows,
+        scenarios,
+        company1_output,
+        company2_output,
+        write_csv,
+        summary_only,
+        cancel_token,
+    )
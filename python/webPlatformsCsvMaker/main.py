@@ -7,8 +7,9 @@ import sys
 from PyQt6.QtCore import QTimer
 from PyQt6.QtGui import QDoubleValidator, QFont, QIcon, QIntValidator
 from PyQt6.QtWidgets import QApplication, QLineEdit, QMainWindow, QMessageBox, QWidget
+from data_processing.output_paths import quantity_base_path
 from translations import _
-from utility.config import load_config, save_config
+from utility.config import company2_markets_from_config, load_config, save_config
 from utility.error_handlers import processing_error
 from utility.file_browser import (
     browse_articles,
@@ -18,8 +19,10 @@ from utility.file_browser import (
     browse_tecdoc,
     browse_warehouse,
 )
+from utility.ftp_utils import output_file_name
+from utility.startup_probe import install_startup_probe, startup_probe_enabled
 from utility.ui_setup import setup_ui
-from worker import Worker
+from worker import Worker, warm_up_data_processing
 from workerFtp import UploadDialog
 
 multiprocessing.freeze_support()
@@ -27,6 +30,9 @@ multiprocessing.freeze_support()
 CONFIG_FILE = "config.json"
 DATA_FOLDER = "Data"
 OUTPUT_FOLDER = "Output"
+# Delay before pandas & co. are imported in the background, so that the
+# first paint of the window is not slowed down by the import
+WARM_UP_DELAY_MS = 500
 
 
 class MainWindow(QMainWindow):
@@ -41,6 +47,9 @@ class MainWindow(QMainWindow):
         icon_path = os.path.join(base_path, "icons", "icon256.ico")
         self.setWindowIcon(QIcon(icon_path))
 
+        # The Tyre24 markets, each gets its markup and shipping cost fields
+        self.company2_markets = company2_markets_from_config(load_config())
+
         # Setup UI using utils
         layout, widgets = setup_ui(self, base_path)
         container = QWidget()
@@ -67,7 +76,9 @@ class MainWindow(QMainWindow):
             "upload_company2_checkbox",    # Corrected Naming
             "progress_bar",
             "process_button",
+            "quantities_button",
             "upload_button",
+            "cancel_button",
             "articles_button",
             "oem_button",
             "brands_button",
@@ -98,44 +109,48 @@ class MainWindow(QMainWindow):
 
         # Set validators for percentage fields
         self.company1_markup_entry = widgets.get("company1_markup_entry")
-        self.company2_markup_it_entry = widgets.get("company2_markup_it_entry")
-        self.company2_markup_de_entry = widgets.get("company2_markup_de_entry")
-
         self.company1_shipping_entry = widgets.get("company1_shipping_entry")
-        self.company2_shipping_it_entry = widgets.get("company2_shipping_it_entry")
-        self.company2_shipping_de_entry = widgets.get("company2_shipping_de_entry")
+        # Fields of the Tyre24 markets, by market
+        self.company2_markup_entries = {}
+        self.company2_shipping_entries = {}
+        for market in self.company2_markets:
+            key = market["market"]
+            self.company2_markup_entries[key] = widgets.get(f"company2_markup_{key}_entry")
+            self.company2_shipping_entries[key] = widgets.get(
+                f"company2_shipping_{key}_entry"
+            )
 
         self.company1_markup_entry.setValidator(QIntValidator(10, 35, self))
-        self.company2_markup_it_entry.setValidator(QIntValidator(10, 35, self))
-        self.company2_markup_de_entry.setValidator(QIntValidator(10, 35, self))
+        for entry in self.company2_markup_entries.values():
+            entry.setValidator(QIntValidator(10, 35, self))
 
         # Set validators for shipping cost fields
         shipping_validator = QDoubleValidator(7.0, 20.0, 1, self)
         shipping_validator.setNotation(QDoubleValidator.Notation.StandardNotation)
         self.company1_shipping_entry.setValidator(shipping_validator)
-        self.company2_shipping_it_entry.setValidator(shipping_validator)
-        self.company2_shipping_de_entry.setValidator(shipping_validator)
+        for entry in self.company2_shipping_entries.values():
+            entry.setValidator(shipping_validator)
 
         # Connect textChanged signals to validation methods
         self.company1_markup_entry.textChanged.connect(
             lambda: self.validate_percentage(self.company1_markup_entry, "markup")
         )
-        self.company2_markup_it_entry.textChanged.connect(
-            lambda: self.validate_percentage(self.company2_markup_it_entry, "markup_it")
-        )
-        self.company2_markup_de_entry.textChanged.connect(
-            lambda: self.validate_percentage(self.company2_markup_de_entry, "markup_de")
-        )
+        for key, entry in self.company2_markup_entries.items():
+            entry.textChanged.connect(
+                lambda _text, entry=entry, key=key: self.validate_percentage(
+                    entry, f"markup_{key}"
+                )
+            )
 
         self.company1_shipping_entry.textChanged.connect(
             lambda: self.validate_shipping(self.company1_shipping_entry, "shipping")
         )
-        self.company2_shipping_it_entry.textChanged.connect(
-            lambda: self.validate_shipping(self.company2_shipping_it_entry, "shipping_it")
-        )
-        self.company2_shipping_de_entry.textChanged.connect(
-            lambda: self.validate_shipping(self.company2_shipping_de_entry, "shipping_de")
-        )
+        for key, entry in self.company2_shipping_entries.items():
+            entry.textChanged.connect(
+                lambda _text, entry=entry, key=key: self.validate_shipping(
+                    entry, f"shipping_{key}"
+                )
+            )
 
         # Initialize symbol appending (no longer needed)
         self.append_symbols()
@@ -144,12 +159,12 @@ class MainWindow(QMainWindow):
 
         # Trigger validation for pre-filled fields
         self.validate_percentage(self.company1_markup_entry, "markup")
-        self.validate_percentage(self.company2_markup_it_entry, "markup_it")
-        self.validate_percentage(self.company2_markup_de_entry, "markup_de")
+        for key, entry in self.company2_markup_entries.items():
+            self.validate_percentage(entry, f"markup_{key}")
 
         self.validate_shipping(self.company1_shipping_entry, "shipping")
-        self.validate_shipping(self.company2_shipping_it_entry, "shipping_it")
-        self.validate_shipping(self.company2_shipping_de_entry, "shipping_de")
+        for key, entry in self.company2_shipping_entries.items():
+            self.validate_shipping(entry, f"shipping_{key}")
 
 
 
@@ -201,28 +216,25 @@ class MainWindow(QMainWindow):
         # Load and set Markup and Shipping Costs
         # Markup Fields
         company1_markup = config.get("company1_markup", 1.25)  # Default: 1.25 (25%)
-        company2_markup_it = config.get("company2_markup_it", 1.25)  # Default: 1.25 (25%)
-        company2_markup_de = config.get("company2_markup_de", 1.25)  # Default: 1.25 (25%)
 
         # Convert internal value to display value (e.g., 1.25 -> 25)
         company1_markup_display = int((company1_markup - 1) * 100)
-        company2_markup_it_display = int((company2_markup_it - 1) * 100)
-        company2_markup_de_display = int((company2_markup_de - 1) * 100)
 
         # Set the text with '%' symbol
         self.company1_markup_entry.setText(f"{company1_markup_display}%")
-        self.company2_markup_it_entry.setText(f"{company2_markup_it_display}%")
-        self.company2_markup_de_entry.setText(f"{company2_markup_de_display}%")
 
         # Shipping Cost Fields
         company1_shipping = config.get("company1_shipping", 7.5)  # Default: 7.5€
-        company2_shipping_it = config.get("company2_shipping_it", 7.5)  # Default: 7.5€
-        company2_shipping_de = config.get("company2_shipping_de", 10.5)  # Default: 10.5€
 
         # Set the text with '€' symbol
         self.company1_shipping_entry.setText(f"{company1_shipping}€")
-        self.company2_shipping_it_entry.setText(f"{company2_shipping_it}€")
-        self.company2_shipping_de_entry.setText(f"{company2_shipping_de}€")
+
+        # Markup and shipping cost of each Tyre24 market
+        for market in self.company2_markets:
+            key = market["market"]
+            company2_markup_display = int((market["markup"] - 1) * 100)
+            self.company2_markup_entries[key].setText(f"{company2_markup_display}%")
+            self.company2_shipping_entries[key].setText(f"{market['shipping']}€")
 
         # Existing file and folder loading logic
         if os.path.exists(articles_file):
@@ -275,14 +287,26 @@ class MainWindow(QMainWindow):
 
     def update_upload_button_state(self):
         try:
-            company1_csv = os.path.join(self.output_folder, "company1_output.csv")
-            company2_csv = os.path.join(self.output_folder, "company2_output.csv")
+            compression = load_config().get("output_compression", "none")
+            company1_csv = os.path.join(
+                self.output_folder, output_file_name("company1", compression)
+            )
+            company2_csv = os.path.join(
+                self.output_folder, output_file_name("company2", compression)
+            )
             if os.path.exists(company1_csv) and os.path.exists(company2_csv):
                 self.upload_button.setEnabled(True)
             else:
                 self.upload_button.setEnabled(False)
-        except FileNotFoundError:
+            # The quantities can be refreshed once a full run kept its outputs
+            self.quantities_button.setEnabled(
+                bool(self.articles_file)
+                and os.path.exists(quantity_base_path(company1_csv))
+                and os.path.exists(quantity_base_path(company2_csv))
+            )
+        except (FileNotFoundError, ValueError):
             self.upload_button.setEnabled(False)
+            self.quantities_button.setEnabled(False)
 
     def validate_percentage(self, field: QLineEdit, field_type: str):
         text = field.text().replace("%", "").strip()
@@ -336,14 +360,28 @@ class MainWindow(QMainWindow):
             config_values = {
                 "company1_markup": getattr(self, "markup_value", None),
                 "company1_shipping": getattr(self, "shipping_value", None),
-                "company2_markup_it": getattr(self, "markup_it_value", None),
-                "company2_shipping_it": getattr(self, "shipping_it_value", None),
-                "company2_markup_de": getattr(self, "markup_de_value", None),
-                "company2_shipping_de": getattr(self, "shipping_de_value", None),
+                "company2_markets": [
+                    {
+                        **market,
+                        "markup": getattr(self, f"markup_{market['market']}_value", None),
+                        "shipping": getattr(
+                            self, f"shipping_{market['market']}_value", None
+                        ),
+                    }
+                    for market in self.company2_markets
+                ],
             }
+            values = [
+                config_values["company1_markup"],
+                config_values["company1_shipping"],
+            ] + [
+                market[key]
+                for market in config_values["company2_markets"]
+                for key in ["markup", "shipping"]
+            ]
 
             # Check if any value is None (invalid or not set)
-            if any(v is None for v in config_values.values()):
+            if any(v is None for v in values):
                 raise ValueError(
                     _("Please correct the input fields highlighted in red.")
                 )
@@ -353,7 +391,10 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, _("Input Error"), str(e))
             return None
 
-    def start_processing(self):
+    def start_quantity_refresh(self):
+        self.start_processing(quantities_only=True)
+
+    def start_processing(self, upload_only=False, quantities_only=False):
         # Initialize and start the fake progress timer
         self.timer.start(200)  # Update every 200 ms
 
@@ -385,6 +426,7 @@ class MainWindow(QMainWindow):
             "background-color: lightgray; color: darkgray;"
         )
         self.upload_button.setEnabled(False)
+        self.quantities_button.setEnabled(False)
         self.progress_bar.setValue(0)
         self.fake_progress = 0  # Reset fake progress
 
@@ -417,14 +459,35 @@ class MainWindow(QMainWindow):
             validated_data,  # Pass the validated data
             upload_company1=upload_company1,  # Pass upload preference
             upload_company2=upload_company2,  # Pass upload preference
+            upload_only=upload_only,
+            quantities_only=quantities_only,
         )
         self.worker.progress.connect(self.on_worker_progress)
+        self.branch_messages = {}
+        self.worker.branch_status.connect(self.on_branch_status)
         self.worker.finished_processing.connect(self.processing_complete)
         self.worker.error.connect(
             lambda error_msg: processing_error(self, error_msg)
         )  # Connect to the imported error handler
+        self.worker.cancelled.connect(self.processing_cancelled)
+        # Only the processing can be cancelled, not an upload
+        self.cancel_button.setEnabled(not upload_only)
         self.worker.start()
 
+    def cancel_processing(self):
+        self.cancel_button.setEnabled(False)
+        self.statusBar().showMessage(_("Cancelling..."))
+        self.worker.cancel()
+
+    def processing_cancelled(self, message):
+        self.timer.stop()
+        self.processing = False
+        self.progress_bar.setValue(0)
+        self.process_button.setEnabled(True)
+        self.process_button.setStyleSheet("")  # Back to the window stylesheet
+        self.statusBar().showMessage(message)
+        self.update_upload_button_state()
+
     def on_worker_progress(self, value):
         """
         Handles progress signals from the Worker.
@@ -433,6 +496,11 @@ class MainWindow(QMainWindow):
         self.fake_progress = max(self.fake_progress, value)
         self.progress_bar.setValue(int(self.fake_progress))
 
+    def on_branch_status(self, branch, message):
+        """Shows the latest status of the Tulero and Tyre24 branches."""
+        self.branch_messages[branch] = message
+        self.statusBar().showMessage("    |    ".join(self.branch_messages.values()))
+
     def update_fake_progress(self):
         """
         Updates the fake progress bar incrementally.
@@ -451,6 +519,7 @@ class MainWindow(QMainWindow):
 
     def processing_complete(self, message):
         self.timer.stop()
+        self.cancel_button.setEnabled(False)
         self.progress_bar.setValue(100)
         self.process_button.setEnabled(True)
         self.upload_button.setEnabled(True)  # Enable the upload button after processing
@@ -506,15 +575,21 @@ class MainWindow(QMainWindow):
             "upload_company2": self.upload_company2_checkbox.isChecked(),
             "company1_markup": round(getattr(self, "markup_value", 1.25), 2),  # Store with 2 decimal places
             "company1_shipping": getattr(self, "shipping_value", 7.5),  # Default: 7.5€
-            "company2_markup_it": round(getattr(self, "markup_it_value", 1.25), 2),
-            "company2_shipping_it": getattr(
-                self, "shipping_it_value", 7.5
-            ),  # Default: 7.5€
-            "company2_markup_de": round(getattr(self, "markup_de_value", 1.25), 2),
-            "company2_shipping_de": getattr(
-                self, "shipping_de_value", 10.5
-            ),  # Default: 10.5€
-
+            # Markup and shipping cost of each Tyre24 market, the table keeps
+            # the values of config.json for those not set
+            "company2_markets": [
+                {
+                    **market,
+                    "markup": round(
+                        getattr(self, f"markup_{market['market']}_value", market["markup"]),
+                        2,
+                    ),
+                    "shipping": getattr(
+                        self, f"shipping_{market['market']}_value", market["shipping"]
+                    ),
+                }
+                for market in self.company2_markets
+            ],
         }
         save_config(config)
 
@@ -544,6 +619,7 @@ class MainWindow(QMainWindow):
         self.processing = False
         self.process_button.setEnabled(True)
         self.upload_button.setEnabled(True)
+        self.update_upload_button_state()
 
     # Reuse functions from utils.py
     browse_articles = browse_articles
@@ -567,6 +643,11 @@ if __name__ == "__main__":
         main_window = MainWindow()
         main_window.show()
 
+        if startup_probe_enabled():
+            startup_probe = install_startup_probe(app, main_window)
+        else:
+            QTimer.singleShot(WARM_UP_DELAY_MS, warm_up_data_processing)
+
         sys.exit(app.exec())
     except Exception as e:
         # Log the critical error if needed
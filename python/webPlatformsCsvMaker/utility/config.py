@@ -1,19 +1,140 @@
 # utils/config.py
+import importlib.util
 import json
 import os
 
 CONFIG_FILE = "config.json"
 DATA_FOLDER = "Data"
 OUTPUT_FOLDER = "Output"
+# The Tyre24 markets of the configurations without "company2_markets", read
+# from their company2_markup_<market> and company2_shipping_<market> keys:
+# (market, name, price column, default shipping)
+LEGACY_MARKETS = [
+    ("it", "Italy", "Price_Italia", 7.5),
+    ("de", "Germany", "Price_Germany", 10.5),
+]
+MARKET_KEYS = ["market", "name", "column", "markup", "shipping"]
+# Products in a component of OE numbers, see data_processing/cross_references
+DEFAULT_MAX_COMPONENT_SIZE = 50
+# See data_processing/out_of_core
+DEFAULT_MEMORY_BUDGET_MB = 2048
+# The dataframe engines of the processing and the modules they need besides
+# pandas, see data_processing/polars_backend
+DATAFRAME_BACKENDS = {"pandas": [], "polars": ["polars"]}
 
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
+def load_config(config_file=CONFIG_FILE):
+    if os.path.exists(config_file):
+        with open(config_file, "r") as file:
             return json.load(file)
     return {}
 
 
-def save_config(config):
-    with open(CONFIG_FILE, "w") as file:
-        json.dump(config, file, indent=4)
+def save_config(config, config_file=CONFIG_FILE):
+    # Keep settings that are only edited by hand (e.g. "profiling")
+    merged_config = load_config(config_file)
+    merged_config.update(config)
+    with open(config_file, "w") as file:
+        json.dump(merged_config, file, indent=4)
+
+
+def company2_markets_from_config(config):
+    """
+    Returns the Tyre24 market table, a list of {"market": "it", "name":
+    "Italy", "column": "Price_Italia", "markup": 1.19, "shipping": 5.5}. The
+    first market sets the minimum price, see company2_processing.
+    """
+    if "company2_markets" in config:
+        return [dict(market) for market in config["company2_markets"]]
+    return [
+        {
+            "market": market,
+            "name": name,
+            "column": column,
+            "markup": config.get(f"company2_markup_{market}", 1.25),
+            "shipping": config.get(f"company2_shipping_{market}", shipping),
+        }
+        for market, name, column, shipping in LEGACY_MARKETS
+    ]
+
+
+def market_table_errors(markets):
+    """Returns a list of problems of a company2_markets table."""
+    if not markets:
+        return ["company2_markets is empty"]
+    errors = []
+    for number, market in enumerate(markets, start=1):
+        missing = [key for key in MARKET_KEYS if key not in market]
+        if missing:
+            errors.append(f"market {number} has no {', '.join(missing)}")
+    for key in ["market", "column"]:
+        values = [market.get(key) for market in markets]
+        if len(set(values)) != len(values):
+            errors.append(f"two markets have the same {key}")
+    return errors
+
+
+def max_component_size_from_config(config):
+    """
+    Returns the maximum size of the cross reference components when
+    "cross_reference_components" is set, None for the exact CODICE OE groups.
+    """
+    if not config.get("cross_reference_components", False):
+        return None
+    return int(
+        config.get("cross_reference_max_component", DEFAULT_MAX_COMPONENT_SIZE)
+    )
+
+
+def company1_workers_from_config(config):
+    """
+    Returns the number of processes preparing the Tulero rows of large
+    catalogs, "company1_workers" (default 1: none, 0: one per CPU core).
+    """
+    workers = int(config.get("company1_workers", 1))
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+def memory_budget_from_config(config):
+    """
+    Returns the memory budget in MB of the out-of-core processing when
+    "out_of_core_processing" is set, None to process the catalog in memory.
+    """
+    if not config.get("out_of_core_processing", False):
+        return None
+    return int(config.get("out_of_core_memory_mb", DEFAULT_MEMORY_BUDGET_MB))
+
+
+def dataframe_backend_from_config(config):
+    """Returns the dataframe engine of the processing, "dataframe_backend"."""
+    return config.get("dataframe_backend", "pandas")
+
+
+def dataframe_backend_errors(backend):
+    """Returns a list of problems of a dataframe_backend."""
+    if backend not in DATAFRAME_BACKENDS:
+        return [f"unknown dataframe_backend: {backend}"]
+    return [
+        f"dataframe_backend {backend} needs {module} (pip install {module})"
+        for module in DATAFRAME_BACKENDS[backend]
+        if importlib.util.find_spec(module) is None
+    ]
+
+
+def pricing_inputs_from_config(config):
+    """Returns the markup and shipping inputs, with the defaults of the GUI."""
+    return {
+        "company1_markup": config.get("company1_markup", 1.25),
+        "company1_shipping": config.get("company1_shipping", 7.5),
+        "company2_markets": company2_markets_from_config(config),
+    }
+
+
+def ftp_info_from_config(config, company):
+    """Returns the FTP info of "company1" or "company2" as used by upload_to_ftp."""
+    return {
+        "host": config.get(f"{company}_ftp_host", ""),
+        "user": config.get(f"{company}_ftp_user", ""),
+        "pass": config.get(f"{company}_ftp_pass", ""),
+        "dir": config.get(f"{company}_ftp_dir", "/"),
+    }
@@ -7,6 +7,8 @@ def processing_error(main_window, error_message):
     main_window.timer.stop()
     main_window.progress_bar.setValue(100)
     main_window.process_button.setEnabled(True)
+    main_window.cancel_button.setEnabled(False)
+    main_window.update_upload_button_state()
     # Reset button style as needed
 
     msg_box = QMessageBox(main_window)
@@ -21,6 +23,11 @@ def processing_error(main_window, error_message):
 
     # Check which button was clicked
     if msg_box.clickedButton() == retry_button:
-        main_window.start_processing()  # Retry processing
+        # Only the upload is retried when the CSVs were generated
+        worker = getattr(main_window, "worker", None)
+        main_window.start_processing(
+            upload_only=worker is not None and worker.processing_completed,
+            quantities_only=worker is not None and worker.quantities_only,
+        )
     elif msg_box.clickedButton() == exit_button:
         main_window.close()  # Exit the application
@@ -13,6 +13,7 @@ def browse_articles(main_window):
     main_window.articles_entry.setText(articles_file)
     main_window.articles_button.setStyleSheet("background-color: green; color: white;")
     main_window.check_ready_to_process()
+    main_window.update_upload_button_state()
     main_window.save_config()
 
 
@@ -66,4 +67,5 @@ def browse_output(main_window):
     main_window.output_entry.setText(output_folder)
     main_window.output_button.setStyleSheet("background-color: green; color: white;")
     main_window.check_ready_to_process()
+    main_window.update_upload_button_state()
     main_window.save_config()
@@ -1,16 +1,777 @@
 # utility/ftp_utils.py
 
-from ftplib import FTP
+from concurrent.futures import ThreadPoolExecutor
+from ftplib import FTP, all_errors, error_perm
+import hashlib
 import os
+import posixpath
+import queue
+import socket
+import threading
+import time
 
-def upload_to_ftp(file_path, ftp_info):
+from translations import _
+from utility.upload_manifest import (
+    destination_key,
+    file_digest,
+    is_unchanged,
+    load_manifest,
+    manifest_entry,
+    save_manifest,
+)
+
+COMPANY1_OUTPUT_FILE = "company1_output.csv"
+COMPANY2_OUTPUT_FILE = "company2_output.csv"
+# "output_compression" in config.json: the CSVs are written, and uploaded,
+# as company1_output.csv.gz or .zip (see data_processing/csv_writer.py)
+OUTPUT_EXTENSIONS = {"none": "", "gzip": ".gz", "zip": ".zip"}
+# Bytes per STOR write; ftplib's default of 8 KB is slow on high-latency links.
+# Overridden by "ftp_blocksize" in config.json.
+DEFAULT_BLOCKSIZE = 64 * 1024
+# Interrupted uploads are resumed up to "ftp_retries" times, waiting
+# "ftp_backoff_seconds" before the first retry and twice as long each time
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 2.0
+MAX_BACKOFF = 60.0
+# Rows serialized at a time when streaming ("ftp_stream_chunk_rows"), and
+# chunks buffered between the serializer and the transfer
+DEFAULT_STREAM_CHUNK_ROWS = 20000
+STREAM_QUEUE_CHUNKS = 8
+# A streamed CSV is sent under this suffix and renamed over the feed once
+# complete, so that the marketplace never reads a partial file
+PARTIAL_SUFFIX = ".part"
+
+
+def output_file_name(company, compression="none"):
+    """Returns the name of the CSV of "company1" or "company2"."""
+    if compression not in OUTPUT_EXTENSIONS:
+        raise ValueError(
+            _("Unknown output compression: {compression}").format(
+                compression=compression
+            )
+        )
+    name = COMPANY1_OUTPUT_FILE if company == "company1" else COMPANY2_OUTPUT_FILE
+    return name + OUTPUT_EXTENSIONS[compression]
+
+
+def upload_options_from_config(config):
+    """Returns the keyword arguments of upload_outputs set in config.json."""
+    return {
+        "blocksize": config.get("ftp_blocksize", DEFAULT_BLOCKSIZE),
+        "retries": config.get("ftp_retries", DEFAULT_RETRIES),
+        "backoff": config.get("ftp_backoff_seconds", DEFAULT_BACKOFF),
+        "skip_unchanged": config.get("ftp_skip_unchanged", True),
+        "verify_remote": config.get("ftp_verify_remote", False),
+        "compression": config.get("output_compression", "none"),
+    }
+
+
+class _Transfers:
+    """
+    The connections of the uploads of an OutputUploader. abort shuts them
+    down, which fails the commands waiting for a reply, stops the transfers
+    at their next block (see check) and stops the retries.
+    """
+
+    def __init__(self):
+        self.aborted = threading.Event()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def add(self, ftp):
+        with self.lock:
+            self.connections.append(ftp)
+            if self.aborted.is_set():
+                _shutdown(ftp)
+
+    def check(self, _block=None):
+        """storbinary callback, raises once aborted."""
+        if self.aborted.is_set():
+            raise ConnectionAbortedError(_("upload cancelled"))
+
+    def abort(self):
+        with self.lock:
+            self.aborted.set()
+            for ftp in self.connections:
+                _shutdown(ftp)
+
+
+def _shutdown(ftp):
+    """
+    Shuts down the control connection, from another thread than the one
+    using it: unlike close, it leaves the FTP object usable until it fails.
+    """
+    if ftp.sock is not None:
+        try:
+            ftp.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _connect(ftp_info, transfers=None):
+    ftp = FTP(ftp_info['host'])
+    if transfers is not None:
+        transfers.add(ftp)
+    ftp.login(ftp_info['user'], ftp_info['pass'])
+    return ftp
+
+
+def _aborted(transfers):
+    return transfers is not None and transfers.aborted.is_set()
+
+
+def _close(ftp):
+    try:
+        ftp.quit()
+    except Exception:
+        ftp.close()
+
+
+def _store_file(ftp, file_path, blocksize, offset=0, callback=None):
+    """
+    Uploads file_path to the current directory. With an offset, the bytes
+    from the offset on are appended to the partial file already on the server.
+    """
+    file_name = os.path.basename(file_path)
+    with open(file_path, 'rb') as file:
+        if offset:
+            file.seek(offset)
+            ftp.storbinary(f'APPE {file_name}', file, blocksize, callback)
+        else:
+            ftp.storbinary(f'STOR {file_name}', file, blocksize, callback)
+
+
+def _remote_size(ftp, file_name):
+    """Returns the size of the file on the server, 0 when unknown."""
     try:
-        ftp = FTP(ftp_info['host'])
-        ftp.login(ftp_info['user'], ftp_info['pass'])
+        # SIZE is refused in ASCII mode by some servers
+        ftp.voidcmd('TYPE I')
+        return ftp.size(file_name) or 0
+    except all_errors:
+        return 0
+
+
+def _remote_mdtm(ftp, file_name):
+    """Returns the modification time reported by the server, None if unknown."""
+    try:
+        return ftp.voidcmd(f'MDTM {file_name}')[4:].strip()
+    except all_errors:
+        return None
+
+
+def _replace_remote(ftp, source_name, file_name):
+    """Renames source_name to file_name, replacing it."""
+    try:
+        ftp.rename(source_name, file_name)
+    except error_perm:
+        # Some servers do not rename over an existing file
+        ftp.delete(file_name)
+        ftp.rename(source_name, file_name)
+
+
+def _unchanged_on_server(ftp, file_name, entry):
+    """Checks the remote SIZE, and MDTM when it was recorded, against entry."""
+    if _remote_size(ftp, file_name) != entry["size"]:
+        return False
+    recorded_mdtm = entry.get("remote_mdtm")
+    return recorded_mdtm is None or recorded_mdtm == _remote_mdtm(ftp, file_name)
+
+
+def format_throughput(size, seconds):
+    megabytes = size / 1e6
+    return _("({size:.1f} MB in {seconds:.1f} s, {rate:.2f} MB/s)").format(
+        size=megabytes, seconds=seconds, rate=megabytes / max(seconds, 1e-6)
+    )
+
+
+def upload_to_ftp(file_path, ftp_info, blocksize=DEFAULT_BLOCKSIZE):
+    try:
+        ftp = _connect(ftp_info)
         ftp.cwd(ftp_info['dir'])
-        with open(file_path, 'rb') as file:
-            ftp.storbinary(f'STOR {os.path.basename(file_path)}', file)
+        _store_file(ftp, file_path, blocksize)
         ftp.quit()
         return True, None  # Return success and no error
     except Exception as e:
         return False, str(e)  # Return failure and the error message
+
+
+def _upload_over_one_connection(
+    uploads,
+    blocksize,
+    retries,
+    backoff,
+    verify_remote,
+    progress,
+    transfers=None,  # See _Transfers
+):
+    """
+    Uploads files going to the same server and account over a single
+    connection. A file whose content matches its manifest entry is skipped
+    (after checking the remote SIZE/MDTM with verify_remote). A dropped
+    transfer is resumed from the size reported by the server, after an
+    exponential backoff. Returns one result dict per upload.
+    """
+    results = []
+    ftp = None
+    home = "/"
+    for upload in uploads:
+        file_path = upload["file_path"]
+        ftp_info = upload["ftp_info"]
+        file_name = os.path.basename(file_path)
+        try:
+            size = os.path.getsize(file_path)
+            sha256 = file_digest(file_path)
+        except OSError as e:
+            results.append({"uploaded": False, "error": str(e)})
+            continue
+
+        if is_unchanged(upload["previous"], sha256, size):
+            unchanged = True
+            if verify_remote:
+                try:
+                    if ftp is None:
+                        ftp = _connect(ftp_info, transfers)
+                        home = ftp.pwd()
+                    ftp.cwd(posixpath.join(home, ftp_info['dir']))
+                    unchanged = _unchanged_on_server(
+                        ftp, file_name, upload["previous"]
+                    )
+                except all_errors:
+                    # Uploaded again, the upload reports the actual problem
+                    unchanged = False
+                    if ftp is not None:
+                        _close(ftp)
+                        ftp = None
+            if unchanged:
+                results.append({"uploaded": True, "skipped": True})
+                continue
+
+        if progress:
+            progress(upload["uploading"])
+        start = time.perf_counter()
+        # Set when a transfer dropped, resumed from the partial file
+        resume = False
+        for attempt in range(retries + 1):
+            offset = 0
+            try:
+                if ftp is None:
+                    ftp = _connect(ftp_info, transfers)
+                    home = ftp.pwd()
+                # Relative directories are relative to the login directory
+                ftp.cwd(posixpath.join(home, ftp_info['dir']))
+                if resume:
+                    offset = _remote_size(ftp, file_name)
+                    if offset > size:
+                        offset = 0
+                _store_file(
+                    ftp,
+                    file_path,
+                    blocksize,
+                    offset,
+                    transfers.check if transfers is not None else None,
+                )
+                result = {
+                    "uploaded": True,
+                    "skipped": False,
+                    "size": size,
+                    "seconds": time.perf_counter() - start,
+                    "entry": manifest_entry(
+                        file_path, sha256, size, _remote_mdtm(ftp, file_name)
+                    ),
+                }
+                break
+            except all_errors as e:
+                result = {"uploaded": False, "error": str(e)}
+                # The connection may be unusable, the next attempt reconnects
+                if ftp is not None:
+                    _close(ftp)
+                    ftp = None
+                if _aborted(transfers):
+                    result["error"] = _("upload cancelled")
+                    break
+                if isinstance(e, error_perm) and not offset:
+                    # Refused by the server (login, directory, permissions)
+                    break
+                # A refused APPE is retried as a full upload
+                resume = not isinstance(e, error_perm)
+                if attempt == retries:
+                    break
+                delay = min(backoff * 2**attempt, MAX_BACKOFF)
+                if progress:
+                    progress(
+                        _(
+                            "Upload of {file} interrupted ({error}), "
+                            "retrying in {seconds:.0f} s..."
+                        ).format(file=file_name, error=e, seconds=delay)
+                    )
+                if transfers is not None:
+                    transfers.aborted.wait(delay)
+                else:
+                    time.sleep(delay)
+        results.append(result)
+    if ftp is not None:
+        _close(ftp)
+    return results
+
+
+def _output_uploads(
+    output_folder,
+    company1_ftp_info,
+    company2_ftp_info,
+    upload_company1,
+    upload_company2,
+    manifest,
+    skip_unchanged,
+    compression="none",
+):
+    """Describes the upload of each selected marketplace file."""
+    uploads = []
+    if upload_company1:
+        uploads.append(
+            {
+                "company": "company1",
+                "file_path": os.path.join(
+                    output_folder, output_file_name("company1", compression)
+                ),
+                "ftp_info": company1_ftp_info,
+                "uploading": _("Uploading Tulero file..."),
+                "succeeded": _("Tulero upload successful."),
+                "failed": _("Tulero upload failed: "),
+                "skipped": _("Tulero file unchanged, upload skipped."),
+            }
+        )
+    if upload_company2:
+        uploads.append(
+            {
+                "company": "company2",
+                "file_path": os.path.join(
+                    output_folder, output_file_name("company2", compression)
+                ),
+                "ftp_info": company2_ftp_info,
+                "uploading": _("Uploading Tyre24 file..."),
+                "succeeded": _("Tyre24 upload successful."),
+                "failed": _("Tyre24 upload failed: "),
+                "skipped": _("Tyre24 file unchanged, upload skipped."),
+            }
+        )
+
+    for upload in uploads:
+        upload["key"] = destination_key(
+            upload["ftp_info"], os.path.basename(upload["file_path"])
+        )
+        upload["previous"] = manifest.get(upload["key"]) if skip_unchanged else None
+    return uploads
+
+
+def _result_message(upload, result):
+    if not result["uploaded"]:
+        return upload["failed"] + result["error"]
+    if result["skipped"]:
+        return upload["skipped"]
+    throughput = format_throughput(result["size"], result["seconds"])
+    return f"{upload['succeeded']} {throughput}"
+
+
+def _summarize_uploads(output_folder, uploads, results, manifest):
+    """Updates the manifest and returns (success, messages)."""
+    for upload, result in zip(uploads, results):
+        if not result["uploaded"]:
+            # The remote file may now be partial
+            manifest.pop(upload["key"], None)
+        elif not result["skipped"]:
+            manifest[upload["key"]] = result["entry"]
+
+    if not all(result.get("skipped") for result in results):
+        save_manifest(output_folder, manifest)
+    success = all(result["uploaded"] for result in results)
+    messages = [
+        _result_message(upload, result) for upload, result in zip(uploads, results)
+    ]
+    return success, messages
+
+
+def upload_outputs(
+    output_folder,
+    company1_ftp_info,
+    company2_ftp_info,
+    upload_company1=True,
+    upload_company2=True,
+    progress=None,
+    blocksize=DEFAULT_BLOCKSIZE,
+    retries=DEFAULT_RETRIES,
+    backoff=DEFAULT_BACKOFF,
+    skip_unchanged=True,
+    verify_remote=False,
+    compression="none",
+):
+    """
+    Uploads the generated CSVs to the selected marketplaces, concurrently when
+    they go to different servers. Returns (success, messages); progress, if
+    given, receives status messages (possibly from several threads).
+    """
+    manifest = load_manifest(output_folder)
+    uploads = _output_uploads(
+        output_folder,
+        company1_ftp_info,
+        company2_ftp_info,
+        upload_company1,
+        upload_company2,
+        manifest,
+        skip_unchanged,
+        compression,
+    )
+
+    # One connection per server and account, the servers in parallel
+    groups = {}
+    for index, upload in enumerate(uploads):
+        ftp_info = upload["ftp_info"]
+        key = (ftp_info['host'], ftp_info['user'], ftp_info['pass'])
+        groups.setdefault(key, []).append(index)
+
+    results = [None] * len(uploads)
+    if groups:
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = {
+                executor.submit(
+                    _upload_over_one_connection,
+                    [uploads[index] for index in indexes],
+                    blocksize,
+                    retries,
+                    backoff,
+                    verify_remote,
+                    progress,
+                ): indexes
+                for indexes in groups.values()
+            }
+            for future, indexes in futures.items():
+                for index, result in zip(indexes, future.result()):
+                    results[index] = result
+
+    return _summarize_uploads(output_folder, uploads, results, manifest)
+
+
+class _SerializationFailed(Exception):
+    """Put in the queue of a _QueueReader when the CSV cannot be written."""
+
+
+class _QueueReader:
+    """
+    File-like object for storbinary, reading the chunks put in a queue until
+    None. Raises the _SerializationFailed put in the queue, which aborts the
+    transfer.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chunk = b""
+        self.offset = 0
+        self.finished = False
+
+    def read(self, size):
+        while self.offset >= len(self.chunk):
+            if self.finished:
+                return b""
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.finished = True
+                return b""
+            if isinstance(chunk, _SerializationFailed):
+                self.finished = True
+                raise chunk
+            self.chunk, self.offset = chunk, 0
+        data = self.chunk[self.offset : self.offset + size]
+        self.offset += len(data)
+        return data
+
+
+def _stream_upload(
+    df,
+    upload,
+    blocksize,
+    retries,
+    backoff,
+    chunk_rows,
+    progress,
+    transfers=None,  # See _Transfers
+):
+    """
+    Serializes df to CSV in chunks and sends them to the server while the
+    next chunks are serialized; every chunk is also written to the local
+    file. The CSV is sent as <name>.part and renamed to its name once it is
+    complete, so a failed serialization never replaces the file on the
+    server. When the transfer fails, the local file is completed and
+    uploaded like a regular upload; when it is aborted, the serialization
+    stops.
+    """
+    # Loads pandas, which the window must not import at startup
+    from data_processing import csv_writer
+
+    file_path = upload["file_path"]
+    ftp_info = upload["ftp_info"]
+    file_name = os.path.basename(file_path)
+    partial_name = file_name + PARTIAL_SUFFIX
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    transfer_ended = threading.Event()
+    written = {}
+
+    def put(chunk):
+        # Gives up once the transfer ended, the local copy is still completed
+        while not transfer_ended.is_set():
+            try:
+                chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def serialize():
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(file_path, "wb") as file:
+                for chunk in csv_writer.output_chunks(df, file_path, chunk_rows):
+                    if _aborted(transfers):
+                        raise _SerializationFailed(_("upload cancelled"))
+                    file.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    put(chunk)
+            written.update(sha256=digest.hexdigest(), size=size)
+        except Exception as e:
+            written.update(error=str(e))
+            put(_SerializationFailed(str(e)))
+        else:
+            put(None)
+
+    if progress:
+        progress(upload["uploading"])
+    start = time.perf_counter()
+    serializer = threading.Thread(target=serialize, name=f"csv-{file_name}")
+    serializer.start()
+    ftp = None
+    try:
+        ftp = _connect(ftp_info, transfers)
+        ftp.cwd(posixpath.join(ftp.pwd(), ftp_info['dir']))
+        ftp.storbinary(
+            f'STOR {partial_name}',
+            _QueueReader(chunks),
+            blocksize,
+            transfers.check if transfers is not None else None,
+        )
+        _replace_remote(ftp, partial_name, file_name)
+        remote_mdtm = _remote_mdtm(ftp, file_name)
+        _close(ftp)
+        ftp = None
+    except _SerializationFailed as e:
+        # Only the partial file was sent, the feed on the server is unchanged
+        transfer_ended.set()
+        if ftp is not None:
+            ftp.close()
+        serializer.join()
+        return {"uploaded": False, "error": str(e)}
+    except all_errors as e:
+        transfer_ended.set()
+        if ftp is not None:
+            _close(ftp)
+        serializer.join()
+        if "error" in written:
+            return {"uploaded": False, "error": written["error"]}
+        if _aborted(transfers):
+            return {"uploaded": False, "error": _("upload cancelled")}
+        if isinstance(e, error_perm):
+            return {"uploaded": False, "error": str(e)}
+        # Sent again from the local file, the partial file is not resumed
+        retry = dict(upload, previous=None)
+        return _upload_over_one_connection(
+            [retry], blocksize, retries, backoff, False, progress, transfers
+        )[0]
+    finally:
+        # Also on the other errors, the serializer must not wait for a reader
+        transfer_ended.set()
+
+    serializer.join()
+    return {
+        "uploaded": True,
+        "skipped": False,
+        "size": written["size"],
+        "seconds": time.perf_counter() - start,
+        "entry": manifest_entry(
+            file_path, written["sha256"], written["size"], remote_mdtm
+        ),
+    }
+
+
+class OutputUploader:
+    """
+    Uploads each output of twin_data_processing.main as soon as it is written:
+    pass write_csv as its write_csv argument (and file_written as its
+    file_written argument), then call finish, or abort when the processing
+    is cancelled or fails. With stream, the CSV is sent
+    while it is serialized; streamed files are always uploaded, they cannot
+    be compared with the manifest before they exist.
+    progress, if given, is called as progress(company, message).
+    """
+
+    def __init__(
+        self,
+        output_folder,
+        company1_ftp_info,
+        company2_ftp_info,
+        upload_company1=True,
+        upload_company2=True,
+        progress=None,
+        blocksize=DEFAULT_BLOCKSIZE,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        skip_unchanged=True,
+        verify_remote=False,
+        compression="none",
+        stream=False,
+        chunk_rows=DEFAULT_STREAM_CHUNK_ROWS,
+    ):
+        self.output_folder = output_folder
+        self.manifest = load_manifest(output_folder)
+        self.uploads = _output_uploads(
+            output_folder,
+            company1_ftp_info,
+            company2_ftp_info,
+            upload_company1,
+            upload_company2,
+            self.manifest,
+            skip_unchanged and not stream,
+            compression,
+        )
+        self.progress = progress
+        self.blocksize = blocksize
+        self.retries = retries
+        self.backoff = backoff
+        self.verify_remote = verify_remote
+        self.stream = stream
+        self.chunk_rows = chunk_rows
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.uploads), 1))
+        self.futures = {}
+        self.transfers = _Transfers()
+
+    def _company_progress(self, upload):
+        if self.progress is None:
+            return None
+        return lambda message: self.progress(upload["company"], message)
+
+    def _upload_file(self, upload):
+        return _upload_over_one_connection(
+            [upload],
+            self.blocksize,
+            self.retries,
+            self.backoff,
+            self.verify_remote,
+            self._company_progress(upload),
+            self.transfers,
+        )[0]
+
+    def _upload_index(self, output_path):
+        """The index of output_path in self.uploads, None when not uploaded."""
+        for index, upload in enumerate(self.uploads):
+            if os.path.abspath(upload["file_path"]) == os.path.abspath(output_path):
+                return index
+        return None
+
+    def _add_future(self, index, future):
+        upload = self.uploads[index]
+        if self.progress is not None:
+            future.add_done_callback(
+                lambda done: done.cancelled()
+                or self.progress(
+                    upload["company"], _result_message(upload, done.result())
+                )
+            )
+        self.futures[index] = future
+
+    def write_csv(self, df, output_path):
+        """Writes df and starts its upload when output_path is uploaded."""
+        from data_processing import csv_writer
+
+        index = self._upload_index(output_path)
+        if index is None:
+            csv_writer.write_csv(df, output_path)
+            return
+
+        upload = self.uploads[index]
+        if self.stream:
+            future = self.executor.submit(
+                _stream_upload,
+                df,
+                upload,
+                self.blocksize,
+                self.retries,
+                self.backoff,
+                self.chunk_rows,
+                self._company_progress(upload),
+                self.transfers,
+            )
+        else:
+            csv_writer.write_csv(df, output_path)
+            future = self.executor.submit(self._upload_file, upload)
+        self._add_future(index, future)
+
+    def file_written(self, output_path):
+        """
+        Starts the upload of output_path, written by the caller (e.g. the
+        out-of-core processing); never streamed.
+        """
+        index = self._upload_index(output_path)
+        if index is not None:
+            self._add_future(
+                index, self.executor.submit(self._upload_file, self.uploads[index])
+            )
+
+    def finish(self):
+        """Waits for the transfers and returns (success, messages)."""
+        results = []
+        for index, upload in enumerate(self.uploads):
+            future = self.futures.get(index)
+            if future is None:
+                # Never written, e.g. the processing failed
+                results.append({"uploaded": False, "error": _("file not generated")})
+            else:
+                results.append(future.result())
+        self.executor.shutdown()
+        return _summarize_uploads(
+            self.output_folder, self.uploads, results, self.manifest
+        )
+
+    def abort(self):
+        """
+        Stops the transfers without waiting for them: the connections are
+        closed, the retries and the uploads not started are dropped.
+        """
+        self.transfers.abort()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.futures:
+            # The files on the server may now be partial
+            for index in self.futures:
+                self.manifest.pop(self.uploads[index]["key"], None)
+            save_manifest(self.output_folder, self.manifest)
+
+
+def output_uploader_from_config(
+    config,
+    output_folder,
+    company1_ftp_info,
+    company2_ftp_info,
+    upload_company1=True,
+    upload_company2=True,
+    progress=None,
+):
+    """Returns an OutputUploader set up from config.json, None without uploads."""
+    if not upload_company1 and not upload_company2:
+        return None
+    return OutputUploader(
+        output_folder,
+        company1_ftp_info,
+        company2_ftp_info,
+        upload_company1=upload_company1,
+        upload_company2=upload_company2,
+        progress=progress,
+        stream=config.get("ftp_stream_uploads", False),
+        chunk_rows=config.get("ftp_stream_chunk_rows", DEFAULT_STREAM_CHUNK_ROWS),
+        **upload_options_from_config(config),
+    )
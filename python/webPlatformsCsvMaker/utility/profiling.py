@@ -0,0 +1,139 @@
+# utility/profiling.py
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_ENV_VAR = "WEBSTOCK_PROFILE"
+PROFILE_INTERVAL_ENV_VAR = "WEBSTOCK_PROFILE_INTERVAL_MS"
+PROFILING_MODES = ("off", "sampling")
+# Read as sampling: cProfile only saw the thread that enabled it, not the
+# Tulero and Tyre24 branches, and Python 3.12 allows one cProfile at a time
+LEGACY_MODES = {"cprofile": "sampling"}
+DEFAULT_INTERVAL_MS = 5
+
+
+def get_profiling_mode(config):
+    """Returns the profiling mode, the environment variable wins over config.json."""
+    mode = os.environ.get(PROFILE_ENV_VAR) or config.get("profiling", "off")
+    mode = str(mode).strip().lower()
+    mode = LEGACY_MODES.get(mode, mode)
+    if mode not in PROFILING_MODES:
+        return "off"
+    return mode
+
+
+def get_profiling_interval(config):
+    """Returns the sampling interval in seconds."""
+    interval_ms = os.environ.get(PROFILE_INTERVAL_ENV_VAR) or config.get(
+        "profiling_interval_ms", DEFAULT_INTERVAL_MS
+    )
+    try:
+        interval_ms = float(interval_ms)
+    except (TypeError, ValueError):
+        interval_ms = DEFAULT_INTERVAL_MS
+    return max(interval_ms, 1) / 1000.0
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Periodically samples the stacks of every running thread.
+
+    This sees the Tulero and Tyre24 branches, which run on ThreadPoolExecutor
+    threads, and its overhead does not depend on the number of Python calls
+    made.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="SamplingProfiler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write_folded(self, path):
+        """Writes the samples in the folded format read by flamegraph.pl and speedscope."""
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+    def write_summary(self, path, elapsed, limit=50):
+        own_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+
+        total = sum(self.stacks.values()) or 1
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(
+                f"Sampling profile: {self.samples} samples every "
+                f"{self.interval * 1000:.1f} ms, {elapsed:.2f} s wall time\n\n"
+            )
+            for title, counts in (
+                ("Own time", own_counts),
+                ("Total time (including callees)", total_counts),
+            ):
+                file.write(f"{title}\n")
+                for frame, count in counts.most_common(limit):
+                    file.write(f"{count * 100.0 / total:7.2f}%  {count:8d}  {frame}\n")
+                file.write("\n")
+
+
+@contextmanager
+def profile_run(mode, output_folder, interval=DEFAULT_INTERVAL_MS / 1000.0):
+    """
+    Runs the enclosed block under the sampling profiler.
+
+    The files are written to output_folder as profile_<timestamp>.*: .folded
+    (flame graph stacks) and a .txt summary. Nothing is written when mode is
+    "off".
+    """
+    if mode != "sampling":
+        yield None
+        return
+
+    os.makedirs(output_folder, exist_ok=True)
+    base_path = os.path.join(
+        output_folder, f"profile_{time.strftime('%Y%m%d_%H%M%S')}"
+    )
+    start = time.perf_counter()
+
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    try:
+        yield base_path + ".folded"
+    finally:
+        profiler.stop()
+        profiler.write_folded(base_path + ".folded")
+        profiler.write_summary(base_path + ".txt", time.perf_counter() - start)
@@ -0,0 +1,49 @@
+# utility/startup_probe.py
+#
+# Used by benchmarks/startup_benchmark.py: when WEBSTOCK_STARTUP_PROBE is set,
+# the application prints the time of the first paint of the main window as a
+# JSON line and quits.
+
+import json
+import os
+import sys
+import time
+
+from PyQt6.QtCore import QEvent, QObject, QTimer
+
+STARTUP_PROBE_ENV_VAR = "WEBSTOCK_STARTUP_PROBE"
+# Modules that should not be loaded before the window is painted
+HEAVY_MODULES = ["pandas", "numpy", "pandarallel"]
+
+
+def startup_probe_enabled():
+    return bool(os.environ.get(STARTUP_PROBE_ENV_VAR))
+
+
+class FirstPaintProbe(QObject):
+    def __init__(self, app, window):
+        super().__init__(window)
+        self.app = app
+        self.window = window
+        self.reported = False
+        window.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Paint and not self.reported:
+            self.reported = True
+            # Report once the paint event has been handled
+            QTimer.singleShot(0, self.report)
+        return False
+
+    def report(self):
+        result = {
+            "first_paint": time.time(),
+            "heavy_modules_loaded": [m for m in HEAVY_MODULES if m in sys.modules],
+        }
+        print(json.dumps(result), flush=True)
+        self.app.quit()
+
+
+def install_startup_probe(app, window):
+    """Returns the probe, which must be kept referenced until it reports."""
+    return FirstPaintProbe(app, window)
@@ -123,12 +123,16 @@ def setup_ui(main_window, base_path):
     ftp_layout = QHBoxLayout()
 
     # Tulero Section
-    company1_widget, company1_widgets = create_ftp_section(main_window, "Tulero", base_path)
+    company1_widget, company1_widgets = create_ftp_section(
+        main_window, "Tulero", base_path, "company1"
+    )
     ftp_layout.addWidget(company1_widget)
     widgets.update(company1_widgets)
 
     # Tyre24 Section
-    company2_widget, company2_widgets = create_ftp_section(main_window, "Tyre24", base_path)
+    company2_widget, company2_widgets = create_ftp_section(
+        main_window, "Tyre24", base_path, "company2"
+    )
     ftp_layout.addWidget(company2_widget)
     widgets.update(company2_widgets)
 
@@ -156,47 +160,39 @@ def setup_ui(main_window, base_path):
     company1_shipping_layout.addWidget(widgets["company1_shipping_entry"])
     shipping_layout.addLayout(company1_shipping_layout)
 
-    # Markup input for Tyre24 (Italy)
-    company2_markup_it_layout = QVBoxLayout()
-    widgets["company2_markup_it_label"] = QLabel(_("Select Markup for Tyre24 (Italy) (%)"))
-    company2_markup_it_layout.addWidget(widgets["company2_markup_it_label"])
-    widgets["company2_markup_it_entry"] = QLineEdit()
-    widgets["company2_markup_it_entry"].setPlaceholderText(_("Enter percentage (10-35%)"))
-    company2_markup_it_layout.addWidget(widgets["company2_markup_it_entry"])
-    markup_layout.addLayout(company2_markup_it_layout)
-
-    # Shipping cost input for Tyre24 (Italy)
-    company2_shipping_it_layout = QVBoxLayout()
-    widgets["company2_shipping_it_label"] = QLabel(_("Select Shipping Cost for Tyre24 (Italy) (€)"))
-    company2_shipping_it_layout.addWidget(widgets["company2_shipping_it_label"])
-    widgets["company2_shipping_it_entry"] = QLineEdit()
-    widgets["company2_shipping_it_entry"].setPlaceholderText(_("Enter cost (7.0-20.0)"))
-    company2_shipping_it_layout.addWidget(widgets["company2_shipping_it_entry"])
-    shipping_layout.addLayout(company2_shipping_it_layout)
-
-    # Markup input for Tyre24 (Germany)
-    company2_markup_de_layout = QVBoxLayout()
-    widgets["company2_markup_de_label"] = QLabel(_("Select Markup for Tyre24 (Germany) (%)"))
-    company2_markup_de_layout.addWidget(widgets["company2_markup_de_label"])
-    widgets["company2_markup_de_entry"] = QLineEdit()
-    widgets["company2_markup_de_entry"].setPlaceholderText(_("Enter percentage (10-35%)"))
-    company2_markup_de_layout.addWidget(widgets["company2_markup_de_entry"])
-    markup_layout.addLayout(company2_markup_de_layout)
-
-    # Shipping cost input for Tyre24 (Germany)
-    company2_shipping_de_layout = QVBoxLayout()
-    widgets["company2_shipping_de_label"] = QLabel(_("Select Shipping Cost for Tyre24 (Germany) (€)"))
-    company2_shipping_de_layout.addWidget(widgets["company2_shipping_de_label"])
-    widgets["company2_shipping_de_entry"] = QLineEdit()
-    widgets["company2_shipping_de_entry"].setPlaceholderText(_("Enter cost (7.0-20.0)"))
-    company2_shipping_de_layout.addWidget(widgets["company2_shipping_de_entry"])
-    shipping_layout.addLayout(company2_shipping_de_layout)
+    # Markup and shipping cost inputs for each Tyre24 market (company2_markets)
+    # The names of the default markets (see utility/config.LEGACY_MARKETS),
+    # the others are shown as written in config.json
+    market_names = {"Italy": _("Italy"), "Germany": _("Germany")}
+    for market in main_window.company2_markets:
+        key = market["market"]
+        name = market_names.get(market["name"], market["name"])
+        company2_markup_layout = QVBoxLayout()
+        widgets[f"company2_markup_{key}_label"] = QLabel(
+            _("Select Markup for Tyre24 ({name}) (%)").format(name=name)
+        )
+        company2_markup_layout.addWidget(widgets[f"company2_markup_{key}_label"])
+        widgets[f"company2_markup_{key}_entry"] = QLineEdit()
+        widgets[f"company2_markup_{key}_entry"].setPlaceholderText(_("Enter percentage (10-35%)"))
+        company2_markup_layout.addWidget(widgets[f"company2_markup_{key}_entry"])
+        markup_layout.addLayout(company2_markup_layout)
+
+        company2_shipping_layout = QVBoxLayout()
+        widgets[f"company2_shipping_{key}_label"] = QLabel(
+            _("Select Shipping Cost for Tyre24 ({name}) (€)").format(name=name)
+        )
+        company2_shipping_layout.addWidget(widgets[f"company2_shipping_{key}_label"])
+        widgets[f"company2_shipping_{key}_entry"] = QLineEdit()
+        widgets[f"company2_shipping_{key}_entry"].setPlaceholderText(_("Enter cost (7.0-20.0)"))
+        company2_shipping_layout.addWidget(widgets[f"company2_shipping_{key}_entry"])
+        shipping_layout.addLayout(company2_shipping_layout)
 
     # Add the markup and shipping layouts to the main layout
     layout.addLayout(markup_layout)
     layout.addLayout(shipping_layout)
 
-    # Create a horizontal layout for the Process and Upload buttons
+    # Create a horizontal layout for the Process, Quantities, Upload and Cancel
+    # buttons
     button_layout = QHBoxLayout()
 
     widgets["process_button"] = QPushButton(_("Process"))
@@ -207,6 +203,15 @@ def setup_ui(main_window, base_path):
     widgets["process_button"].clicked.connect(main_window.start_processing)
     button_layout.addWidget(widgets["process_button"])
 
+    # Refreshes GIACENZA in the CSVs of the last full run
+    widgets["quantities_button"] = QPushButton(_("Update Quantities"))
+    widgets["quantities_button"].setIcon(
+        QIcon(os.path.join(base_path, "icons", "icon32.png"))
+    )
+    widgets["quantities_button"].setEnabled(False)
+    widgets["quantities_button"].clicked.connect(main_window.start_quantity_refresh)
+    button_layout.addWidget(widgets["quantities_button"])
+
     widgets["upload_button"] = QPushButton(_("Upload"))
     widgets["upload_button"].setIcon(
         QIcon(os.path.join(base_path, "icons", "icon32.png"))
@@ -215,6 +220,12 @@ def setup_ui(main_window, base_path):
     widgets["upload_button"].clicked.connect(main_window.start_upload)
     button_layout.addWidget(widgets["upload_button"])
 
+    # Stops the running processing, enabled while it runs
+    widgets["cancel_button"] = QPushButton(_("Cancel"))
+    widgets["cancel_button"].setEnabled(False)
+    widgets["cancel_button"].clicked.connect(main_window.cancel_processing)
+    button_layout.addWidget(widgets["cancel_button"])
+
     layout.addLayout(button_layout)
 
     # Progress bar
@@ -0,0 +1,59 @@
+# utility/upload_manifest.py
+#
+# Records what was last uploaded successfully to every destination, so that an
+# unchanged CSV is not sent again. Kept next to the CSVs in the output folder.
+
+import hashlib
+import json
+import os
+import posixpath
+import time
+
+MANIFEST_FILE = "upload_manifest.json"
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def destination_key(ftp_info, file_name):
+    """Identifies a remote file, e.g. ftp://user@host/csv/company1_output.csv."""
+    path = posixpath.join("/", ftp_info["dir"], file_name)
+    return f"ftp://{ftp_info['user']}@{ftp_info['host']}{path}"
+
+
+def load_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, MANIFEST_FILE), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        # Missing or damaged: everything is uploaded again
+        return {}
+
+
+def save_manifest(output_folder, manifest):
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(temporary_path, path)
+
+
+def manifest_entry(file_path, sha256, size, remote_mdtm=None):
+    return {
+        "sha256": sha256,
+        "size": size,
+        "modified": time.strftime(
+            "%Y-%m-%dT%H:%M:%S", time.localtime(os.path.getmtime(file_path))
+        ),
+        "uploaded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "remote_mdtm": remote_mdtm,
+    }
+
+
+def is_unchanged(entry, sha256, size):
+    return bool(entry) and entry.get("sha256") == sha256 and entry.get("size") == size
@@ -1,15 +1,49 @@
+import gc
+import importlib
 import os
+import threading
 
+from data_processing.cancellation import CancellationToken, ProcessingCancelled
 from data_processing.ignored_brands import IGNORED_BRANDS
-from data_processing.twin_data_processing import main as main_processing_function
 from PyQt6.QtCore import QThread, pyqtSignal
+from utility.config import (
+    company1_workers_from_config,
+    dataframe_backend_from_config,
+    load_config,
+    max_component_size_from_config,
+    memory_budget_from_config,
+)
+from utility.ftp_utils import output_file_name, output_uploader_from_config
+from translations import _
+from utility.profiling import get_profiling_interval, get_profiling_mode, profile_run
 from workerFtp import UploadWorker
 
+# Imports pandas, numpy and pandarallel; loaded after the window is shown
+DATA_PROCESSING_MODULE = "data_processing.twin_data_processing"
+QUANTITY_REFRESH_MODULE = "data_processing.quantity_refresh"
+BRANCH_NAMES = {"company1": "Tulero", "company2": "Tyre24"}
+
+
+def warm_up_data_processing():
+    """Imports the data processing stack in a background thread."""
+    thread = threading.Thread(
+        target=importlib.import_module,
+        args=(DATA_PROCESSING_MODULE,),
+        name="warm-up",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
 
 class Worker(QThread):
     progress = pyqtSignal(int)
+    # (branch, message), branch is "company1" or "company2", or "upload" for
+    # the messages of upload_files
+    branch_status = pyqtSignal(str, str)
     finished_processing = pyqtSignal(str)
     error = pyqtSignal(str)
+    cancelled = pyqtSignal(str)
 
     def __init__(
         self,
@@ -24,6 +58,8 @@ class Worker(QThread):
         validated_data,  # Add the inputs (markup and shipping costs)
         upload_company1=True,  # New parameter
         upload_company2=True,   # New parameter
+        upload_only=False,  # Reuse the CSVs already in the output folder
+        quantities_only=False,  # Only refresh GIACENZA in the last full run
     ):
         super().__init__()
         self.articles_file = articles_file
@@ -37,37 +73,174 @@ class Worker(QThread):
         self.inputs = validated_data  # Store the inputs
         self.upload_company1 = upload_company1  # New
         self.upload_company2 = upload_company2    # New
+        self.upload_only = upload_only
+        self.quantities_only = quantities_only
+        # Set once the CSVs are written, a failed upload can then be retried
+        # without processing the data again
+        self.processing_completed = upload_only
         self.timer = None
+        # Checked by the processing stages, see cancel
+        self.cancel_token = CancellationToken()
+
+    def cancel(self):
+        """Stops the processing at its next check, called from the GUI thread."""
+        self.cancel_token.cancel()
 
     def run(self):
+        if self.upload_only:
+            self.progress.emit(85)
+            self.upload_files()
+            return
+
+        cancelled = False
         try:
+            # Profiling is selected in config.json or via WEBSTOCK_PROFILE
+            config = load_config()
+            profiling_mode = get_profiling_mode(config)
+
             # Call the main data processing function
-            company1_output_file = os.path.join(self.output_folder, "company1_output.csv")
-            company2_output_file = os.path.join(self.output_folder, "company2_output.csv")
+            compression = config.get("output_compression", "none")
+            company1_output_file = os.path.join(
+                self.output_folder, output_file_name("company1", compression)
+            )
+            company2_output_file = os.path.join(
+                self.output_folder, output_file_name("company2", compression)
+            )
+
+            # Each CSV is uploaded as soon as its branch is written, while
+            # the other branch may still be processing
+            uploader = output_uploader_from_config(
+                config,
+                self.output_folder,
+                self.company1_ftp_info,
+                self.company2_ftp_info,
+                upload_company1=self.upload_company1,
+                upload_company2=self.upload_company2,
+                progress=self.branch_status.emit,
+            )
+            output_branches = {
+                company1_output_file: "company1",
+                company2_output_file: "company2",
+            }
+            written = []
+
+            def write_csv(df, output_path):
+                branch = output_branches[output_path]
+                self.branch_status.emit(
+                    branch,
+                    _("{name}: processed, writing the CSV...").format(
+                        name=BRANCH_NAMES[branch]
+                    ),
+                )
+                if uploader is not None:
+                    uploader.write_csv(df, output_path)
+                else:
+                    from data_processing import csv_writer
+
+                    csv_writer.write_csv(df, output_path)
+                written.append(branch)
+                self.progress.emit(60 if len(written) == 1 else 85)
+
+            def file_written(output_path):
+                # Written a chunk at a time by the out-of-core processing
+                if uploader is not None:
+                    uploader.file_written(output_path)
+                written.append(output_branches[output_path])
+                self.progress.emit(60 if len(written) == 1 else 85)
+
+            for branch, name in BRANCH_NAMES.items():
+                self.branch_status.emit(
+                    branch, _("{name}: processing...").format(name=name)
+                )
 
             try:
+                # Waits for the warm-up thread if it is still importing
+                main_processing_function = importlib.import_module(
+                    DATA_PROCESSING_MODULE
+                ).main
+                from data_processing.delta_feed import format_delta_counts
+
                 # Run data processing
-                main_processing_function(
-                    self.articles_file,
-                    self.warehouse_file,
-                    self.tecdoc_file,
-                    company1_output_file,
-                    company2_output_file,
-                    self.brands_file,
-                    self.oem_folder,
-                    IGNORED_BRANDS,
-                    self.inputs,  # Pass the inputs here
-                )
+                with profile_run(
+                    profiling_mode,
+                    self.output_folder,
+                    get_profiling_interval(config),
+                ):
+                    if self.quantities_only:
+                        deltas = importlib.import_module(
+                            QUANTITY_REFRESH_MODULE
+                        ).refresh_quantities(
+                            self.articles_file,
+                            company1_output_file,
+                            company2_output_file,
+                            write_csv=write_csv,
+                            delta=config.get("delta_feed", False),
+                            cancel_token=self.cancel_token,
+                        )
+                    else:
+                        deltas = main_processing_function(
+                            self.articles_file,
+                            self.warehouse_file,
+                            self.tecdoc_file,
+                            company1_output_file,
+                            company2_output_file,
+                            self.brands_file,
+                            self.oem_folder,
+                            IGNORED_BRANDS,
+                            self.inputs,  # Pass the inputs here
+                            write_csv=write_csv,
+                            delta=config.get("delta_feed", False),
+                            incremental=config.get("incremental_processing", False),
+                            checkpoint=config.get("stage_checkpoints", False),
+                            cancel_token=self.cancel_token,
+                            max_component_size=max_component_size_from_config(
+                                config
+                            ),
+                            canonical_oe=config.get("canonical_oe_numbers", False),
+                            company1_workers=company1_workers_from_config(config),
+                            memory_budget_mb=memory_budget_from_config(config),
+                            file_written=file_written,
+                            backend=dataframe_backend_from_config(config),
+                            quantity_base=config.get("quantity_refresh", False),
+                        )
+            except ProcessingCancelled:
+                if uploader is not None:
+                    uploader.abort()
+                cancelled = True
+                return
             except Exception as e:
+                if uploader is not None:
+                    uploader.abort()
                 raise Exception(f"Data processing failed: {str(e)}")
 
+            self.processing_completed = True
             self.progress.emit(85)
+            for branch, counts in (deltas or {}).items():
+                self.branch_status.emit(
+                    branch,
+                    _("{name} delta: {counts}").format(
+                        name=BRANCH_NAMES[branch], counts=format_delta_counts(counts)
+                    ),
+                )
 
-            # Start FTP upload using UploadWorker
-            self.upload_files()
+            if uploader is None:
+                self.finished_processing.emit(
+                    "Processing completed successfully without uploads."
+                )
+                return
+            # Waits for the uploads still running
+            _success, messages = uploader.finish()
+            self.on_upload_finished("\n".join(messages))
 
         except Exception as e:
             self.error.emit(str(e))
+        finally:
+            self.cancel_token.close()
+            if cancelled:
+                # Frees the frames of the stopped run and its pandarallel
+                # pool, which the traceback held, before the next run
+                gc.collect()
+                self.cancelled.emit(_("Processing cancelled"))
 
     # In worker.py's Worker class
     def upload_files(self):
@@ -85,7 +258,10 @@ class Worker(QThread):
                 upload_company1=self.upload_company1,  # Pass the flag
                 upload_company2=self.upload_company2,  # Pass the flag
             )
-            upload_worker.progress.connect(lambda message: self.progress.emit(message))
+            # Status messages, e.g. the retries, not a progress value
+            upload_worker.progress.connect(
+                lambda message: self.branch_status.emit("upload", message)
+            )
             upload_worker.finished.connect(self.on_upload_finished)
             upload_worker.error.connect(self.error.emit)  # Ensure errors are propagated
             upload_worker.start()
@@ -1,7 +1,5 @@
 # workerFtp.py
 
-import os
-
 from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtWidgets import (
     QDialog,
@@ -12,7 +10,8 @@ from PyQt6.QtWidgets import (
     QVBoxLayout,
 )
 from translations import _
-from utility.ftp_utils import upload_to_ftp
+from utility.config import load_config
+from utility.ftp_utils import upload_options_from_config, upload_outputs
 
 
 class UploadDialog(QDialog):
@@ -148,31 +147,15 @@ class UploadWorker(QThread):
         self.upload_company2 = upload_company2
 
     def run(self):
-        messages = []
-
-        # Upload Tulero file if requested
-        if self.upload_company1:
-            company1_output_file = os.path.join(self.output_folder, "company1_output.csv")
-            self.progress.emit(_("Uploading Tulero file..."))
-            company1_success, company1_error = upload_to_ftp(
-                company1_output_file, self.company1_ftp_info
-            )
-            if company1_success:
-                messages.append(_("Tulero upload successful."))
-            else:
-                messages.append(_("Tulero upload failed: ") + company1_error)
-
-        # Upload Tyre24 file if requested
-        if self.upload_company2:
-            company2_output_file = os.path.join(self.output_folder, "company2_output.csv")
-            self.progress.emit(_("Uploading Tyre24 file..."))
-            company2_success, company2_error = upload_to_ftp(
-                company2_output_file, self.company2_ftp_info
-            )
-            if company2_success:
-                messages.append(_("Tyre24 upload successful."))
-            else:
-                messages.append(_("Tyre24 upload failed: ") + company2_error)
+        success, messages = upload_outputs(
+            self.output_folder,
+            self.company1_ftp_info,
+            self.company2_ftp_info,
+            upload_company1=self.upload_company1,
+            upload_company2=self.upload_company2,
+            progress=self.progress.emit,
+            **upload_options_from_config(load_config()),
+        )
 
         # Combine all messages and emit the result
         final_message = (